@@ -0,0 +1,255 @@
+"""
+Benchmark every stage of parsing history files, on synthetic fixtures of every file type.
+
+Every stage of every file is measured in a fresh process, so its peak RSS is not affected by the other stages.
+The results are printed as json, and can be compared against a baseline from an earlier run,
+from the root of the repository:
+
+    python -m benchmarks.bench --output baseline.json
+    python -m benchmarks.bench --baseline baseline.json
+"""
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+from xdrparser import parser
+from xdrparser.output import DecimalEncoder, write_jsonl
+
+from benchmarks.fixtures import FILE_TYPES, NETWORK_ID, generate_fixtures
+
+# Every stage only measures its own work, the inputs it needs are prepared before it is timed
+STAGES = ('gunzip', 'records', 'unpack', 'hash', 'hash_repack', 'todict', 'json', 'jsonl', 'parse')
+
+# The arguments that run a single stage in a child process
+RUN_STAGE_ARGUMENT = '--run-stage'
+
+# The source of the results of the generated files
+SYNTHETIC_SOURCE = 'synthetic'
+
+# Stages that only apply to some file types
+STAGE_FILE_TYPES = {'hash': ('transactions',), 'hash_repack': ('transactions',)}
+
+
+def run_stage(stage, file_name, repeat):
+    """Run a stage 'repeat' times in this process, and return the best time with the records and bytes it handled."""
+    file_type = parser.get_file_type(file_name)
+    records = [bytes(record) for record in parser.iter_file_records(file_name)]
+    inputs = prepare_stage(stage, file_name, file_type, records)
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        STAGE_METHODS[stage](file_name, file_type, records, inputs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {
+        'records': len(records),
+        'bytes': sum(len(record) for record in records),
+        'seconds': best,
+        'peak_rss': get_peak_rss(),
+    }
+
+
+def prepare_stage(stage, file_name, file_type, records):
+    """Return the inputs of a stage, which are the outputs of the stages before it."""
+    if stage == 'hash':
+        unpacker, unpacker_methods = parser.init_unpacker(b'')
+        unpacked = []
+        for record in records:
+            unpacker.reset(record)
+            unpacked.append((unpacker_methods[file_type](), record, list(unpacker.transaction_spans)))
+        return unpacked
+    if stage in ('hash_repack', 'todict', 'json', 'jsonl'):
+        unpacked = list(parser.iter_unpack_records(records, file_type))
+        if stage in ('json', 'jsonl'):
+            return [parser.parse_unpacked(unpacked_struct, index) for index, unpacked_struct in enumerate(unpacked)]
+        return unpacked
+    return None
+
+
+def stage_gunzip(file_name, file_type, records, inputs):
+    with parser.open_xdr_file(file_name) as xdr_file:
+        while xdr_file.read(io.DEFAULT_BUFFER_SIZE * 64):
+            pass
+
+
+def stage_records(file_name, file_type, records, inputs):
+    for _ in parser.iter_file_records(file_name):
+        pass
+
+
+def stage_unpack(file_name, file_type, records, inputs):
+    for _ in parser.iter_unpack_records(records, file_type):
+        pass
+
+
+def stage_hash(file_name, file_type, records, inputs):
+    network_hash = parser.get_network_hash(NETWORK_ID)
+    for unpacked, record, transaction_spans in inputs:
+        parser.hash_transactions(unpacked, record, transaction_spans, network_hash)
+
+
+def stage_hash_repack(file_name, file_type, records, inputs):
+    network_hash = parser.get_network_hash(NETWORK_ID)
+    for unpacked in inputs:
+        for transaction in unpacked.txSet.txs:
+            parser.calculate_hash(transaction.tx, network_hash)
+
+
+def stage_todict(file_name, file_type, records, inputs):
+    for index, unpacked in enumerate(inputs):
+        parser.parse_unpacked(unpacked, index)
+
+
+def stage_json(file_name, file_type, records, inputs):
+    # The same encoding as the command line tool
+    json.dumps(inputs, indent=2, cls=DecimalEncoder)
+
+
+def stage_jsonl(file_name, file_type, records, inputs):
+    with open(os.devnull, 'wb') as output:
+        write_jsonl(inputs, output)
+
+
+def stage_parse(file_name, file_type, records, inputs):
+    with_hash = file_type == 'transactions'
+    for _ in parser.iter_parse(file_name, with_hash=with_hash, network_id=NETWORK_ID):
+        pass
+
+
+STAGE_METHODS = {stage: globals()['stage_' + stage] for stage in STAGES}
+
+
+def get_peak_rss():
+    """Return the peak resident set size of this process in bytes, or None if it is not available."""
+    try:
+        import resource
+    except ImportError:  # pragma: no cover
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def measure(stage, file_name, repeat, source):
+    """Run a stage in a fresh process and return its measurements."""
+    output = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench', RUN_STAGE_ARGUMENT, stage,
+                                      str(repeat), file_name])
+    result = json.loads(output.decode())
+    result.update({
+        'source': source,
+        'file_type': parser.get_file_type(file_name),
+        'stage': stage,
+        'records_per_second': result['records'] / result['seconds'],
+        'mb_per_second': result['bytes'] / result['seconds'] / 10 ** 6,
+    })
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Return the results that are slower than their baseline by more than 'tolerance', with their ratio."""
+    baseline_results = {get_result_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        baseline_result = baseline_results.get(get_result_key(result))
+        if baseline_result is None:
+            continue
+        result['baseline_ratio'] = result['records_per_second'] / baseline_result['records_per_second']
+        if result['baseline_ratio'] < 1 - tolerance:
+            regressions.append(result)
+    return regressions
+
+
+def get_result_key(result):
+    return result['source'], result['file_type'], result['stage']
+
+
+def print_summary(results):
+    click.echo('{:<32}{:<14}{:<13}{:>10}{:>14}{:>10}{:>11}{:>10}'.format(
+        'source', 'file type', 'stage', 'records', 'records/s', 'MB/s', 'peak MB', 'vs base'), err=True)
+    for result in results:
+        click.echo('{:<32}{:<14}{:<13}{:>10}{:>14.0f}{:>10.1f}{:>11.1f}{:>10}'.format(
+            result['source'][:31], result['file_type'], result['stage'], result['records'],
+            result['records_per_second'],
+            result['mb_per_second'], (result['peak_rss'] or 0) / 2 ** 20,
+            '{:.2f}x'.format(result['baseline_ratio']) if 'baseline_ratio' in result else '-'), err=True)
+
+
+@click.command()
+@click.argument('xdr_files', nargs=-1)
+@click.option('--file-type', 'file_types', multiple=True, type=click.Choice(FILE_TYPES),
+              help='Only benchmark synthetic files of this type, can be used multiple times')
+@click.option('--stage', 'stages', multiple=True, type=click.Choice(STAGES),
+              help='Only benchmark this stage, can be used multiple times')
+@click.option('--txs-per-ledger', default=100, help='Transactions in every ledger of the synthetic files')
+@click.option('--ops-per-tx', default=1, help='Operations in every synthetic transaction')
+@click.option('--bucket-entries', default=10000, help='Entries in the synthetic bucket file')
+@click.option('--accounts', default=1000, help='Amount of different accounts in the synthetic files')
+@click.option('--uncompressed', is_flag=True, help='Write the synthetic files without gzip, they are memory mapped')
+@click.option('--repeat', default=3, help='Run every stage this many times and keep the best time')
+@click.option('--output', type=click.File('w'), default='-', help='Write the json results to this file')
+@click.option('--baseline', type=click.File('r'), default=None,
+              help='Compare the results to the json results of an earlier run')
+@click.option('--tolerance', default=0.1, help='Relative slowdown from the baseline that is a regression')
+def main(xdr_files, file_types, stages, txs_per_ledger, ops_per_tx, bucket_entries, accounts, uncompressed, repeat,
+         output, baseline, tolerance):
+    """
+    Benchmark every stage of parsing history files.
+
+    Synthetic files of every file type are generated, XDR_FILES are benchmarked as well.
+    Exits with an error if any stage is slower than the baseline,
+    the baseline should be from a run with the same fixture sizes.
+    """
+    stages = stages or STAGES
+    with tempfile.TemporaryDirectory() as fixtures_dir:
+        click.echo('Generating fixtures', err=True)
+        fixtures = generate_fixtures(fixtures_dir, file_types or FILE_TYPES, txs_per_ledger=txs_per_ledger,
+                                     ops_per_tx=ops_per_tx, bucket_entries=bucket_entries, accounts=accounts,
+                                     compress=not uncompressed)
+        # The source of a result tells the synthetic files apart from the given files, for the baseline
+        files = [(file_name, SYNTHETIC_SOURCE) for file_name in fixtures.values()]
+        files.extend((file_name, os.path.basename(file_name)) for file_name in xdr_files)
+
+        results = []
+        for file_name, source in files:
+            file_type = parser.get_file_type(file_name)
+            for stage in stages:
+                if file_type in STAGE_FILE_TYPES.get(stage, (file_type,)):
+                    results.append(measure(stage, file_name, repeat, source))
+
+    regressions = compare(results, json.load(baseline), tolerance) if baseline is not None else []
+    print_summary(results)
+    json.dump({
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'txs_per_ledger': txs_per_ledger,
+            'ops_per_tx': ops_per_tx,
+            'bucket_entries': bucket_entries,
+            'accounts': accounts,
+            'uncompressed': uncompressed,
+            'repeat': repeat,
+        },
+        'results': results,
+    }, output, indent=2)
+    output.write('\n')
+
+    if regressions:
+        click.echo('{} stages are slower than the baseline'.format(len(regressions)), err=True)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == [RUN_STAGE_ARGUMENT]:
+        stage_name, stage_repeat, stage_file_name = sys.argv[2:]
+        print(json.dumps(run_stage(stage_name, stage_file_name, int(stage_repeat))))
+    else:
+        main()
@@ -0,0 +1,211 @@
+"""
+Generate synthetic history files of every file type with the kin_base packer, for the benchmarks.
+
+The tests build their files with the same packers.
+"""
+import gzip
+import os
+import random
+import struct
+from hashlib import sha256
+from types import SimpleNamespace
+
+from kin_base.stellarxdr import Xdr
+from kin_base.stellarxdr import StellarXDR_const as const
+
+FILE_TYPES = ('bucket', 'ledger', 'transactions', 'results', 'scp')
+
+# The fixtures are the files of a single checkpoint, ledger files always have the 64 ledgers of a checkpoint
+CHECKPOINT = 0x0043733f
+LEDGERS_PER_CHECKPOINT = 64
+NETWORK_ID = 'Kin Mainnet ; December 2018'
+
+# The xdr representation of ENVELOPE_TYPE_TX, which is hashed before every transaction
+PACKED_ENVELOPE_TYPE = b'\x00\x00\x00\x02'
+
+EXT = SimpleNamespace(v=0)
+
+
+def generate_fixtures(output_dir, file_types=FILE_TYPES, txs_per_ledger=100, ops_per_tx=1, bucket_entries=10000,
+                      accounts=1000, validators=5, seed=0, compress=True):
+    """
+    Write a history file of every file type to 'output_dir', and return their names by file type.
+
+    Transactions are payments between a pool of 'accounts', signed by their source account,
+    and the results file has the results of the same transactions, matched by their hash.
+    The files are gzipped like in a history archive, unless 'compress' is False.
+    The same arguments always generate the same files.
+    """
+    rng = random.Random(seed)
+    account_pool = [random_bytes(rng, 32) for _ in range(accounts)]
+    network_hash = sha256(NETWORK_ID.encode()).digest()
+    ledger_seqs = range(CHECKPOINT - LEDGERS_PER_CHECKPOINT + 1, CHECKPOINT + 1)
+
+    files = {}
+    transaction_entries = [pack_transaction_entry(ledger_seq, txs_per_ledger, ops_per_tx, account_pool, rng)
+                           for ledger_seq in ledger_seqs]
+    for file_type in file_types:
+        if file_type == 'transactions':
+            records = [record for record, _ in transaction_entries]
+        elif file_type == 'results':
+            records = [pack_result_entry(ledger_seq, [(get_transaction_hash(transaction, network_hash), const.txSUCCESS,
+                                                       ops_per_tx) for transaction in transactions])
+                       for ledger_seq, (_, transactions) in zip(ledger_seqs, transaction_entries)]
+        elif file_type == 'ledger':
+            records = pack_ledger_entries(ledger_seqs[0], len(ledger_seqs))
+        elif file_type == 'scp':
+            records = [pack_scp_entry(ledger_seq, validators, rng) for ledger_seq in ledger_seqs]
+        elif file_type == 'bucket':
+            records = [pack_bucket_entry(account, rng) for account in
+                       (account_pool[index % accounts] for index in range(bucket_entries))]
+        else:
+            raise ValueError('Unknown file type: {}'.format(file_type))
+
+        files[file_type] = write_fixture(output_dir, file_type, records, compress)
+    return files
+
+
+def write_fixture(output_dir, file_type, records, compress=True):
+    """Write records to a history file, and return its name."""
+    if file_type == 'bucket':
+        base_name = 'bucket-{}.xdr'.format(sha256(frame_records(records)).hexdigest())
+    else:
+        base_name = '{}-{:08x}.xdr'.format(file_type, CHECKPOINT)
+
+    file_name = os.path.join(output_dir, base_name + '.gz' if compress else base_name)
+    write_xdr_file(file_name, records)
+    return file_name
+
+
+def random_bytes(rng, length):
+    return rng.getrandbits(length * 8).to_bytes(length, 'big')
+
+
+def public_key(account):
+    return SimpleNamespace(type=const.PUBLIC_KEY_TYPE_ED25519, ed25519=account)
+
+
+def pack_transaction_entry(ledger_seq, txs_per_ledger, ops_per_tx, account_pool, rng):
+    """Pack a TransactionHistoryEntry of payments, return it with its unpacked transactions."""
+    transactions = []
+    envelopes = []
+    for _ in range(txs_per_ledger):
+        source = rng.choice(account_pool)
+        operations = [SimpleNamespace(sourceAccount=[], body=SimpleNamespace(
+            type=const.PAYMENT, paymentOp=SimpleNamespace(
+                destination=public_key(rng.choice(account_pool)), asset=SimpleNamespace(type=const.ASSET_TYPE_NATIVE),
+                amount=rng.randrange(1, 10 ** 12))))
+            for _ in range(ops_per_tx)]
+        transaction = SimpleNamespace(
+            sourceAccount=public_key(source), fee=100 * ops_per_tx, seqNum=rng.getrandbits(48), timeBounds=[],
+            memo=SimpleNamespace(type=const.MEMO_TEXT, text='1-app-{}'.format(rng.randrange(10 ** 6)).encode()),
+            operations=operations, ext=EXT)
+        signatures = [SimpleNamespace(hint=source[-4:], signature=random_bytes(rng, 64))]
+        transactions.append(transaction)
+        envelopes.append(SimpleNamespace(tx=transaction, signatures=signatures))
+
+    packer = Xdr.StellarXDRPacker()
+    packer.pack_TransactionHistoryEntry(SimpleNamespace(
+        ledgerSeq=ledger_seq, txSet=SimpleNamespace(previousLedgerHash=bytes(32), txs=envelopes), ext=EXT))
+    return packer.get_buffer(), transactions
+
+
+def get_transaction_hash(transaction, network_hash):
+    """Return the hash of a transaction, by packing it again."""
+    packer = Xdr.StellarXDRPacker()
+    packer.pack_Transaction(transaction)
+    return sha256(network_hash + PACKED_ENVELOPE_TYPE + packer.get_buffer()).digest()
+
+
+def pack_scp_entry(ledger_seq, validators, rng):
+    """Pack an SCPHistoryEntry with an externalize message from every validator."""
+    nodes = [public_key(bytes([index]) * 32) for index in range(validators)]
+    value = random_bytes(rng, 80)
+    messages = [SimpleNamespace(statement=SimpleNamespace(
+        nodeID=node, slotIndex=ledger_seq, pledges=SimpleNamespace(
+            type=const.SCP_ST_EXTERNALIZE, externalize=SimpleNamespace(
+                commit=SimpleNamespace(counter=1, value=value), nH=1, commitQuorumSetHash=bytes(32)))),
+        signature=random_bytes(rng, 64)) for node in nodes]
+    quorum_set = SimpleNamespace(threshold=validators * 2 // 3 + 1, validators=nodes, innerSets=[])
+
+    packer = Xdr.StellarXDRPacker()
+    packer.pack_SCPHistoryEntry(SimpleNamespace(v=0, v0=SimpleNamespace(
+        quorumSets=[quorum_set], ledgerMessages=SimpleNamespace(ledgerSeq=ledger_seq, messages=messages))))
+    return packer.get_buffer()
+
+
+def pack_bucket_entry(account, rng):
+    """Pack a live BucketEntry of an account."""
+    account_entry = SimpleNamespace(
+        accountID=public_key(account), balance=rng.randrange(10 ** 12), seqNum=rng.getrandbits(48), numSubEntries=0,
+        inflationDest=[], flags=0, homeDomain=b'', thresholds=b'\x01\x00\x00\x00', signers=[], ext=EXT)
+
+    packer = Xdr.StellarXDRPacker()
+    packer.pack_BucketEntry(SimpleNamespace(type=const.LIVEENTRY, liveEntry=SimpleNamespace(
+        lastModifiedLedgerSeq=CHECKPOINT, data=SimpleNamespace(type=const.ACCOUNT, account=account_entry), ext=EXT)))
+    return packer.get_buffer()
+
+
+def pack_ledger_entry(ledger_seq, previous_hash=bytes(32), upgrades=()):
+    """Pack a LedgerHeaderHistoryEntry, its hash is the hash of its packed header."""
+    header = SimpleNamespace(
+        ledgerVersion=9, previousLedgerHash=previous_hash,
+        scpValue=SimpleNamespace(txSetHash=bytes(32), closeTime=1546300800 + ledger_seq * 5, upgrades=list(upgrades),
+                                 ext=EXT),
+        txSetResultHash=bytes(32), bucketListHash=bytes(32), ledgerSeq=ledger_seq, totalCoins=10 ** 18,
+        feePool=0, inflationSeq=0, idPool=0, baseFee=100, baseReserve=0, maxTxSetSize=500, skipList=[bytes(32)] * 4,
+        ext=EXT)
+
+    packer = Xdr.StellarXDRPacker()
+    packer.pack_LedgerHeader(header)
+    header_hash = sha256(packer.get_buffer()).digest()
+
+    packer = Xdr.StellarXDRPacker()
+    packer.pack_LedgerHeaderHistoryEntry(SimpleNamespace(hash=header_hash, header=header, ext=EXT))
+    return packer.get_buffer()
+
+
+def pack_ledger_entries(first_ledger_seq, count, previous_hash=bytes(32)):
+    """Pack a chain of ledger entries, where every header points to the hash of the previous one."""
+    records = []
+    for ledger_seq in range(first_ledger_seq, first_ledger_seq + count):
+        record = pack_ledger_entry(ledger_seq, previous_hash)
+        previous_hash = record[:32]
+        records.append(record)
+    return records
+
+
+def pack_result_entry(ledger_seq, results):
+    """
+    Pack a TransactionHistoryResultEntry.
+
+    'results' are (transaction hash, result code, operation count) tuples, the operations are successful payments.
+    """
+    packer = Xdr.StellarXDRPacker()
+    result_set = SimpleNamespace(results=[
+        SimpleNamespace(transactionHash=transaction_hash, result=SimpleNamespace(
+            feeCharged=100 * operations,
+            result=SimpleNamespace(code=code, results=[SimpleNamespace(code=0, tr=SimpleNamespace(
+                type=1, paymentResult=SimpleNamespace(code=0)))] * operations),
+            ext=EXT))
+        for transaction_hash, code, operations in results])
+    packer.pack_TransactionHistoryResultEntry(SimpleNamespace(ledgerSeq=ledger_seq, txResultSet=result_set,
+                                                              ext=EXT))
+    return packer.get_buffer()
+
+
+def frame_records(records, last_fragment=True):
+    """Prefix every record with its record mark, marking it as the last fragment unless 'last_fragment' is False."""
+    flag = 0x80000000 if last_fragment else 0
+    return b''.join(struct.pack('>I', flag | len(record)) + record for record in records)
+
+
+def write_xdr_file(file_name, records, last_fragment=True):
+    """Write records to an xdr file, prefixing each with its record mark, gzipped if the file name ends with .gz."""
+    data = frame_records(records, last_fragment)
+    if file_name.endswith('.gz'):
+        with gzip.open(file_name, 'wb') as xdr_file:
+            xdr_file.write(data)
+    else:
+        with open(file_name, 'wb') as xdr_file:
+            xdr_file.write(data)
@@ -23,9 +23,15 @@ setup(
         'Click==6.7',
         'kin-base==1.0.7'
     ],
+    extras_require={
+        'fast': ['orjson', 'isal'],
+        'columns': ['numpy'],
+        'parquet': ['numpy', 'pyarrow'],
+    },
     entry_points='''
         [console_scripts]
         xdrparser=xdrparser.cli:main
     ''',
+    # The asyncio API in xdrparser.aio requires python 3.7
     python_requires='>=3.4',
 )
@@ -0,0 +1,137 @@
+import asyncio
+import functools
+import gzip
+import http.server
+import os
+import sys
+import threading
+
+import pytest
+
+# The asyncio API requires python 3.7
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 7), reason='requires python 3.7')
+
+FILE_LOCATION = 'tests/transactions-0043733f.xdr.gz'
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+async def collect(entries, limit=None):
+    collected = []
+    async for entry in entries:
+        collected.append(entry)
+        if len(collected) == limit:
+            break
+    return collected
+
+
+class ChunkedHandler(http.server.SimpleHTTPRequestHandler):
+    """Serve files with a chunked transfer encoding, like a streaming archive mirror."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if not os.path.isfile(self.translate_path(self.path)):
+            self.send_error(404)
+            return
+        with open(self.translate_path(self.path), 'rb') as served_file:
+            data = served_file.read()
+        self.send_response(200)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for start in range(0, len(data), 1000):
+            chunk = data[start:start + 1000]
+            self.wfile.write('{:x}\r\n'.format(len(chunk)).encode() + chunk + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, *args):
+        pass
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(params=[QuietHandler, ChunkedHandler])
+def archive_url(request, tmpdir):
+    """Serve an archive with a transactions and results file over http."""
+    from benchmarks.fixtures import generate_fixtures
+    generate_fixtures(str(tmpdir), file_types=['transactions', 'results'], txs_per_ledger=2)
+    server = http.server.HTTPServer(('127.0.0.1', 0), functools.partial(request.param, directory=str(tmpdir)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1]), str(tmpdir)
+    server.shutdown()
+    server.server_close()
+
+
+def test_aparse_local(tmpdir):
+    from xdrparser.aio import aparse
+    from xdrparser.parser import parse
+    expected = parse(FILE_LOCATION, with_hash=True, network_id='test')
+    entries = run(collect(aparse([FILE_LOCATION, FILE_LOCATION], workers=2, with_hash=True, network_id='test',
+                                 chunk_size=1000)))
+    assert entries == [(FILE_LOCATION, record) for record in expected] * 2
+
+    # Stop in the middle of the second file
+    entries = run(collect(aparse([FILE_LOCATION, FILE_LOCATION], max_files=1), limit=70))
+    assert [record for _, record in entries] == (parse(FILE_LOCATION) * 2)[:70]
+
+
+def test_iter_sources_walk_in_thread(monkeypatch):
+    from xdrparser import aio, archive
+    walk_threads = []
+
+    def find_history_files(paths):
+        walk_threads.append(threading.current_thread())
+        return [FILE_LOCATION]
+
+    monkeypatch.setattr(archive, 'find_history_files', find_history_files)
+    sources = run(collect(aio.iter_sources(['tests/', ('ledger-0043733f.xdr', None)])))
+    assert [file_name for file_name, _ in sources] == [FILE_LOCATION, 'ledger-0043733f.xdr']
+    assert walk_threads and threading.main_thread() not in walk_threads
+
+
+def test_aparse_http(archive_url):
+    from xdrparser.aio import aparse
+    from xdrparser.errors import FetchError
+    from xdrparser.parser import parse
+    url, archive_dir = archive_url
+    file_names = ['transactions-0043733f.xdr.gz', 'results-0043733f.xdr.gz']
+    entries = run(collect(aparse(['{}/{}'.format(url, file_name) for file_name in file_names],
+                                 with_hash=True, network_id='test')))
+    transactions = parse('{}/{}'.format(archive_dir, file_names[0]), with_hash=True, network_id='test')
+    results = parse('{}/{}'.format(archive_dir, file_names[1]))
+    assert entries == [('{}/{}'.format(url, file_names[0]), record) for record in transactions] + \
+        [('{}/{}'.format(url, file_names[1]), record) for record in results]
+
+    with pytest.raises(FetchError, match='HTTP 404'):
+        run(collect(aparse(url + '/ledger-0043733f.xdr.gz')))
+
+
+def test_aparse_stream():
+    from xdrparser.aio import aparse
+    from xdrparser.parser import parse
+    with open(FILE_LOCATION, 'rb') as xdr_file:
+        data = xdr_file.read()
+
+    async def stream(data):
+        for start in range(0, len(data), 777):
+            await asyncio.sleep(0)
+            yield data[start:start + 777]
+
+    entries = run(collect(aparse(('transactions-0043733f.xdr.gz', stream(data)))))
+    assert [record for _, record in entries] == parse(FILE_LOCATION)
+
+    with pytest.raises(EOFError):
+        run(collect(aparse(('transactions-0043733f.xdr.gz', stream(data[:-100])))))
+    with pytest.raises(EOFError, match='Truncated record'):
+        run(collect(aparse(('transactions-0043733f.xdr', stream(gzip.decompress(data)[:-100])))))
@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+
+import pytest
+
+FILE_LOCATION = 'tests/transactions-0043733f.xdr.gz'
+
+
+@pytest.fixture
+def archive_dir(tmpdir):
+    """A small archive with a valid transactions file, an empty ledger file and an unrelated file."""
+    transactions_dir = tmpdir.mkdir('transactions').mkdir('00').mkdir('43').mkdir('73')
+    shutil.copy(FILE_LOCATION, str(transactions_dir.join('transactions-0043733f.xdr.gz')))
+    ledger_dir = tmpdir.mkdir('ledger').mkdir('00').mkdir('43').mkdir('73')
+    ledger_dir.join('ledger-0043733f.xdr').write_binary(b'')
+    tmpdir.join('.well-known').mkdir().join('stellar-history.json').write('{}')
+    return str(tmpdir)
+
+
+def test_is_history_file():
+    from xdrparser.archive import is_history_file
+    assert is_history_file('path/to/transactions-0043733f.xdr.gz')
+    assert is_history_file('path\\to\\ledger-0043733f.xdr')
+    assert is_history_file('bucket-' + 'a' * 64 + '.xdr.gz')
+    assert not is_history_file('transactions-0043733f.xdr.gz.idx')
+    assert not is_history_file('stellar-history.json')
+
+
+def test_find_history_files(archive_dir):
+    from xdrparser.archive import find_history_files
+    expected = [os.path.join(archive_dir, 'ledger', '00', '43', '73', 'ledger-0043733f.xdr'),
+                os.path.join(archive_dir, 'transactions', '00', '43', '73', 'transactions-0043733f.xdr.gz')]
+    assert find_history_files([archive_dir]) == expected
+    assert find_history_files([os.path.join(archive_dir, '**', '*.xdr*')]) == expected
+    assert find_history_files(['some-file']) == ['some-file']
+
+
+def test_parse_files(archive_dir):
+    from xdrparser.archive import find_history_files, parse_files
+    from xdrparser.parser import parse
+
+    results = list(parse_files(find_history_files([archive_dir]) + ['not-a-history-file'], workers=2,
+                               with_hash=True, network_id='test'))
+    assert [result.error is None for result in results] == [False, True, False]
+    assert 'RecordCountError' in results[0].error
+    assert results[1].data == parse(FILE_LOCATION, with_hash=True, network_id='test')
+    assert results[1].records == 64
+    assert 'Invalid history archive file name' in results[2].error
+
+
+def test_parse_files_output_dir(archive_dir, tmpdir):
+    from xdrparser.archive import parse_files
+    from xdrparser.parser import parse
+
+    output_dir = str(tmpdir.mkdir('output'))
+    results = list(parse_files([FILE_LOCATION], output_dir=output_dir))
+    assert results[0].data is None
+    assert results[0].records == 64
+
+    with open(os.path.join(output_dir, 'transactions-0043733f.xdr.json')) as f:
+        assert len(json.load(f)) == len(parse(FILE_LOCATION))
+
+
+def test_cli_batch(archive_dir):
+    from click.testing import CliRunner
+    from xdrparser.cli import main
+
+    result = CliRunner().invoke(main, [archive_dir, '--workers', '2'])
+    assert result.exit_code == 1
+    lines = result.output.splitlines()
+    parsed = [json.loads(line) for line in lines if line.startswith('{')]
+    assert len(parsed) == 1
+    assert parsed[0]['file'].endswith('transactions-0043733f.xdr.gz')
+    assert len(parsed[0]['data']) == 64
+    assert 'Parsed 1 files, 1 failed' in result.output
+
+
+def test_cli_invalid_workers(archive_dir):
+    from click.testing import CliRunner
+    from xdrparser.cli import main
+
+    for args in ([archive_dir], [archive_dir, '--verify'], [FILE_LOCATION]):
+        result = CliRunner().invoke(main, args + ['--workers', '0'])
+        assert result.exit_code == 2
+        assert 'Invalid value for "--workers"' in result.output
+
+
+def test_cli_invalid_select():
+    from click.testing import CliRunner
+    from xdrparser.cli import main
+
+    for select in ['', 'txSet..txs']:
+        result = CliRunner().invoke(main, [FILE_LOCATION, '--select', select])
+        assert result.exit_code == 1
+        assert result.output == "Invalid --select: Field pattern '{}' has an empty key\n".format(select)
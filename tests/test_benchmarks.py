@@ -0,0 +1,38 @@
+from benchmarks.fixtures import FILE_TYPES, NETWORK_ID, generate_fixtures
+
+
+def test_generate_fixtures(tmpdir):
+    from xdrparser import parser, join
+    files = generate_fixtures(str(tmpdir), txs_per_ledger=3, ops_per_tx=2, bucket_entries=10, accounts=5)
+    assert sorted(files) == sorted(FILE_TYPES)
+    for file_type, file_name in files.items():
+        assert parser.get_file_type(file_name) == file_type
+        assert len(parser.parse(file_name)) == (10 if file_type == 'bucket' else 64)
+
+    # The results are of the same transactions
+    joined = join.parse_joined(files['transactions'], files['results'], NETWORK_ID)
+    assert all(transaction['result']['result']['code'] == 'txSUCCESS'
+               for entry in joined for transaction in entry['txSet']['txs'])
+
+
+def test_run_stage(tmpdir):
+    from benchmarks.bench import STAGES, STAGE_FILE_TYPES, run_stage
+    files = generate_fixtures(str(tmpdir), file_types=['transactions'], txs_per_ledger=2)
+    for stage in STAGES:
+        result = run_stage(stage, files['transactions'], 1)
+        assert result['records'] == 64
+        assert result['seconds'] > 0
+    assert 'transactions' in STAGE_FILE_TYPES['hash']
+
+
+def test_compare():
+    from benchmarks.bench import compare
+    baseline = {'results': [{'source': 'synthetic', 'file_type': 'ledger', 'stage': 'parse', 'records_per_second': 100},
+                            {'source': 'synthetic', 'file_type': 'scp', 'stage': 'parse', 'records_per_second': 100}]}
+    results = [{'source': 'synthetic', 'file_type': 'ledger', 'stage': 'parse', 'records_per_second': 95},
+               {'source': 'synthetic', 'file_type': 'scp', 'stage': 'parse', 'records_per_second': 80},
+               {'source': 'synthetic', 'file_type': 'bucket', 'stage': 'parse', 'records_per_second': 1}]
+    regressions = compare(results, baseline, 0.1)
+    assert [result['file_type'] for result in regressions] == ['scp']
+    assert results[0]['baseline_ratio'] == 0.95
+    assert 'baseline_ratio' not in results[2]
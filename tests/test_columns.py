@@ -0,0 +1,98 @@
+import subprocess
+import sys
+
+import numpy
+import pytest
+
+from benchmarks.fixtures import pack_result_entry, write_xdr_file
+
+FILE_LOCATION = 'tests/transactions-0043733f.xdr.gz'
+NETWORK_ID = 'Kin Mainnet ; December 2018'
+
+
+@pytest.fixture
+def results_file(tmpdir):
+    file_name = str(tmpdir.join('results-0000007f.xdr'))
+    write_xdr_file(file_name, [pack_result_entry(100, [(b'\x01' * 32, 0, 2), (b'\x02' * 32, -1, 1)]),
+                               pack_result_entry(101, [(b'\x03' * 32, -5, 0)])])
+    return file_name
+
+
+def test_iter_batches_operations():
+    from xdrparser import parser
+    from xdrparser.columns import iter_batches, OPERATION_COLUMNS
+    batches = list(iter_batches(FILE_LOCATION, batch_size=1000, network_id=NETWORK_ID))
+    assert [len(batch['ledger_seq']) for batch in batches] == [1000, 1000, 1000, 101]
+    assert {name: batches[0][name].dtype.str for name, _ in OPERATION_COLUMNS} == \
+        {name: numpy.dtype(dtype).str for name, dtype in OPERATION_COLUMNS}
+
+    # Compare the first transaction with the parsed file
+    entry = parser.parse(FILE_LOCATION, with_hash=True, network_id=NETWORK_ID)[0]
+    transaction = entry['txSet']['txs'][0]
+    operation = transaction['tx']['operations'][0]
+    batch = batches[0]
+    assert batch['ledger_seq'][0] == entry['ledgerSeq']
+    assert batch['source_account'][0].decode() == operation['sourceAccount'][0]['ed25519']
+    assert batch['destination'][0].decode() == operation['body']['createAccountOp']['destination']['ed25519']
+    assert batch['amount'][0] == operation['body']['createAccountOp']['startingBalance'] * 10 ** 5
+    assert batch['fee'][0] == transaction['tx']['fee']
+    assert batch['tx_hash'][0].decode() == transaction['hash']
+    assert 'tx_hash' not in next(iter_batches(FILE_LOCATION))
+
+
+def test_iter_batches_results(results_file):
+    from xdrparser.columns import iter_batches
+    batch, = iter_batches(results_file)
+    assert batch['ledger_seq'].tolist() == [100, 100, 101]
+    assert batch['tx_index'].tolist() == [0, 1, 0]
+    assert batch['tx_hash'].tolist() == [b'01' * 32, b'02' * 32, b'03' * 32]
+    assert batch['fee_charged'].tolist() == [200, 100, 0]
+    assert batch['result_code'].tolist() == [0, -1, -5]
+    assert batch['op_count'].tolist() == [2, 1, 0]
+
+
+def test_iter_batches_unsupported():
+    from xdrparser.columns import iter_batches
+    with pytest.raises(ValueError):
+        next(iter_batches('ledger-0043733f.xdr'))
+
+
+def test_write_npz(results_file, tmpdir):
+    from xdrparser.columns import export
+    output_file_name = str(tmpdir.join('results.npz'))
+    assert export(results_file, output_file_name, 'npz', batch_size=2) == 3
+    with numpy.load(output_file_name) as arrays:
+        assert arrays['result_code'].tolist() == [0, -1, -5]
+
+
+def test_write_parquet(tmpdir):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    from xdrparser.columns import export
+    output_file_name = str(tmpdir.join('transactions.parquet'))
+    assert export(FILE_LOCATION, output_file_name, 'parquet', batch_size=1000) == 3101
+    assert parquet.ParquetFile(output_file_name).num_row_groups == 4
+    table = parquet.read_table(output_file_name)
+    assert table.column('source_account')[0].as_py() == 'GDNJRI53DAO63JXQE2COPUDE3B3B6V5GGIIGE5QE4VZQZ5S2EHXHMZ6E'
+
+
+def test_cli_npz(tmpdir):
+    from click.testing import CliRunner
+    from xdrparser.cli import main
+    assert CliRunner().invoke(main, [FILE_LOCATION, '--format', 'npz']).exit_code == 1
+
+    output_dir = str(tmpdir.join('output'))
+    result = CliRunner().invoke(main, [FILE_LOCATION, '--format', 'npz', '--output-dir', output_dir])
+    assert result.exit_code == 0
+    with numpy.load(str(tmpdir.join('output', 'transactions-0043733f.xdr.npz'))) as arrays:
+        assert len(arrays['op_type']) == 3101
+
+    result = CliRunner().invoke(main, [FILE_LOCATION, '--format', 'npz', '--output-dir', output_dir,
+                                       '--select', 'ledgerSeq', '--amount-format', 'string'])
+    assert result.exit_code == 1
+    assert result.output == 'Cannot use --amount-format, --select with --format npz.\n'
+
+
+def test_columns_imported_lazily():
+    # numpy is an optional dependency, the columns module is only imported to export columns
+    code = 'import sys, xdrparser.cli, xdrparser.archive; assert "xdrparser.columns" not in sys.modules'
+    subprocess.check_call([sys.executable, '-c', code])
@@ -0,0 +1,74 @@
+import gzip
+import io
+import threading
+import zlib
+
+import pytest
+
+FILE_LOCATION = 'tests/transactions-0043733f.xdr.gz'
+
+
+@pytest.fixture(scope='module')
+def data():
+    with gzip.open(FILE_LOCATION) as xdr_file:
+        return xdr_file.read()
+
+
+def test_open_pipelined(data):
+    from xdrparser.decompress import open_pipelined
+    with open_pipelined(FILE_LOCATION) as xdr_file:
+        assert xdr_file.read(4) == data[:4]
+        assert xdr_file.read() == data[4:]
+        assert xdr_file.read(4) == b''
+
+
+def test_pipelined_small_chunks():
+    from xdrparser.decompress import PipelinedGzipReader
+    from xdrparser.parser import iter_records, open_xdr_file
+    raw_file = PipelinedGzipReader(FILE_LOCATION, chunk_size=1000, max_chunks=2, zlib_module=zlib)
+    with io.BufferedReader(raw_file) as xdr_file:
+        records = list(iter_records(xdr_file))
+    with open_xdr_file(FILE_LOCATION) as xdr_file:
+        assert records == list(iter_records(xdr_file))
+
+
+def test_pipelined_members(tmpdir, data):
+    from xdrparser.decompress import open_pipelined
+    file_name = str(tmpdir.join('transactions-0043733f.xdr.gz'))
+    tmpdir.join('transactions-0043733f.xdr.gz').write_binary(gzip.compress(data[:1000]) + gzip.compress(data[1000:]))
+    with open_pipelined(file_name) as xdr_file:
+        assert xdr_file.read() == data
+
+
+def test_pipelined_truncated(tmpdir, data):
+    from xdrparser.decompress import open_pipelined
+    file_name = str(tmpdir.join('transactions-0043733f.xdr.gz'))
+    tmpdir.join('transactions-0043733f.xdr.gz').write_binary(gzip.compress(data)[:-100])
+    with open_pipelined(file_name) as xdr_file:
+        with pytest.raises(EOFError):
+            xdr_file.read()
+
+    tmpdir.join('transactions-0043733f.xdr.gz').write_binary(b'not gzipped')
+    with open_pipelined(file_name) as xdr_file:
+        with pytest.raises(zlib.error):
+            xdr_file.read()
+
+
+def test_pipelined_close_early():
+    from xdrparser.decompress import PipelinedGzipReader
+    xdr_file = PipelinedGzipReader(FILE_LOCATION, chunk_size=100, max_chunks=1)
+    assert xdr_file.read(10)
+    xdr_file.close()
+    assert not xdr_file._thread.is_alive()
+    assert threading.active_count() == 1
+
+
+def test_iter_file_records_pipelined():
+    from xdrparser.parser import iter_file_records, iter_records, open_xdr_file
+    with open_xdr_file(FILE_LOCATION) as xdr_file:
+        assert list(iter_file_records(FILE_LOCATION)) == list(iter_records(xdr_file))
+
+    records = iter_file_records(FILE_LOCATION)
+    next(records)
+    records.close()
+    assert threading.active_count() == 1
@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fixtures import pack_ledger_entry
+
+FILE_LOCATION = 'tests/transactions-0043733f.xdr.gz'
+SOURCE_ACCOUNT = 'GAHLJSE6EQYQ3XE6UAUGWSB77JZNK7KBU4SIIIW4NY2GA2V5MMEV4LRB'
+
+
+def test_get_ledger_seq():
+    from xdrparser.filters import get_ledger_seq
+    from xdrparser.parser import iter_file_records
+    assert get_ledger_seq(next(iter_file_records(FILE_LOCATION)), 'transactions') == 0x437300
+    assert get_ledger_seq(pack_ledger_entry(77), 'ledger') == 77
+    assert get_ledger_seq(pack_ledger_entry(78, upgrades=[b'\x01' * 5, b'\x02' * 8]), 'ledger') == 78
+    assert get_ledger_seq(b'', 'scp') is None
+
+
+def test_get_op_type():
+    from xdrparser.filters import get_op_type
+    assert get_op_type('PAYMENT') == 1
+    assert get_op_type('change_trust') == 6
+    assert get_op_type('1') == 1
+    assert get_op_type(8) == 8
+    with pytest.raises(AttributeError):
+        get_op_type('NOT_AN_OPERATION')
+
+
+def test_filter_ledger_range():
+    from xdrparser.filters import RecordFilter
+    from xdrparser.parser import parse
+    parsed = parse(FILE_LOCATION, record_filter=RecordFilter(ledger_from=0x437310, ledger_to=0x437312))
+    assert [entry['ledgerSeq'] for entry in parsed] == [0x437310, 0x437311, 0x437312]
+
+
+def test_filter_account():
+    from xdrparser.filters import RecordFilter
+    from xdrparser.parser import parse
+    parsed = parse(FILE_LOCATION, with_hash=True, network_id='test',
+                   record_filter=RecordFilter(accounts=[SOURCE_ACCOUNT]))
+    assert len(parsed) == 1
+    assert [tx['tx']['sourceAccount']['ed25519'] for tx in parsed[0]['txSet']['txs']] == [SOURCE_ACCOUNT]
+
+    # The hash is calculated before the other transactions are dropped
+    full = parse(FILE_LOCATION, with_hash=True, network_id='test')
+    assert parsed[0]['txSet']['txs'][0] == full[0]['txSet']['txs'][0]
+
+
+def test_filter_op_type():
+    from xdrparser.filters import RecordFilter
+    from xdrparser.parser import parse
+    parsed = parse(FILE_LOCATION, record_filter=RecordFilter(op_types=['PAYMENT']))
+    transactions = [tx for entry in parsed for tx in entry['txSet']['txs']]
+    assert len(transactions) == 551
+    assert all(any(op['body']['type'] == 1 for op in tx['tx']['operations']) for tx in transactions)
+
+
+def test_filter_parallel():
+    from xdrparser.filters import RecordFilter
+    from xdrparser.parser import parse
+    record_filter = RecordFilter(op_types=['PAYMENT'], ledger_to=0x437320)
+    expected = parse(FILE_LOCATION, record_filter=record_filter)
+    assert parse(FILE_LOCATION, workers=2, record_filter=record_filter) == expected
+
+
+def _result_entry(*codes):
+    """Create an unpacked TransactionHistoryResultEntry with results of the given codes and payment operations."""
+    results = [SimpleNamespace(transactionHash=bytes(32), result=SimpleNamespace(
+        feeCharged=100, result=SimpleNamespace(code=code, results=[SimpleNamespace(
+            code=0, tr=SimpleNamespace(type=1, paymentResult=SimpleNamespace(code=0)))])))
+        for code in codes]
+    return SimpleNamespace(ledgerSeq=10, txResultSet=SimpleNamespace(results=results), ext=SimpleNamespace(v=0))
+
+
+def test_filter_failed_only():
+    from xdrparser.filters import RecordFilter
+    record_filter = RecordFilter(failed_only=True)
+
+    entry = record_filter.filter_unpacked(_result_entry(0, -1, 0, -5), b'', [])
+    assert [result.result.result.code for result in entry.txResultSet.results] == [-1, -5]
+    assert record_filter.filter_unpacked(_result_entry(0, 0), b'', []) is None
+
+
+def test_filter_results_op_type():
+    from xdrparser.filters import RecordFilter
+    assert RecordFilter(op_types=['PAYMENT']).filter_unpacked(_result_entry(0), b'', []) is not None
+    assert RecordFilter(op_types=['CREATE_ACCOUNT']).filter_unpacked(_result_entry(0), b'', []) is None
@@ -0,0 +1,94 @@
+import os
+import shutil
+
+import pytest
+
+FILE_LOCATION = 'tests/transactions-0043733f.xdr.gz'
+
+
+@pytest.fixture
+def xdr_file(tmpdir):
+    file_name = str(tmpdir.join('transactions-0043733f.xdr.gz'))
+    shutil.copy(FILE_LOCATION, file_name)
+    return file_name
+
+
+@pytest.fixture
+def uncompressed_file(tmpdir):
+    import gzip
+    file_name = str(tmpdir.join('transactions-0043733f.xdr'))
+    with gzip.open(FILE_LOCATION) as source, open(file_name, 'wb') as target:
+        shutil.copyfileobj(source, target)
+    return file_name
+
+
+def test_build_index():
+    from xdrparser.index import build_index
+    index = build_index(FILE_LOCATION)
+    assert len(index) == 64
+    assert index[0] == (4, 0x1c5c)
+    assert index[1] == (4 + 0x1c5c + 4, 0x2c2c)
+    assert index[-1][0] + index[-1][1] == 728860
+
+
+def test_save_and_load_index(xdr_file):
+    from xdrparser.index import build_index, save_index, load_index, get_index_file_name
+    assert load_index(xdr_file) is None
+
+    index = build_index(xdr_file)
+    save_index(xdr_file, index)
+    assert os.path.exists(get_index_file_name(xdr_file))
+    assert load_index(xdr_file) == index
+
+
+def test_load_stale_index(xdr_file):
+    from xdrparser.index import build_index, save_index, load_index
+    save_index(xdr_file, build_index(xdr_file))
+
+    # Changing the xdr file should invalidate the sidecar
+    with open(xdr_file, 'ab') as f:
+        f.write(b'\x00')
+    assert load_index(xdr_file) is None
+
+
+def test_get_index_with_sidecar(xdr_file):
+    from xdrparser.index import get_index, load_index
+    index = get_index(xdr_file, use_sidecar=True)
+    assert load_index(xdr_file) == index
+    assert get_index(xdr_file, use_sidecar=True) == index
+
+
+def test_select_records():
+    from xdrparser.index import select_records
+    index = [(4, 10)] * 5
+    assert list(select_records(index, 2)) == [2]
+    assert list(select_records(index, -1)) == [4]
+    assert list(select_records(index, 1, 3)) == [1, 2]
+    with pytest.raises(IndexError):
+        select_records(index, 5)
+
+
+def test_unpack_records():
+    from xdrparser.index import unpack_records
+    unpacked = unpack_records(FILE_LOCATION, 10, 12)
+    assert [entry.ledgerSeq for entry in unpacked] == [0x43730a, 0x43730b]
+
+
+def test_parse_records():
+    from xdrparser.parser import parse
+    from xdrparser.index import parse_records
+    parsed = parse(FILE_LOCATION, with_hash=True, network_id='test')
+    assert parse_records(FILE_LOCATION, 5, with_hash=True, network_id='test') == parsed[5:6]
+    assert parse_records(FILE_LOCATION, 60, 64, with_hash=True, network_id='test') == parsed[60:]
+
+
+def test_uncompressed_file(uncompressed_file):
+    from xdrparser.index import build_index, read_records, parse_records
+    index = build_index(uncompressed_file)
+    assert index == build_index(FILE_LOCATION)
+
+    # The records are read from the mapped file without copying them
+    record, = read_records(uncompressed_file, range(10, 11), index)
+    assert isinstance(record, memoryview)
+    assert bytes(record) == next(read_records(FILE_LOCATION, range(10, 11), index))
+    assert parse_records(uncompressed_file, 10, 20, index) == parse_records(FILE_LOCATION, 10, 20)
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from benchmarks.fixtures import pack_result_entry, write_xdr_file
+
+FILE_LOCATION = 'tests/transactions-0043733f.xdr.gz'
+NETWORK_ID = 'Kin Mainnet ; December 2018'
+
+
+@pytest.fixture
+def results_file(tmpdir):
+    """The results of the transactions file, in reverse order, without the results of its second ledger."""
+    from xdrparser import parser
+    records = []
+    for position, entry in enumerate(parser.iter_unpack(FILE_LOCATION, parser.get_network_hash(NETWORK_ID))):
+        if position != 1:
+            records.append(pack_result_entry(entry.ledgerSeq, [(envelope.hash, 0, len(envelope.tx.operations))
+                                                               for envelope in reversed(entry.txSet.txs)]))
+    file_name = str(tmpdir.join('results-0043733f.xdr'))
+    write_xdr_file(file_name, records)
+    return file_name
+
+
+def test_parse_joined(results_file):
+    from xdrparser import parser
+    from xdrparser.join import parse_joined
+    joined = parse_joined(FILE_LOCATION, results_file, NETWORK_ID)
+    parsed = parser.parse(FILE_LOCATION, with_hash=True, network_id=NETWORK_ID)
+    assert len(joined) == len(parsed) == 64
+
+    for position, (joined_entry, entry) in enumerate(zip(joined, parsed)):
+        for joined_transaction, transaction in zip(joined_entry['txSet']['txs'], entry['txSet']['txs']):
+            result = joined_transaction.pop('result')
+            if position == 1:
+                assert result is None
+            else:
+                assert result['result']['code'] == 'txSUCCESS'
+                assert len(result['result']['results']) == len(transaction['tx']['operations'])
+        assert joined_entry == entry
+
+
+def test_parse_joined_mismatch(results_file):
+    from xdrparser.join import parse_joined
+    with pytest.raises(ValueError):
+        parse_joined(FILE_LOCATION, FILE_LOCATION, NETWORK_ID)
+    with pytest.raises(ValueError):
+        parse_joined(FILE_LOCATION, results_file.replace('0043733f', '0043737f'), NETWORK_ID)
+
+
+def test_cli_joined(results_file):
+    from click.testing import CliRunner
+    from xdrparser.cli import main
+    result = CliRunner().invoke(main, [FILE_LOCATION, '--results', results_file, '--network-id', NETWORK_ID,
+                                       '--format', 'jsonl'])
+    assert result.exit_code == 0
+    lines = [json.loads(line) for line in result.output.splitlines()]
+    assert len(lines) == 64
+    assert lines[0]['txSet']['txs'][0]['result']['feeCharged'] > 0
+
+    result = CliRunner().invoke(main, [FILE_LOCATION, '--results', results_file])
+    assert result.exit_code == 1
+
+    # Options that do not apply to a joined file are rejected instead of being ignored
+    result = CliRunner().invoke(main, [FILE_LOCATION, '--results', results_file, '--network-id', NETWORK_ID,
+                                       '--select', 'ledgerSeq', '--ledger-from', '5', '--workers', '2'])
+    assert result.exit_code == 1
+    assert 'Cannot use --ledger-from, --select, --workers with --results.' in result.output
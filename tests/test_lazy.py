@@ -0,0 +1,102 @@
+import pytest
+
+from kin_base import memo, operation
+from kin_base.asset import Asset
+from kin_base.stellarxdr import Xdr
+
+FILE_LOCATION = 'tests/transactions-0043733f.xdr.gz'
+ACCOUNT = 'GAHLJSE6EQYQ3XE6UAUGWSB77JZNK7KBU4SIIIW4NY2GA2V5MMEV4LRB'
+ISSUER = 'GDF42M3IPERQCBLWFEZKQRK77JQ65SCKTU3CW36HZVCX7XX5A5QXZIVK'
+
+
+def test_iter_lazy_to_dict():
+    from xdrparser.lazy import iter_lazy
+    from xdrparser.parser import get_network_hash, parse
+    views = list(iter_lazy(FILE_LOCATION, get_network_hash('test')))
+    assert [view.to_dict() for view in views] == parse(FILE_LOCATION, with_hash=True, network_id='test')
+    views = list(iter_lazy(FILE_LOCATION))
+    assert [view.to_dict(amount_format='string') for view in views] == parse(FILE_LOCATION, amount_format='string')
+
+
+def test_lazy_fields():
+    from xdrparser.lazy import iter_lazy
+    from xdrparser.parser import get_network_hash, unpack_file, parse
+    unpacked = unpack_file(FILE_LOCATION)[5]
+    parsed = parse(FILE_LOCATION, with_hash=True, network_id='test')[5]
+    view = list(iter_lazy(FILE_LOCATION, get_network_hash('test')))[5]
+    assert view.ledgerSeq == unpacked.ledgerSeq
+    assert len(view.txSet.txs) == len(unpacked.txSet.txs)
+
+    # The last transaction is found before the ones before it are decoded
+    envelope = view.txSet.txs[-1]
+    assert envelope.tx.sourceAccount.ed25519 == unpacked.txSet.txs[-1].tx.sourceAccount.ed25519
+    assert envelope.hash.hex() == parsed['txSet']['txs'][-1]['hash']
+    assert envelope.tx.to_dict() == parsed['txSet']['txs'][-1]['tx']
+    assert envelope.to_dict() == parsed['txSet']['txs'][-1]
+    assert [envelope.tx.fee for envelope in view.txSet.txs[1:3]] == [tx.tx.fee for tx in unpacked.txSet.txs[1:3]]
+    assert len(view.txSet.txs[0].signatures) == len(unpacked.txSet.txs[0].signatures)
+    assert view.ext.v == 0
+    assert view.txSet.to_dict() == parsed['txSet']
+
+    with pytest.raises(AttributeError):
+        view.txSet.ledgerSeq
+    with pytest.raises(IndexError):
+        view.txSet.txs[len(unpacked.txSet.txs)]
+    with pytest.raises(AttributeError):
+        next(iter_lazy(FILE_LOCATION)).txSet.txs[0].hash
+
+
+def test_lazy_ledger_and_results(tmpdir):
+    from benchmarks.fixtures import generate_fixtures
+    from xdrparser.lazy import iter_lazy
+    from xdrparser.parser import parse, unpack_file
+    files = generate_fixtures(str(tmpdir), file_types=['ledger', 'results', 'scp'], txs_per_ledger=3)
+
+    views = list(iter_lazy(files['ledger']))
+    unpacked = unpack_file(files['ledger'])
+    assert [view.header.ledgerSeq for view in views] == [entry.header.ledgerSeq for entry in unpacked]
+    assert views[1].header.previousLedgerHash == views[0].hash
+    assert [view.to_dict() for view in views] == parse(files['ledger'])
+
+    views = list(iter_lazy(files['results']))
+    assert [result.transactionHash for result in views[-1].txResultSet.results] == \
+        [result.transactionHash for result in unpack_file(files['results'])[-1].txResultSet.results]
+    assert [view.to_dict() for view in views] == parse(files['results'])
+
+    with pytest.raises(ValueError):
+        iter_lazy(files['scp'])
+
+
+def test_skip_operations():
+    from xdrparser.lazy import skip_memo, skip_operations
+    usd = Asset('USD', ISSUER)
+    long_asset = Asset('LONGASSETAB', ISSUER)
+    operations = [
+        operation.CreateAccount(ACCOUNT, '10'),
+        operation.Payment(ACCOUNT, usd, '1.5', source=ISSUER),
+        operation.PathPayment(ACCOUNT, Asset.native(), '1', long_asset, '2', [usd, long_asset, Asset.native()]),
+        operation.ManageOffer(usd, long_asset, '3', '0.5', 7),
+        operation.CreatePassiveOffer(Asset.native(), usd, '1', '2'),
+        operation.SetOptions(inflation_dest=ACCOUNT, clear_flags=1, set_flags=2, master_weight=3, low_threshold=1,
+                             med_threshold=2, high_threshold=3, home_domain='example.com', signer_address=ISSUER,
+                             signer_type='ed25519PublicKey', signer_weight=1),
+        operation.SetOptions(),
+        operation.ChangeTrust(usd, '100'),
+        operation.AllowTrust(ACCOUNT, 'USD', True),
+        operation.AllowTrust(ACCOUNT, 'LONGASSETAB', False),
+        operation.AccountMerge(ACCOUNT),
+        operation.Inflation(),
+        operation.ManageData('key', b'value'),
+        operation.ManageData('deleted', None),
+        operation.BumpSequence(5),
+    ]
+    packer = Xdr.StellarXDRPacker()
+    packer.pack_array([op.to_xdr_object() for op in operations], packer.pack_Operation)
+    data = b'\x00' * 8 + packer.get_buffer()
+    assert skip_operations(data, 8) == len(data)
+
+    for memo_type in [memo.NoneMemo(), memo.TextMemo('text'), memo.IdMemo(5), memo.HashMemo(b'1' * 32),
+                      memo.RetHashMemo(b'2' * 32)]:
+        packer = Xdr.StellarXDRPacker()
+        packer.pack_Memo(memo_type.to_xdr_object())
+        assert skip_memo(packer.get_buffer(), 0) == len(packer.get_buffer())
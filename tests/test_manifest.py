@@ -0,0 +1,65 @@
+import os
+import shutil
+
+import pytest
+
+FILE_LOCATION = 'tests/transactions-0043733f.xdr.gz'
+
+
+@pytest.fixture
+def archive_dir(tmpdir):
+    """An archive with the transactions and results files of a checkpoint."""
+    from benchmarks.fixtures import generate_fixtures
+    archive_dir = tmpdir.mkdir('archive')
+    generate_fixtures(str(archive_dir), file_types=['results', 'transactions'], txs_per_ledger=2)
+    return str(archive_dir)
+
+
+def test_get_ledger_order():
+    from xdrparser.archive import get_ledger_order
+    file_names = ['bucket-' + 'a' * 64 + '.xdr.gz', 'scp-0000007f.xdr.gz', 'results-0000003f.xdr.gz',
+                  'path/to/transactions-0000007f.xdr', 'ledger-0000007f.xdr.gz', 'transactions-0000003f.xdr.gz']
+    assert sorted(file_names, key=get_ledger_order) == [
+        'transactions-0000003f.xdr.gz', 'results-0000003f.xdr.gz', 'ledger-0000007f.xdr.gz',
+        'path/to/transactions-0000007f.xdr', 'scp-0000007f.xdr.gz', 'bucket-' + 'a' * 64 + '.xdr.gz']
+
+
+def test_iter_incremental(archive_dir, tmpdir):
+    from xdrparser.manifest import Manifest, iter_incremental
+    manifest_file = str(tmpdir.join('manifest.db'))
+    transactions_file = os.path.abspath(os.path.join(archive_dir, 'transactions-0043733f.xdr.gz'))
+    results_file = os.path.abspath(os.path.join(archive_dir, 'results-0043733f.xdr.gz'))
+
+    with Manifest(manifest_file) as manifest:
+        # Stop in the middle of the results file, only the transactions file is recorded
+        records = iter_incremental([archive_dir], manifest, with_hash=True, network_id='test')
+        file_names = [next(records)[0] for _ in range(65)]
+        records.close()
+        assert file_names == [transactions_file] * 64 + [results_file]
+        assert [state.file_name for state in manifest.iter_states()] == [transactions_file]
+        assert manifest.get(transactions_file).records == 64
+
+    with Manifest(manifest_file) as manifest:
+        assert [file_name for file_name, _ in iter_incremental([archive_dir], manifest)] == [results_file] * 64
+        assert list(iter_incremental([archive_dir], manifest)) == []
+
+        # Touching a file does not change it, changing its content does
+        os.utime(transactions_file, ns=(0, 0))
+        assert list(iter_incremental([archive_dir], manifest)) == []
+        assert manifest.get(transactions_file).mtime == 0
+        shutil.copy(FILE_LOCATION, transactions_file)
+        assert len(list(iter_incremental([archive_dir], manifest))) == 64
+
+
+def test_cli_manifest(archive_dir, tmpdir):
+    from click.testing import CliRunner
+    from xdrparser.cli import main
+    manifest_file = str(tmpdir.join('manifest.db'))
+    output_dir = str(tmpdir.join('output'))
+
+    result = CliRunner().invoke(main, [archive_dir, '--output-dir', output_dir, '--manifest', manifest_file])
+    assert result.exit_code == 0
+    assert 'Parsed 2 files, 0 failed' in result.output
+    result = CliRunner().invoke(main, [archive_dir, '--output-dir', output_dir, '--manifest', manifest_file])
+    assert result.exit_code == 0
+    assert 'Parsed 0 files, 0 failed' in result.output
@@ -0,0 +1,61 @@
+import io
+import json
+from decimal import Decimal
+
+import pytest
+
+FILE_LOCATION = 'tests/transactions-0043733f.xdr.gz'
+
+
+@pytest.mark.parametrize('accelerated', [True, False])
+def test_line_encoder(accelerated):
+    from xdrparser.output import get_line_encoder
+    encode_line = get_line_encoder(accelerated)
+    assert encode_line({'amount': Decimal('1.5'), 'memo': 'ü', 'ops': [1, None]}) == \
+        '{"amount":"1.5","memo":"ü","ops":[1,null]}\n'.encode()
+    with pytest.raises(TypeError):
+        encode_line({'value': object()})
+
+
+def test_line_encoders_match():
+    from xdrparser import parser
+    from xdrparser.output import get_line_encoder
+    data = parser.parse(FILE_LOCATION, with_hash=True, network_id='Kin Mainnet ; December 2018')
+    accelerated = get_line_encoder(True)
+    standard = get_line_encoder(False)
+    for record in data:
+        assert accelerated(record) == standard(record)
+
+
+def test_write_jsonl():
+    from xdrparser import parser
+    from xdrparser.output import write_jsonl, DecimalEncoder
+    output = io.BytesIO()
+    assert write_jsonl(parser.iter_parse(FILE_LOCATION), output) == 64
+    lines = output.getvalue().decode().splitlines()
+    expected = json.loads(json.dumps(parser.parse(FILE_LOCATION), cls=DecimalEncoder))
+    assert [json.loads(line) for line in lines] == expected
+
+
+def test_cli_jsonl(tmpdir):
+    from click.testing import CliRunner
+    from xdrparser import parser
+    from xdrparser.cli import main
+    from xdrparser.output import DecimalEncoder
+
+    result = CliRunner().invoke(main, [FILE_LOCATION, '--format', 'jsonl'])
+    assert result.exit_code == 0
+    assert len(result.output.splitlines()) == 64
+
+    # Amounts are exact strings by default, and Decimals when they are asked for
+    lines = [json.loads(line) for line in result.output.splitlines()]
+    assert lines == json.loads(json.dumps(parser.parse(FILE_LOCATION, amount_format='string')))
+    result = CliRunner().invoke(main, [FILE_LOCATION, '--format', 'jsonl', '--amount-format', 'decimal'])
+    lines = [json.loads(line) for line in result.output.splitlines()]
+    assert lines == json.loads(json.dumps(parser.parse(FILE_LOCATION), cls=DecimalEncoder))
+
+    output_dir = str(tmpdir.join('output'))
+    result = CliRunner().invoke(main, [FILE_LOCATION, '--format', 'jsonl', '--output-dir', output_dir])
+    assert result.exit_code == 0
+    with open(str(tmpdir.join('output', 'transactions-0043733f.xdr.jsonl'))) as output_file:
+        assert len(output_file.readlines()) == 64
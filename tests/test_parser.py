@@ -5,7 +5,7 @@ from decimal import Decimal
 FILE_LOCATION = 'tests/transactions-0043733f.xdr.gz'
 
 
-@pytest.fixture('session')
+@pytest.fixture(scope='session')
 def xdr_data():
     with open(FILE_LOCATION, 'rb') as f:
         data = f.read()
@@ -25,6 +25,198 @@ def test_unpack_file():
     unpacked = unpack_file(FILE_LOCATION)
     assert len(unpacked) == 64
 
+
+def test_get_file_type():
+    from xdrparser.parser import get_file_type
+    assert get_file_type('path/to/ledger-00abc53f.xdr') == 'ledger'
+    assert get_file_type('path\\to\\results-00abc53f.xdr.gz') == 'results'
+
+
+def test_iter_records():
+    from xdrparser.parser import iter_records, open_xdr_file
+    with open_xdr_file(FILE_LOCATION) as xdr_file:
+        records = list(iter_records(xdr_file))
+    assert len(records) == 64
+    assert sum(len(record) + 4 for record in records) == 728860
+
+
+def test_iter_file_records_mapped(tmpdir):
+    import gzip
+    from xdrparser.parser import iter_file_records
+    file_name = str(tmpdir.join('transactions-0043733f.xdr'))
+    with gzip.open(FILE_LOCATION) as xdr_file:
+        tmpdir.join('transactions-0043733f.xdr').write_binary(xdr_file.read())
+
+    records = list(iter_file_records(file_name))
+    assert all(isinstance(record, memoryview) for record in records)
+    assert [bytes(record) for record in records] == list(iter_file_records(FILE_LOCATION))
+
+    from xdrparser.filters import RecordFilter
+    from xdrparser.parser import parse
+    assert parse(file_name, with_hash=True, network_id='test') == \
+        parse(FILE_LOCATION, with_hash=True, network_id='test')
+    assert parse(file_name, workers=2) == parse(FILE_LOCATION)
+    record_filter = RecordFilter(accounts=['GAHLJSE6EQYQ3XE6UAUGWSB77JZNK7KBU4SIIIW4NY2GA2V5MMEV4LRB'])
+    filtered = parse(file_name, record_filter=record_filter)
+    assert len(filtered) == 1
+    assert filtered == parse(FILE_LOCATION, record_filter=record_filter)
+
+
+def test_iter_mapped_records():
+    from xdrparser.parser import iter_mapped_records
+    data = memoryview(b'\x80\x00\x00\x02ab\x80\x00\x00\x01c')
+    assert [bytes(record) for record in iter_mapped_records(data)] == [b'ab', b'c']
+    with pytest.raises(EOFError):
+        list(iter_mapped_records(data[:-1]))
+    with pytest.raises(EOFError):
+        list(iter_mapped_records(data[:2]))
+
+
+def test_map_empty_file(tmpdir):
+    from xdrparser.parser import map_xdr_file, iter_file_records
+    tmpdir.join('transactions-0043733f.xdr').write_binary(b'')
+    file_name = str(tmpdir.join('transactions-0043733f.xdr'))
+    assert map_xdr_file(file_name) is None
+    assert map_xdr_file(FILE_LOCATION) is None
+    assert list(iter_file_records(file_name)) == []
+
+
+def test_iter_records_truncated():
+    import io
+    from xdrparser.parser import iter_records
+    with pytest.raises(EOFError):
+        list(iter_records(io.BytesIO(b'\x80\x00\x00\x08\x00\x00')))
+
+
+def test_iter_records_strict():
+    import io
+    from xdrparser.parser import iter_records, iter_mapped_records
+    data = b'\x80\x00\x00\x04abcd\x00\x00\x00\x04abcd\x80\x00\x00\x02ab'
+    assert len(list(iter_records(io.BytesIO(data)))) == 3
+    assert list(iter_records(io.BytesIO(data[:8]), strict=True)) == [b'abcd']
+    with pytest.raises(ValueError, match='byte 8 is not of a last fragment'):
+        list(iter_records(io.BytesIO(data), strict=True))
+    with pytest.raises(ValueError, match='not a multiple of 4'):
+        list(iter_mapped_records(memoryview(data[16:]), strict=True))
+
+
+def test_iter_unpack():
+    from types import GeneratorType
+    from xdrparser.parser import iter_unpack
+    unpacked = iter_unpack(FILE_LOCATION)
+    assert isinstance(unpacked, GeneratorType)
+    assert next(unpacked).ledgerSeq == 0x437300
+
+
+def test_iter_parse():
+    from xdrparser.parser import iter_parse, parse
+    assert list(iter_parse(FILE_LOCATION, with_hash=True, network_id='test')) == \
+        parse(FILE_LOCATION, with_hash=True, network_id='test')
+
+
+def test_parse_parallel(monkeypatch):
+    from xdrparser import parser
+    expected = parser.parse(FILE_LOCATION, with_hash=True, network_id='test')
+
+    # Use small chunks so the file is split between the workers
+    monkeypatch.setattr(parser, 'PARALLEL_CHUNK_SIZE', 32 * 1024)
+    assert parser.parse(FILE_LOCATION, with_hash=True, network_id='test', workers=2) == expected
+
+
+def test_iter_record_chunks():
+    from xdrparser.parser import _iter_record_chunks
+    records = [b'a' * 4, b'b' * 8, b'c' * 4, b'd' * 4]
+    assert list(_iter_record_chunks(iter(records), 8)) == [([b'aaaa', b'bbbbbbbb'], 0), ([b'cccc', b'dddd'], 2)]
+
+
+def test_history_unpacker_transaction_spans():
+    from xdrparser.parser import init_unpacker, iter_file_records
+    record = next(iter_file_records(FILE_LOCATION))
+    unpacker, methods = init_unpacker(record)
+    entry = methods['transactions']()
+
+    assert len(unpacker.transaction_spans) == len(entry.txSet.txs)
+    start, end = unpacker.transaction_spans[0]
+    assert record[start:start + 4] == b'\x00\x00\x00\x00'  # PUBLIC_KEY_TYPE_ED25519 of the source account
+
+    unpacker.reset(record)
+    assert unpacker.transaction_spans == []
+
+
+def test_hash_transactions():
+    from xdrparser.parser import iter_unpack, calculate_hash, get_network_hash
+    network_hash = get_network_hash('test')
+    for entry in iter_unpack(FILE_LOCATION, network_hash):
+        for transaction in entry.txSet.txs:
+            assert transaction.hash == calculate_hash(transaction.tx, network_hash)
+
+
+def test_compile_fields():
+    from xdrparser.parser import compile_fields
+    assert compile_fields(['txSet.txs[].tx.fee', 'ledgerSeq']) == \
+        {'txSet': {'txs': {'[]': {'tx': {'fee': None}}}}, 'ledgerSeq': None}
+    # A fully selected key includes the more specific patterns
+    assert compile_fields(['txSet.txs[].tx.fee', 'txSet.txs']) == {'txSet': {'txs': None}}
+    assert compile_fields(['txSet', 'txSet.txs[].tx.fee']) == {'txSet': None}
+    for field in ['', 'txSet..txs', 'txSet.[].tx', 'txSet.txs.']:
+        with pytest.raises(ValueError, match='has an empty key'):
+            compile_fields([field])
+
+
+def test_is_selected():
+    from xdrparser.parser import compile_fields, is_selected, SIGNATURES_PATH
+    assert is_selected(None, SIGNATURES_PATH)
+    assert is_selected(compile_fields(['txSet.txs']), SIGNATURES_PATH)
+    assert is_selected(compile_fields(['txSet.txs[].*']), SIGNATURES_PATH)
+    assert is_selected(compile_fields(['txSet.txs.signatures']), SIGNATURES_PATH)
+    assert not is_selected(compile_fields(['txSet.txs[].tx']), SIGNATURES_PATH)
+
+
+def test_parse_fields():
+    from xdrparser.parser import parse
+    full = parse(FILE_LOCATION, with_hash=True, network_id='test')
+    selected = parse(FILE_LOCATION, with_hash=True, network_id='test',
+                     fields=['ledgerSeq', 'txSet.txs[].hash', 'txSet.txs[].tx.operations[].body.*.startingBalance'])
+
+    assert len(selected) == len(full)
+    for full_entry, selected_entry in zip(full, selected):
+        assert selected_entry['ledgerSeq'] == full_entry['ledgerSeq']
+        for full_tx, selected_tx in zip(full_entry['txSet']['txs'], selected_entry['txSet']['txs']):
+            assert set(selected_tx) == {'hash', 'tx'}
+            assert selected_tx['hash'] == full_tx['hash']
+            for full_op, selected_op in zip(full_tx['tx']['operations'], selected_tx['tx']['operations']):
+                if 'createAccountOp' in full_op['body']:
+                    assert selected_op == {'body': {'createAccountOp': {
+                        'startingBalance': full_op['body']['createAccountOp']['startingBalance']}}}
+                else:
+                    assert selected_op == {}
+
+
+def test_parse_fields_unmarked_list():
+    from xdrparser.parser import parse
+    marked = parse(FILE_LOCATION, fields=['txSet.txs[].signatures'])
+    assert parse(FILE_LOCATION, fields=['txSet.txs.signatures']) == marked
+    assert marked[0]['txSet']['txs'][0]['signatures'][0]['signature'] is not None
+
+
+def test_convert_selected_final_list_items():
+    from types import SimpleNamespace
+    from xdrparser.parser import Converter, compile_fields
+    header = SimpleNamespace(ledgerSeq=5, skipList=[bytes(32), bytes(32)])
+    converter = Converter()
+    assert converter.convert_selected(header, compile_fields(['skipList[].x'])) == {}
+    assert converter.convert_selected(header, compile_fields(['ledgerSeq', 'skipList[].x'])) == {'ledgerSeq': 5}
+    assert converter.convert_selected(header, compile_fields(['skipList'])) == \
+        {'skipList': converter.convert(header.skipList, '', 'skipList')}
+
+
+def test_parse_fields_skips_signatures():
+    from xdrparser.parser import iter_unpack, compile_fields
+    entry = next(iter_unpack(FILE_LOCATION, selection=compile_fields(['txSet.txs[].tx'])))
+    assert entry.txSet.txs[0].signatures == [None, None]
+    assert entry.ext.v == 0
+
+
 """
 The following is a code for creating the files for the next 2 tests
 
@@ -37,14 +229,14 @@ The following is a code for creating the files for the next 2 tests
 def test_parse():
     from xdrparser.parser import parse
     with open('tests/parsed_no_hash.output', 'rb') as f:
-        assert pickle.dumps(parse(FILE_LOCATION)) == f.read()
+        assert pickle.dumps(parse(FILE_LOCATION), protocol=3) == f.read()
 
 
 def test_parse_with_hash():
     from xdrparser.parser import parse
 
     with open('tests/parsed_with_hash.output', 'rb') as f:
-        assert pickle.dumps(parse(FILE_LOCATION, with_hash=True, network_id='test')) == f.read()
+        assert pickle.dumps(parse(FILE_LOCATION, with_hash=True, network_id='test'), protocol=3) == f.read()
 
 
 def test_todict():
@@ -87,6 +279,42 @@ def test_parse_value_int_payment_amount_default():
     assert parse_value(60000000, '.0.txSet.txs.8.tx.operations.0.body.paymentOp.amount') == Decimal(600)
 
 
+def test_parse_value_int_amount_string():
+    from xdrparser.parser import parse_value
+    path = '.0.txSet.txs.8.tx.operations.0.body.paymentOp.amount'
+    assert parse_value(60000000, path, amount_format='string') == '600.00000'
+    assert parse_value(12345678901, path, amount_format='string') == '123456.78901'
+    assert parse_value(-5, path, amount_format='string') == '-0.00005'
+    assert parse_value(2 ** 63 - 1, path, amount_format='string') == '92233720368547.75807'
+    assert parse_value(60000000, path, raw_amount=True, amount_format='string') == 60000000
+
+
+def test_format_amount_scale(monkeypatch):
+    from xdrparser import parser
+    # The decimal places follow the scale of the amounts, such as the 7 places of Stellar amounts
+    monkeypatch.setattr(parser, 'AMOUNT_SCALE', 10 ** 7)
+    monkeypatch.setattr(parser, 'AMOUNT_DIGITS', 7)
+    assert parser.format_amount(60000000) == '6.0000000'
+    assert parser.format_amount(-5) == '-0.0000005'
+
+
+def test_parse_amount_context():
+    import decimal
+    from xdrparser.parser import parse_amount
+    # Amounts are rounded without changing the global decimal context
+    assert parse_amount(12345678901) == Decimal('1.2346E+5')
+    assert decimal.getcontext().prec == 28
+
+
+def test_parse_amount_format():
+    from xdrparser import parser
+    data = parser.parse(FILE_LOCATION, amount_format='string')
+    body = data[0]['txSet']['txs'][0]['tx']['operations'][0]['body']
+    assert body['createAccountOp']['startingBalance'] == '200.00000'
+    with pytest.raises(ValueError):
+        parser.parse(FILE_LOCATION, amount_format='float')
+
+
 def test_parse_value_int_other():
     from xdrparser.parser import parse_value
     assert parse_value(1000000, '.0.ledgerSeq') == 1000000
@@ -124,6 +352,32 @@ def test_parse_value_bytes_signature():
     assert parse_value(signature, '.0.txSet.txs.0.signatures.0.signature') == expected_result
 
 
+def test_parse_value_result_codes():
+    from xdrparser.parser import parse_value
+    assert parse_value(0, '.0.txResultSet.results.0.result.result.code') == 'txSUCCESS'
+    assert parse_value(0, '.0.txResultSet.results.0.result.result.results.3.code') == 'opINNER'
+    assert parse_value(-1, '.0.txResultSet.results.0.result.result.results.3.tr.paymentResult.code') == \
+        'PAYMENT_MALFORMED'
+
+
+def test_parse_value_skip_list():
+    from xdrparser.parser import parse_value
+    assert parse_value(b'\x01\x02', '.0.header.skipList.2') == '0102'
+    assert parse_value(b'\x01\x02', '.0.header.other.2') == [1, 2]
+
+
+def test_converter_caches_parsers():
+    from xdrparser.parser import get_converter, parse_amount, LIST_ITEM
+    converter = get_converter(raw_amount=False)
+    assert converter is get_converter(raw_amount=False)
+    assert get_converter(raw_amount=True).convert(20000000, 'createAccountOp', 'startingBalance') == 20000000
+
+    assert converter.convert([b'\x01', b'\x02'], 'header', 'skipList') == ['01', '02']
+    assert converter.convert(20000000, 'createAccountOp', 'startingBalance') == parse_amount(20000000)
+    assert converter._int_parsers['createAccountOp', 'startingBalance'] is parse_amount
+    assert ('skipList', LIST_ITEM) in converter._bytes_parsers
+
+
 def test_parse_account():
     from xdrparser.parser import parse_account
     assert parse_account(b'\x0e\xb4\xc8\x9e$1\r\xdc\x9e\xa0(kH?\xfar\xd5}A\xa7$\x84"\xdcn4`j\xbdc\t^') == \
@@ -163,6 +417,31 @@ def test_parse_hint():
     assert parse_hint(b'\xbdc\t^') == 'G______________________________________________F5MME____'
 
 
+def test_account_cache():
+    from xdrparser import parser
+    account = b'\x0e\xb4\xc8\x9e$1\r\xdc\x9e\xa0(kH?\xfar\xd5}A\xa7$\x84"\xdcn4`j\xbdc\t^'
+    parser.configure_cache(2)
+    try:
+        assert parser.parse_account(account) == parser.parse_account(bytearray(account))
+        assert parser.parse_hint(b'\xbdc\t^') == parser.parse_hint(b'\xbdc\t^')
+
+        stats = parser.get_cache_stats()
+        assert stats['account'] == {'hits': 1, 'misses': 1, 'maxsize': 2, 'currsize': 1}
+        assert stats['hint'] == {'hits': 1, 'misses': 1, 'maxsize': 2, 'currsize': 1}
+    finally:
+        parser.configure_cache()
+
+
+def test_account_cache_disabled():
+    from xdrparser import parser
+    parser.configure_cache(0)
+    try:
+        assert parser.parse_hint(b'\xbdc\t^') == 'G______________________________________________F5MME____'
+        assert parser.get_cache_stats()['hint']['currsize'] == 0
+    finally:
+        parser.configure_cache()
+
+
 def test_parse_amount_less_than_1():
     from xdrparser.parser import parse_amount
     assert parse_amount(200) == Decimal((0, (0, 0, 2), -3))
@@ -0,0 +1,43 @@
+import pickle
+import tracemalloc
+
+FILE_LOCATION = 'tests/transactions-0043733f.xdr.gz'
+
+
+def test_parse_compact():
+    from xdrparser.parser import parse
+    from xdrparser.records import parse_compact, to_dict
+    records = parse_compact(FILE_LOCATION, with_hash=True, network_id='test')
+    assert [to_dict(record) for record in records] == parse(FILE_LOCATION, with_hash=True, network_id='test')
+    assert [to_dict(record, raw_amount=True) for record in records] == \
+        parse(FILE_LOCATION, with_hash=True, network_id='test', raw_amount=True)
+
+    transaction = records[0].txSet.txs[0]
+    assert type(transaction).__name__ == 'TransactionEnvelope'
+    assert type(transaction.hash) is bytes
+    assert type(transaction.tx.sourceAccount.ed25519) is bytes
+    assert type(transaction.tx.operations[0].body).__name__ == 'Body'
+    assert isinstance(records[0].txSet.txs, tuple)
+
+
+def test_compact_pickle():
+    from xdrparser.records import parse_compact
+    records = parse_compact(FILE_LOCATION)
+    assert pickle.loads(pickle.dumps(records)) == records
+
+
+def test_compact_memory():
+    from xdrparser.parser import parse_unpacked, unpack_file
+    from xdrparser.records import compact
+    unpacked = unpack_file(FILE_LOCATION)
+
+    tracemalloc.start()
+    parsed = [parse_unpacked(unpacked_struct, index) for index, unpacked_struct in enumerate(unpacked)]
+    parsed_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    records = [compact(unpacked_struct) for unpacked_struct in unpacked]
+    records_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(records) == len(parsed)
+    assert records_size * 2 < parsed_size
@@ -0,0 +1,75 @@
+import pickle
+
+FILE_LOCATION = 'tests/transactions-0043733f.xdr.gz'
+NETWORK_ID = 'Kin Mainnet ; December 2018'
+
+
+def test_stats_record():
+    from xdrparser.stats import ParseStats, StageEvent
+    events = []
+    stats = ParseStats(hooks=[events.append])
+    stats.record('ledger', 'convert', 0.5, 10)
+    stats.record('ledger', 'read', 0.25, 10, 1000)
+    stats.record('ledger', 'read', 0.25, 10, 1000)
+    assert events[0] == StageEvent('ledger', 'convert', 0.5, 10, 0)
+
+    totals = stats.as_dict()
+    assert list(totals['ledger']) == ['read', 'convert']
+    assert totals['ledger']['read'] == {'seconds': 0.5, 'records': 20, 'bytes': 2000, 'records_per_second': 40,
+                                        'mb_per_second': 0.004}
+    assert totals['ledger']['convert']['mb_per_second'] is None
+    assert len(stats.format_summary().splitlines()) == 3
+
+    # Hooks are not sent to other processes, the merged measurements are passed to the hooks of the target
+    copied = pickle.loads(pickle.dumps(stats))
+    assert copied.hooks == []
+    stats.merge(copied)
+    assert stats.as_dict()['ledger']['read']['records'] == 40
+    assert len(events) == 5
+
+
+def test_parse_stats():
+    from xdrparser import parser
+    from xdrparser.stats import ParseStats
+    stats = ParseStats()
+    data = parser.parse(FILE_LOCATION, with_hash=True, network_id=NETWORK_ID, stats=stats)
+    assert data == parser.parse(FILE_LOCATION, with_hash=True, network_id=NETWORK_ID)
+
+    totals = stats.as_dict()['transactions']
+    assert list(totals) == ['read', 'unpack', 'hash', 'convert']
+    assert totals['read']['records'] == totals['unpack']['records'] == totals['convert']['records'] == 64
+    assert totals['read']['bytes'] == totals['unpack']['bytes'] > 0
+    assert totals['hash']['records'] == sum(len(entry['txSet']['txs']) for entry in data)
+
+
+def test_parse_stats_parallel(monkeypatch):
+    from xdrparser import parser
+    from xdrparser.stats import ParseStats
+    monkeypatch.setattr(parser, 'PARALLEL_CHUNK_SIZE', 64 * 1024)
+    events = []
+    stats = ParseStats(hooks=[events.append])
+    data = parser.parse(FILE_LOCATION, workers=2, stats=stats)
+    assert data == parser.parse(FILE_LOCATION)
+    assert stats.as_dict()['transactions']['convert']['records'] == 64
+    # Every chunk is reported separately
+    assert len([event for event in events if event.stage == 'unpack']) > 1
+
+
+def test_unpack_file_stats():
+    from xdrparser import parser
+    from xdrparser.stats import ParseStats
+    stats = ParseStats()
+    assert len(parser.unpack_file(FILE_LOCATION, stats=stats)) == 64
+    assert list(stats.as_dict()['transactions']) == ['read', 'unpack']
+
+
+def test_cli_stats(tmpdir):
+    from click.testing import CliRunner
+    from xdrparser.cli import main
+    result = CliRunner().invoke(main, [FILE_LOCATION, '--stats'])
+    assert result.exit_code == 0
+    assert 'transactions  serialize' in result.output
+
+    result = CliRunner().invoke(main, [FILE_LOCATION, '--stats', '--output-dir', str(tmpdir)])
+    assert result.exit_code == 0
+    assert 'transactions  convert' in result.output
@@ -0,0 +1,122 @@
+import os
+import pickle
+
+import pytest
+
+from benchmarks.fixtures import CHECKPOINT, generate_fixtures, pack_ledger_entries, write_xdr_file
+
+
+@pytest.fixture
+def ledger_records():
+    return pack_ledger_entries(CHECKPOINT - 63, 64)
+
+
+def test_verify_file(tmpdir, ledger_records):
+    from xdrparser.verify import verify_file
+    files = generate_fixtures(str(tmpdir), txs_per_ledger=2, bucket_entries=10)
+    for file_type, file_name in files.items():
+        summary = verify_file(file_name)
+        assert summary.file_type == file_type
+        assert summary.records == (10 if file_type == 'bucket' else 64)
+        if file_type != 'bucket':
+            assert (summary.first_ledger, summary.last_ledger) == (CHECKPOINT - 63, CHECKPOINT)
+
+    summary = verify_file(files['ledger'])
+    assert (summary.previous_hash, summary.last_hash) == (bytes(32), ledger_records[-1][:32])
+
+
+def test_verify_errors(tmpdir, ledger_records):
+    from xdrparser.errors import FramingError, HashChainError, LedgerSequenceError, RecordCountError
+    from xdrparser.verify import verify_file
+    file_name = str(tmpdir.join('ledger-{:08x}.xdr'.format(CHECKPOINT)))
+
+    write_xdr_file(file_name, ledger_records[:-1])
+    with pytest.raises(RecordCountError):
+        verify_file(file_name)
+
+    write_xdr_file(file_name, ledger_records, last_fragment=False)
+    with pytest.raises(FramingError, match='not of a last fragment'):
+        verify_file(file_name)
+
+    write_xdr_file(file_name, ledger_records)
+    with open(file_name, 'ab') as xdr_file:
+        xdr_file.write(b'\x80\x00\x00\x10\x00')
+    with pytest.raises(FramingError, match='record 64: Truncated record at byte'):
+        verify_file(file_name)
+
+    write_xdr_file(file_name, ledger_records[:10] + ledger_records[11:] + ledger_records[10:11])
+    with pytest.raises(LedgerSequenceError, match='record 10: ledger {} is missing'.format(CHECKPOINT - 53)):
+        verify_file(file_name)
+
+    tampered = bytearray(ledger_records[10])
+    tampered[-8] ^= 1
+    write_xdr_file(file_name, ledger_records[:10] + [bytes(tampered)] + ledger_records[11:])
+    with pytest.raises(HashChainError, match='does not match its hash') as e:
+        verify_file(file_name)
+    assert (e.value.file_name, e.value.record) == (file_name, 10)
+    assert str(pickle.loads(pickle.dumps(e.value))) == str(e.value)
+
+    # A header with a valid hash, that does not point to the ledger before it
+    write_xdr_file(file_name, ledger_records[:10] + pack_ledger_entries(CHECKPOINT - 53, 54))
+    with pytest.raises(HashChainError, match='record 10: ledger {} does not point'.format(CHECKPOINT - 53)):
+        verify_file(file_name)
+
+
+def test_verify_corrupt_gzip(tmpdir, ledger_records):
+    from xdrparser.errors import CompressionError
+    from xdrparser.verify import verify_file
+    file_name = str(tmpdir.join('ledger-{:08x}.xdr.gz'.format(CHECKPOINT)))
+    write_xdr_file(file_name, ledger_records)
+    data = bytearray(tmpdir.join(os.path.basename(file_name)).read_binary())
+
+    # A bad checksum at the end of the file, and corrupt deflate data in the middle of it
+    for offset in (len(data) - 8, len(data) // 2):
+        corrupt = bytearray(data)
+        corrupt[offset:offset + 4] = bytes(byte ^ 0xff for byte in corrupt[offset:offset + 4])
+        tmpdir.join(os.path.basename(file_name)).write_binary(bytes(corrupt))
+        with pytest.raises(CompressionError, match='corrupt compressed data'):
+            verify_file(file_name)
+
+
+def test_verify_files(tmpdir, ledger_records):
+    from xdrparser.errors import HashChainError
+    from xdrparser.verify import verify_files
+    first_file = str(tmpdir.join('ledger-{:08x}.xdr'.format(CHECKPOINT)))
+    second_file = str(tmpdir.join('ledger-{:08x}.xdr'.format(CHECKPOINT + 64)))
+    write_xdr_file(first_file, ledger_records)
+
+    write_xdr_file(second_file, pack_ledger_entries(CHECKPOINT + 1, 64, previous_hash=ledger_records[-1][:32]))
+    results = list(verify_files([second_file, first_file]))
+    assert [result.file_name for result in results] == [first_file, second_file]
+    assert [result.error for result in results] == [None, None]
+
+    write_xdr_file(second_file, pack_ledger_entries(CHECKPOINT + 1, 64))
+    results = list(verify_files([first_file, second_file], workers=2))
+    assert results[0].error is None
+    assert isinstance(results[1].error, HashChainError)
+    assert 'does not point to the hash of ledger {}'.format(CHECKPOINT) in str(results[1].error)
+
+
+def test_cli_verify(tmpdir):
+    from click.testing import CliRunner
+    from xdrparser.cli import main
+    generate_fixtures(str(tmpdir), txs_per_ledger=2, bucket_entries=10)
+
+    result = CliRunner().invoke(main, [str(tmpdir), '--verify'])
+    assert result.exit_code == 0
+    assert 'Verified 5 files' in result.output
+    assert result.output.count('OK: ') == 5
+
+    with open(str(tmpdir.join('scp-{:08x}.xdr'.format(CHECKPOINT))), 'wb') as xdr_file:
+        xdr_file.write(b'\x80\x00\x00')
+    result = CliRunner().invoke(main, [str(tmpdir), '--verify'])
+    assert result.exit_code == 1
+    assert 'Verified 5 files' in result.output
+    assert 'FramingError' in result.output
+
+    output_dir = str(tmpdir.join('output'))
+    result = CliRunner().invoke(main, [str(tmpdir), '--verify', '--with-hash', '--select', 'ledgerSeq',
+                                       '--output-dir', output_dir, '--format', 'npz'])
+    assert result.exit_code == 1
+    assert result.output == 'Cannot use --format, --output-dir, --select, --with-hash with --verify.\n'
+    assert not os.path.exists(output_dir)
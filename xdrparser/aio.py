@@ -0,0 +1,273 @@
+"""
+Contains an asyncio API to parse many history files concurrently, from local paths or from an archive served over http.
+
+Fetching, decompressing and decoding overlap: the files are read or fetched on the event loop,
+decompressed in threads and decoded in a pool of processes, so the event loop is never blocked by parsing.
+Requires python 3.7, for asynchronous generators and asyncio.get_running_loop.
+"""
+import asyncio
+import struct
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, AsyncIterator, Iterable, List, Tuple, Union
+from urllib.parse import urlsplit
+
+from xdrparser import archive, parser
+from xdrparser.decompress import GzipInflater
+from xdrparser.errors import FetchError
+from xdrparser.filters import RecordFilter
+
+# The size of the chunks that are read from a file or a stream
+FETCH_CHUNK_SIZE = 256 * 1024
+
+# The amount of files that are fetched and decoded at the same time
+MAX_FILES = 2
+
+# A source is a local path, an http url, or a (file name, stream) pair
+Source = Union[str, Tuple[str, Any]]
+
+
+class RecordSplitter:
+    """Split a stream of xdr data to the raw bytes of its structures as the data arrives, see parser.iter_records."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def split(self, data: bytes) -> List[bytes]:
+        """Add the next data of the stream, and return the structures that were completed by it."""
+        buffer = self._buffer
+        buffer += data
+        records = []
+        position = 0
+        while len(buffer) - position >= 4:
+            length = parser.get_record_length(struct.unpack_from('>I', buffer, position)[0], position)
+            if len(buffer) - position - 4 < length:
+                break
+            records.append(bytes(buffer[position + 4:position + 4 + length]))
+            position += 4 + length
+        del buffer[:position]
+        return records
+
+    def flush(self):
+        """Check that the stream ended at the end of a structure."""
+        if not self._buffer:
+            return
+        if len(self._buffer) < 4:
+            raise EOFError('Truncated record mark')
+        length = parser.get_record_length(struct.unpack_from('>I', self._buffer)[0], 0)
+        raise EOFError('Truncated record, expected {} bytes but got {}'.format(length, len(self._buffer) - 4))
+
+
+def is_url(source: str) -> bool:
+    """Check if a source is an http url."""
+    return source.startswith(('http://', 'https://'))
+
+
+async def iter_file_chunks(file_name: str, chunk_size: int = FETCH_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Read a local file in chunks, every chunk is read in a thread so the event loop is not blocked."""
+    loop = asyncio.get_running_loop()
+    with open(file_name, 'rb') as xdr_file:
+        while True:
+            data = await loop.run_in_executor(None, xdr_file.read, chunk_size)
+            if not data:
+                return
+            yield data
+
+
+async def iter_stream_chunks(stream: Any, chunk_size: int = FETCH_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Read an async byte stream in chunks, either a stream with an async 'read', or an async iterable of bytes."""
+    if hasattr(stream, 'read'):
+        while True:
+            data = await stream.read(chunk_size)
+            if not data:
+                return
+            yield data
+    else:
+        async for data in stream:
+            yield data
+
+
+async def iter_http_chunks(url: str, chunk_size: int = FETCH_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    Fetch a file over http in chunks, as they arrive.
+
+    This is a minimal http/1.1 client for serving archives: a single GET without redirects,
+    of a body with a content length, chunked or ending when the connection is closed.
+    Raise a FetchError if the file is not found or the response ends early.
+    """
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=True if parts.scheme == 'https' else None)
+    try:
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        writer.write('GET {} HTTP/1.1\r\nHost: {}\r\nAccept-Encoding: identity\r\nConnection: close\r\n\r\n'
+                     .format(path, parts.netloc).encode('latin-1'))
+
+        status_line = (await reader.readline()).decode('latin-1').rstrip('\r\n').split(' ', 2)
+        if len(status_line) < 2 or not status_line[1].isdigit():
+            raise FetchError(url, 'invalid response')
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if status_line[1] != '200':
+            raise FetchError(url, 'HTTP {}'.format(' '.join(status_line[1:])))
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    return
+                yield await reader.readexactly(size)
+                await reader.readexactly(2)
+
+        remaining = int(headers['content-length']) if 'content-length' in headers else None
+        while remaining is None or remaining > 0:
+            data = await reader.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not data:
+                if remaining is not None:
+                    raise FetchError(url, 'response ended {} bytes early'.format(remaining))
+                return
+            if remaining is not None:
+                remaining -= len(data)
+            yield data
+    except asyncio.IncompleteReadError as e:
+        raise FetchError(url, 'response ended early') from e
+    finally:
+        writer.close()
+
+
+async def iter_sources(sources: Union[Source, Iterable[Source]],
+                       chunk_size: int = FETCH_CHUNK_SIZE) -> AsyncIterator[Tuple[str, AsyncIterator[bytes]]]:
+    """
+    Yield the name of every file in the given sources, with an async iterator of its data.
+
+    A local path is searched like archive.find_history_files, in a thread so a large archive does not block the loop,
+    an http url is fetched with iter_http_chunks, and a (file name, stream) pair is read with iter_stream_chunks,
+    where the file name is used for its file type.
+    """
+    loop = asyncio.get_running_loop()
+    if isinstance(sources, (str, tuple)):
+        sources = [sources]
+    for source in sources:
+        if isinstance(source, tuple):
+            file_name, stream = source
+            yield file_name, iter_stream_chunks(stream, chunk_size)
+        elif is_url(source):
+            yield source, iter_http_chunks(source, chunk_size)
+        else:
+            for file_name in await loop.run_in_executor(None, archive.find_history_files, [source]):
+                yield file_name, iter_file_chunks(file_name, chunk_size)
+
+
+async def aparse(sources: Union[Source, Iterable[Source]], workers: int = 1, max_files: int = MAX_FILES,
+                 executor: Executor = None, raw_amount: bool = False, with_hash: bool = False, network_id: str = None,
+                 fields: List[str] = None, record_filter: RecordFilter = None, amount_format: str = None,
+                 chunk_size: int = FETCH_CHUNK_SIZE) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Parse many files concurrently, yielding (file name, parsed record) in the order of the files and their records.
+
+    The sources are described in iter_sources, the parsing options are the same as for parser.iter_parse,
+    and transaction hashes are only calculated for transactions files.
+    Up to 'max_files' files are fetched at the same time, and the records of every file are decoded in chunks
+    by 'executor', or by a pool of 'workers' processes which is created for the iteration.
+    At most twice as many chunks as workers are in flight for every file, so a slow consumer stops the fetching
+    instead of the records piling up in memory.
+    A file that cannot be parsed raises its error from the iteration.
+    """
+    loop = asyncio.get_running_loop()
+    network_hash = parser.get_network_hash(network_id) if with_hash else None
+    selection = parser.compile_fields(fields) if fields else None
+    amount_format = parser.get_amount_format(raw_amount, amount_format)
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+
+    def decode(file_type: str, records: List[bytes], first_index: int) -> asyncio.Future:
+        file_hash = network_hash if file_type == 'transactions' else None
+        return loop.run_in_executor(executor, parser.parse_records_chunk, file_type, records, first_index,
+                                    amount_format, file_hash, selection, record_filter)
+
+    async def start(count: int):
+        for _ in range(count):
+            try:
+                file_name, chunks = await file_sources.__anext__()
+            except StopAsyncIteration:
+                return
+            chunk_queue = asyncio.Queue(maxsize=workers * 2)
+            pending.append((file_name, chunk_queue, loop.create_task(
+                _decode_file(file_name, chunks, chunk_queue, decode))))
+
+    file_sources = iter_sources(sources, chunk_size)
+    pending = deque()
+    try:
+        await start(max_files)
+        while pending:
+            file_name, chunk_queue, _ = pending[0]
+            while True:
+                item = await chunk_queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                for record in await item:
+                    yield file_name, record
+
+            pending.popleft()
+            await start(1)
+    finally:
+        # Stop the files that were not consumed, and the chunks they queued
+        for _, chunk_queue, task in pending:
+            task.cancel()
+            while not chunk_queue.empty():
+                item = chunk_queue.get_nowait()
+                if isinstance(item, asyncio.Future):
+                    item.cancel()
+        await asyncio.gather(*(task for _, _, task in pending), return_exceptions=True)
+        await file_sources.aclose()
+        if own_executor:
+            await loop.run_in_executor(None, executor.shutdown)
+
+
+async def _decode_file(file_name: str, chunks: AsyncIterator[bytes], chunk_queue: asyncio.Queue, decode):
+    """
+    Split a file to chunks of records as its data arrives, and queue a future of every decoded chunk.
+
+    The queue ends with None, or with the exception that stopped the file.
+    """
+    loop = asyncio.get_running_loop()
+    file_type = parser.get_file_type(file_name)
+    inflater = GzipInflater() if file_name.endswith('.gz') else None
+    splitter = RecordSplitter()
+    chunk = []
+    chunk_bytes = 0
+    index = 0
+    try:
+        async for data in chunks:
+            if inflater is not None:
+                # zlib releases the GIL, so the data is decompressed while the event loop keeps running
+                data = await loop.run_in_executor(None, inflater.decompress, data)
+            for record in splitter.split(data):
+                chunk.append(record)
+                chunk_bytes += len(record)
+                if chunk_bytes >= parser.PARALLEL_CHUNK_SIZE:
+                    await chunk_queue.put(decode(file_type, chunk, index))
+                    index += len(chunk)
+                    chunk = []
+                    chunk_bytes = 0
+
+        if inflater is not None:
+            inflater.flush()
+        splitter.flush()
+        if chunk:
+            await chunk_queue.put(decode(file_type, chunk, index))
+            index += len(chunk)
+        parser.check_record_count(file_name, file_type, index)
+        await chunk_queue.put(None)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await chunk_queue.put(e)
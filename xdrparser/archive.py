@@ -0,0 +1,167 @@
+"""Contains methods to parse many history files of an archive with a pool of processes."""
+
+import glob
+import json
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from xdrparser import parser
+from xdrparser.output import COLUMNAR_FORMATS, DecimalEncoder, write_jsonl
+from xdrparser.pool import submit_bounded
+from xdrparser.stats import ParseStats
+
+HISTORY_FILE_PATTERN = re.compile('^(transactions|results|scp|ledger)(-[0-9a-fA-F]{8}.)(xdr|xdr.gz)$')
+BUCKET_FILE_PATTERN = re.compile('^(bucket-)([0-9a-fA-F]{64}.)(xdr|xdr.gz)$')
+
+# The order of the files of a checkpoint
+FILE_TYPE_ORDER = ('ledger', 'transactions', 'results', 'scp')
+
+# The result of parsing a single file.
+# 'data' is the parsed file, or None if it was written to an output file,
+# 'records' is the amount of records in the file and 'error' describes why the file could not be parsed.
+# 'stats' are the ParseStats of the file, when they are collected.
+FileResult = namedtuple('FileResult', ['file_name', 'data', 'records', 'error', 'stats'])
+
+
+def get_base_name(file_name: str) -> str:
+    r"""
+    Return the name of the file without its directory.
+
+    'path/to/ledger-00abc53f.xdr' > 'ledger-00abc53f.xdr'
+    or 'path\to\ledger-00abc53f.xdr' > 'ledger-00abc53f.xdr' on a Windows os
+    """
+    file_name = file_name.split('\\')[-1]
+    return file_name.split('/')[-1]
+
+
+def is_history_file(file_name: str) -> bool:
+    """Check if a file is named like a history archive file."""
+    base_name = get_base_name(file_name)
+    return HISTORY_FILE_PATTERN.fullmatch(base_name) is not None or \
+        BUCKET_FILE_PATTERN.fullmatch(base_name) is not None
+
+
+def get_checkpoint(file_name: str) -> Optional[int]:
+    """Return the checkpoint of a history file, the last ledger in it, or None for a bucket file."""
+    match = HISTORY_FILE_PATTERN.fullmatch(get_base_name(file_name))
+    return int(match.group(2)[1:9], 16) if match is not None else None
+
+
+def get_ledger_order(file_name: str) -> Tuple:
+    """
+    Return the key that sorts files in ledger order.
+
+    Files are sorted by their checkpoint, and the files of a checkpoint by FILE_TYPE_ORDER.
+    Bucket files do not belong to a checkpoint, and are sorted after all the other files.
+    """
+    base_name = get_base_name(file_name)
+    match = HISTORY_FILE_PATTERN.fullmatch(base_name)
+    if match is None:
+        return 1, 0, 0, base_name
+    return 0, int(match.group(2)[1:9], 16), FILE_TYPE_ORDER.index(match.group(1)), base_name
+
+
+def find_history_files(paths: Iterable[str]) -> List[str]:
+    """
+    Return the history files in the given paths.
+
+    Every path can be a file, a glob pattern, or a directory which is searched recursively.
+    Files found in directories or by patterns are only included if they are named like history files,
+    while explicitly given files are always included.
+    """
+    file_names = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for root, _, files in os.walk(path):
+                found.extend(os.path.join(root, name) for name in files if is_history_file(name))
+            file_names.extend(sorted(found))
+        elif any(char in path for char in '*?['):
+            file_names.extend(sorted(name for name in glob.glob(path, recursive=True)
+                                     if os.path.isfile(name) and is_history_file(name)))
+        else:
+            file_names.append(path)
+
+    return file_names
+
+
+def get_output_file_name(file_name: str, output_dir: str, output_format: str = 'json') -> str:
+    """Return the name of the file that the parsed file is written to."""
+    base_name = get_base_name(file_name)
+    if base_name.endswith('.gz'):
+        base_name = base_name[:-len('.gz')]
+    return os.path.join(output_dir, base_name + '.' + output_format)
+
+
+def parse_files(file_names: Iterable[str], workers: int = 1, output_dir: str = None, indent: int = None,
+                output_format: str = 'json', cache_size: int = None, collect_stats: bool = False,
+                **parse_options) -> Iterator[FileResult]:
+    """
+    Parse many files with a pool of processes, yielding a FileResult for every file in the original order.
+
+    Every file is parsed by a single worker, and at most twice as many files as workers are in flight.
+    'parse_options' are passed to parser.parse, transaction hashes are only calculated for transactions files.
+    If 'output_dir' is given, every parsed file is written by its worker to a file in that directory,
+    instead of being sent back to the calling process.
+    The 'output_format' of the file is either 'json', 'jsonl' to write every record as a json line,
+    or one of the COLUMNAR_FORMATS of columns.export, where the amount of records is the amount of rows.
+    A file that cannot be parsed results in a FileResult with an error, and does not stop the other files.
+    If 'cache_size' is given, the account caches of the workers are set to that size, see parser.configure_cache.
+    The caches of every worker are kept between the files it parses.
+    If 'collect_stats' is set, the time of every parsing stage of every file is measured, see stats.ParseStats.
+    """
+    calls = ((file_name, output_dir, indent, output_format, cache_size, collect_stats, parse_options)
+             for file_name in file_names)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for future in submit_bounded(executor, _parse_file, calls, workers * 2):
+            yield future.result()
+
+
+def _parse_file(file_name: str, output_dir: str, indent: int, output_format: str, cache_size: int,
+                collect_stats: bool, parse_options: dict) -> FileResult:
+    """Parse a single file, runs in a worker process."""
+    if cache_size is not None and parser.get_cache_stats()['account']['maxsize'] != cache_size:
+        parser.configure_cache(cache_size)
+
+    stats = ParseStats() if collect_stats else None
+    parse_options = dict(parse_options, stats=stats)
+    try:
+        if not is_history_file(file_name):
+            raise ValueError('Invalid history archive file name')
+
+        if parser.get_file_type(file_name) != 'transactions':
+            parse_options = dict(parse_options, with_hash=False)
+
+        if output_dir is None:
+            data = parser.parse(file_name, **parse_options)
+            return FileResult(file_name, data, len(data), None, stats)
+
+        output_file_name = get_output_file_name(file_name, output_dir, output_format)
+        if output_format in COLUMNAR_FORMATS:
+            # numpy is only needed for the columnar formats
+            from xdrparser import columns
+            network_id = parse_options.get('network_id') if parse_options.get('with_hash') else None
+            rows = columns.export(file_name, output_file_name, output_format, network_id=network_id,
+                                  record_filter=parse_options.get('record_filter'))
+            return FileResult(file_name, None, rows, None, stats)
+
+        if output_format == 'jsonl':
+            # Stream the records to the file, without keeping the whole file in memory
+            with open(output_file_name, 'wb') as output_file:
+                records = write_jsonl(parser.iter_parse(file_name, **parse_options), output_file)
+            return FileResult(file_name, None, records, None, stats)
+
+        data = parser.parse(file_name, **parse_options)
+        start = perf_counter()
+        with open(output_file_name, 'w') as output_file:
+            json.dump(data, output_file, indent=indent, cls=DecimalEncoder)
+        if stats is not None:
+            stats.record(parser.get_file_type(file_name), 'serialize', perf_counter() - start, len(data))
+        return FileResult(file_name, None, len(data), None, stats)
+    except Exception as e:
+        return FileResult(file_name, None, 0, '{}: {}'.format(type(e).__name__, e), stats)
@@ -1,53 +1,308 @@
 """Command line tool to parse Kin's xdr history files."""
 import json
-import re
-from decimal import Decimal
+import os
+import sys
+from collections import OrderedDict
+from time import perf_counter
 
 import click
+from kin_base.exceptions import StellarError
 
-from xdrparser import parser
-
-
-class DecimalEncoder(json.JSONEncoder):
-    """
-    Json encoder that encodes Decimals as strings
-    """
-    def default(self, o):
-        if isinstance(o, Decimal):
-            return str(o)
-        return super(DecimalEncoder, self).default(o)
+from xdrparser import parser, archive, join, verify
+from xdrparser.errors import XdrParserError
+from xdrparser.filters import RecordFilter
+from xdrparser.manifest import Manifest, iter_pending_files
+from xdrparser.output import COLUMNAR_FORMATS, DecimalEncoder, get_line_encoder, write_jsonl
+from xdrparser.stats import ParseStats
 
 
 @click.command()
-@click.argument('xdr_file')
+@click.argument('xdr_files', nargs=-1)
 @click.option('--with-hash', is_flag=True, help="Calculate tx hashes, only for a 'transactions' xdr file,"
                                                 " must be used with --network-id")
 @click.option('--network-id', default=None, help="Network-id/network paraphrase, needed for --with-hash")
 @click.option('--indent', default=2, help='Number of spaces to indent the json output with')
 @click.option('--raw-amount', is_flag=True, help='Should the amount be shown in stroops')
-def main(xdr_file, raw_amount, with_hash, network_id, indent):
-    """Command line tool to parse Stellar's xdr history files."""
-    verify_input(xdr_file, with_hash, network_id)
+@click.option('--amount-format', type=click.Choice(parser.AMOUNT_FORMATS), default=None,
+              help="How amounts are shown, 'string' is the exact amount as a fixed point string,"
+                   " 'raw' is the same as --raw-amount. The default is 'decimal', or 'string' for --format jsonl")
+@click.option('--workers', type=click.IntRange(min=1), default=1, help='Number of processes to decode the file with')
+@click.option('--files-from', type=click.File('r'), default=None,
+              help='Read the files to parse from a file, one per line')
+@click.option('--output-dir', default=None,
+              help='Write every parsed file to a json file in this directory, instead of printing it')
+@click.option('--select', multiple=True,
+              help="Only output the fields matching a pattern such as 'txSet.txs[].tx.operations[].body.*.amount',"
+                   " can be used multiple times")
+@click.option('--account', multiple=True, help='Only output transactions involving this account,'
+                                               ' can be used multiple times')
+@click.option('--op-type', multiple=True, help="Only output transactions with this operation type, such as 'PAYMENT',"
+                                               " can be used multiple times")
+@click.option('--ledger-from', type=int, default=None, help='Only output ledgers from this sequence')
+@click.option('--ledger-to', type=int, default=None, help='Only output ledgers up to this sequence')
+@click.option('--failed-only', is_flag=True, help="Only output failed transactions, for a 'results' xdr file")
+@click.option('--cache-size', type=int, default=None,
+              help='Number of account encodings to cache in every process, 0 disables the cache')
+@click.option('--format', 'output_format', type=click.Choice(['json', 'jsonl', 'npz', 'parquet']), default='json',
+              help="Output format, 'jsonl' streams every record as a compact json line,"
+                   " 'npz' and 'parquet' export the operations or results as typed columns to --output-dir")
+@click.option('--results', 'results_file', default=None,
+              help="Join the results file of the same checkpoint to a 'transactions' xdr file,"
+                   " must be used with --network-id")
+@click.option('--stats', 'with_stats', is_flag=True,
+              help='Print the time spent in every parsing stage to stderr when done')
+@click.option('--manifest', 'manifest_file', default=None,
+              help='Only parse files that are not in this manifest database or changed since, in ledger order,'
+                   ' and add the parsed files to it')
+@click.option('--verify', 'verify_only', is_flag=True,
+              help='Only check the integrity of the files: their framing, ledgers and ledger hash chain,'
+                   ' without parsing them')
+def main(xdr_files, raw_amount, amount_format, with_hash, network_id, indent, workers, files_from, output_dir, select,
+         account, op_type, ledger_from, ledger_to, failed_only, cache_size, output_format, results_file, with_stats,
+         manifest_file, verify_only):
+    """
+    Command line tool to parse Stellar's xdr history files.
+
+    XDR_FILES can be history files, archive directories or glob patterns.
+    When more than a single file is given, the files are parsed in batch mode:
+    every file is printed as a json line, and files that fail to parse are reported at the end.
+    """
+    paths = list(xdr_files)
+    if files_from is not None:
+        paths.extend(line.strip() for line in files_from if line.strip())
+    if not paths:
+        print('Missing argument "xdr_files".')
+        quit(1)
+
+    if verify_only:
+        verify_supported_options('--verify', with_hash=with_hash, network_id=network_id is not None,
+                                 raw_amount=raw_amount, amount_format=amount_format is not None,
+                                 output_dir=output_dir is not None, select=select, account=account, op_type=op_type,
+                                 ledger_from=ledger_from is not None, ledger_to=ledger_to is not None,
+                                 failed_only=failed_only, cache_size=cache_size is not None,
+                                 format=output_format != 'json', results=results_file is not None, stats=with_stats,
+                                 manifest=manifest_file is not None)
+        verify_batch(paths, workers)
+        return
+
+    if output_format in COLUMNAR_FORMATS:
+        if output_dir is None:
+            print('Cannot use --format {} without --output-dir.'.format(output_format))
+            quit(1)
+        # The columns have a fixed set of fields, and keep the amounts raw
+        verify_supported_options('--format {}'.format(output_format), select=select,
+                                 amount_format=amount_format is not None, raw_amount=raw_amount)
+
+    if results_file is not None:
+        verify_supported_options('--results', select=select, account=account, op_type=op_type,
+                                 ledger_from=ledger_from is not None, ledger_to=ledger_to is not None,
+                                 failed_only=failed_only, workers=workers > 1, stats=with_stats,
+                                 output_dir=output_dir is not None, manifest=manifest_file is not None)
+
+    if cache_size is not None:
+        parser.configure_cache(cache_size)
+
+    if amount_format is None:
+        # Amounts are written as strings either way, so json lines are not slowed down by Decimal amounts
+        amount_format = 'string' if output_format == 'jsonl' else 'decimal'
+
+    parse_options = {
+        'raw_amount': raw_amount,
+        'amount_format': amount_format,
+        'with_hash': with_hash,
+        'network_id': network_id,
+        'fields': get_fields(select),
+        'record_filter': get_record_filter(account, op_type, ledger_from, ledger_to, failed_only),
+    }
+    stats = ParseStats() if with_stats else None
+    if results_file is not None:
+        parse_joined(paths, results_file, indent, output_format, parse_options)
+    elif len(paths) == 1 and os.path.isfile(paths[0]) and output_dir is None and manifest_file is None:
+        parse_single(paths[0], indent, workers, output_format, parse_options, stats)
+    else:
+        parse_batch(paths, indent, workers, output_dir, output_format, cache_size, parse_options, stats,
+                    manifest_file)
+
+
+def get_fields(select):
+    """Validate the field patterns, or return None if every field is selected."""
+    if not select:
+        return None
+
+    try:
+        parser.compile_fields(select)
+    except ValueError as e:
+        print('Invalid --select: {}'.format(e))
+        quit(1)
+    return list(select)
+
+
+def get_record_filter(accounts, op_types, ledger_from, ledger_to, failed_only):
+    """Create a record filter from the filtering options, or return None if there is nothing to filter."""
+    if not (accounts or op_types or ledger_from is not None or ledger_to is not None or failed_only):
+        return None
+
+    try:
+        return RecordFilter(accounts=accounts, op_types=op_types, ledger_from=ledger_from, ledger_to=ledger_to,
+                            failed_only=failed_only)
+    except (AttributeError, ValueError, StellarError) as e:
+        print('Invalid filter: {}'.format(e))
+        quit(1)
+
+
+def parse_single(xdr_file, indent, workers, output_format, parse_options, stats):
+    """Parse and print a single file."""
+    verify_input(xdr_file, parse_options['with_hash'], parse_options['network_id'])
 
     # Parse and print the file
-    data = parser.parse(xdr_file, raw_amount=raw_amount, with_hash=with_hash, network_id=network_id)
+    try:
+        if output_format == 'jsonl':
+            # Print every record as soon as it is parsed
+            write_jsonl(parser.iter_parse(xdr_file, workers=workers, stats=stats, **parse_options), sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+            print_stats(stats)
+            return
+        data = parser.parse(xdr_file, workers=workers, stats=stats, **parse_options)
+    except XdrParserError as e:
+        sys.stdout.flush()
+        print('ERROR: {}'.format(e))
+        quit(1)
+
+    start = perf_counter()
+    print(json.dumps(data, indent=indent, cls=DecimalEncoder))
+    if stats is not None:
+        stats.record(parser.get_file_type(xdr_file), 'serialize', perf_counter() - start, len(data))
+    print_stats(stats)
+
+
+def verify_supported_options(mode, **used_options):
+    """Validate that none of the options that a mode does not support are used, every keyword is an option."""
+    unsupported = ['--' + name.replace('_', '-') for name, used in sorted(used_options.items()) if used]
+    if unsupported:
+        print('Cannot use {} with {}.'.format(', '.join(unsupported), mode))
+        quit(1)
+
+
+def parse_joined(paths, results_file, indent, output_format, parse_options):
+    """Parse and print a transactions file joined with its results file."""
+    if len(paths) != 1 or output_format not in ('json', 'jsonl'):
+        print('--results can only be used with a single transactions file and a json output format')
+        quit(1)
+    if parse_options['network_id'] is None:
+        print('Cannot use --results without --network-id.')
+        quit(1)
+
+    try:
+        records = join.iter_parse_joined(paths[0], results_file, parse_options['network_id'],
+                                         raw_amount=parse_options['raw_amount'],
+                                         amount_format=parse_options['amount_format'])
+        if output_format == 'jsonl':
+            write_jsonl(records, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+            return
+        data = list(records)
+    except (ValueError, XdrParserError) as e:
+        sys.stdout.flush()
+        print('ERROR: {}'.format(e))
+        quit(1)
     print(json.dumps(data, indent=indent, cls=DecimalEncoder))
 
 
+def parse_batch(paths, indent, workers, output_dir, output_format, cache_size, parse_options, stats,
+                manifest_file=None):
+    """Parse many files with a pool of processes, reporting the files that failed."""
+    if parse_options['with_hash'] and parse_options['network_id'] is None:
+        print('Cannot use --with-hash without --network-id.')
+        quit(1)
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # Only the new or changed files are parsed, and recorded in the manifest once they are parsed
+    manifest = Manifest(manifest_file) if manifest_file is not None else None
+    if manifest is not None:
+        pending = OrderedDict((state.file_name, state) for state in iter_pending_files(paths, manifest))
+        file_names = list(pending)
+    else:
+        file_names = archive.find_history_files(paths)
+
+    encode_line = get_line_encoder()
+    failed = []
+    parsed = 0
+    for result in archive.parse_files(file_names, workers=workers, output_dir=output_dir,
+                                      indent=indent, output_format=output_format, cache_size=cache_size,
+                                      collect_stats=stats is not None, **parse_options):
+        if stats is not None and result.stats is not None:
+            stats.merge(result.stats)
+        if result.error is not None:
+            failed.append(result)
+            print('ERROR: {}: {}'.format(result.file_name, result.error), file=sys.stderr)
+            continue
+
+        parsed += 1
+        if manifest is not None:
+            manifest.record(pending[result.file_name]._replace(records=result.records))
+        if result.data is None:
+            continue
+        if output_format == 'jsonl':
+            for record in result.data:
+                sys.stdout.buffer.write(encode_line({'file': result.file_name, 'record': record}))
+            sys.stdout.buffer.flush()
+        else:
+            print(json.dumps({'file': result.file_name, 'data': result.data}, cls=DecimalEncoder))
+
+    if manifest is not None:
+        manifest.close()
+    print_stats(stats)
+    print('Parsed {} files, {} failed'.format(parsed, len(failed)), file=sys.stderr)
+    for result in failed:
+        print('  {}: {}'.format(result.file_name, result.error), file=sys.stderr)
+    if failed:
+        quit(1)
+
+
+def verify_batch(paths, workers):
+    """Verify many files with a pool of processes, reporting the files that failed."""
+    start = perf_counter()
+    failed = []
+    verified_files = 0
+    verified_bytes = 0
+    for result in verify.verify_files(archive.find_history_files(paths), workers=workers):
+        if result.error is not None:
+            failed.append(result)
+            print('ERROR: {}: {}: {}'.format(result.file_name, type(result.error).__name__, result.error),
+                  file=sys.stderr)
+            continue
+
+        verified_files += 1
+        verified_bytes += result.summary.bytes
+        print('OK: {}: {} records'.format(result.file_name, result.summary.records))
+
+    sys.stdout.flush()
+    print('Verified {} files ({:.1f} MB in {:.2f}s), {} failed'.format(
+        verified_files, verified_bytes / 1024 / 1024, perf_counter() - start, len(failed)), file=sys.stderr)
+    for result in failed:
+        print('  {}: {}'.format(result.file_name, result.error), file=sys.stderr)
+    if failed:
+        quit(1)
+
+
+def print_stats(stats):
+    """Print the time spent in every parsing stage, if it was measured."""
+    if stats is not None:
+        print(stats.format_summary(), file=sys.stderr)
+
+
 def verify_input(xdr_file, with_hash, network_id):
     """Validate that the input is ok."""
     if with_hash and network_id is None:
         print('Cannot use --with-hash without --network-id.')
         quit(1)
 
-    file_name = xdr_file.split('\\')[-1]
-    file_name = file_name.split('/')[-1]
-
-    if re.fullmatch('^(transactions|results|scp|ledger)(-[0-9a-fA-F]{8}.)(xdr|xdr.gz)$', file_name) is None \
-            and re.fullmatch('^(bucket-)([0-9a-fA-F]{64}.)(xdr|xdr.gz)$', file_name) is None:
+    if not archive.is_history_file(xdr_file):
         print('Invalid history archive file name')
         quit(1)
 
-    if with_hash and file_name.split('-')[0] != 'transactions':
+    if with_hash and parser.get_file_type(xdr_file) != 'transactions':
         print('--with-hash can only be used with a transactions file')
         quit(1)
@@ -0,0 +1,167 @@
+"""Contains methods to export the operations and results of history files as typed columns, for analytics."""
+from itertools import islice
+from typing import Any, Dict, Iterator, Tuple
+
+from kin_base.stellarxdr import StellarXDR_const
+
+from xdrparser.filters import RecordFilter
+from xdrparser.output import COLUMNAR_FORMATS  # noqa: F401
+from xdrparser.parser import get_file_type, get_network_hash, iter_unpack, compile_fields, parse_account
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    raise ImportError('Exporting columns requires numpy, install it with: pip install xdrparser[columns]') from None
+
+# pyarrow is only needed to write parquet files
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+# Amount of rows in every batch, a batch is a row group of a parquet file
+DEFAULT_BATCH_SIZE = 64 * 1024
+
+# The columns of every table, as (name, numpy dtype)
+# Accounts are fixed width ascii addresses, hashes are fixed width hex strings
+OPERATION_COLUMNS = (
+    ('ledger_seq', 'uint32'),
+    ('tx_index', 'uint32'),
+    ('op_index', 'uint16'),
+    ('source_account', 'S56'),
+    ('op_type', 'uint8'),
+    ('destination', 'S56'),
+    ('amount', 'int64'),
+    ('fee', 'uint32'),
+)
+OPERATION_HASH_COLUMN = ('tx_hash', 'S64')
+RESULT_COLUMNS = (
+    ('ledger_seq', 'uint32'),
+    ('tx_index', 'uint32'),
+    ('tx_hash', 'S64'),
+    ('fee_charged', 'int64'),
+    ('result_code', 'int8'),
+    ('op_count', 'uint16'),
+)
+
+# Only the transactions are needed for the operations table, signatures are skipped without decoding them
+OPERATION_FIELDS = ['ledgerSeq', 'txSet.txs[].tx']
+
+
+def get_columns(file_type: str, with_hash: bool = False) -> Tuple[Tuple[str, str], ...]:
+    """Return the columns of the table of a file type, only transactions and results files are supported."""
+    if file_type == 'transactions':
+        return OPERATION_COLUMNS + (OPERATION_HASH_COLUMN,) if with_hash else OPERATION_COLUMNS
+    if file_type == 'results':
+        return RESULT_COLUMNS
+    raise ValueError("Columnar export is only supported for 'transactions' and 'results' files")
+
+
+def iter_batches(file_name: str, batch_size: int = DEFAULT_BATCH_SIZE, network_id: str = None,
+                 record_filter: RecordFilter = None) -> Iterator[Dict[str, numpy.ndarray]]:
+    """
+    Yield the rows of a file as batches of typed columns, every batch is a dictionary of numpy arrays.
+
+    A transactions file has a row for every operation, and a results file has a row for every transaction result.
+    Amounts are kept in stroops, and result codes are the raw enum values.
+    If 'network_id' is given, the operations of a transactions file have the hash of their transaction as well.
+    """
+    file_type = get_file_type(file_name)
+    columns = get_columns(file_type, network_id is not None)
+    if file_type == 'transactions':
+        network_hash = get_network_hash(network_id) if network_id is not None else None
+        unpacked = iter_unpack(file_name, network_hash, compile_fields(OPERATION_FIELDS), record_filter)
+        rows = iter_operation_rows(unpacked, network_hash is not None)
+    else:
+        rows = iter_result_rows(iter_unpack(file_name, record_filter=record_filter))
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield {name: numpy.array(values, dtype=dtype) for (name, dtype), values in zip(columns, zip(*batch))}
+
+
+def iter_operation_rows(entries: Iterator[Any], with_hash: bool = False) -> Iterator[tuple]:
+    """Yield a row for every operation in unpacked TransactionHistoryEntries."""
+    for entry in entries:
+        for tx_index, envelope in enumerate(entry.txSet.txs):
+            transaction = envelope.tx
+            source_account = parse_account(transaction.sourceAccount.ed25519)
+            for op_index, operation in enumerate(transaction.operations):
+                destination, amount = get_operation_payment(operation.body)
+                row = (entry.ledgerSeq, tx_index, op_index,
+                       parse_account(operation.sourceAccount[0].ed25519) if operation.sourceAccount else source_account,
+                       operation.body.type, destination, amount, transaction.fee)
+                yield row + (envelope.hash.hex(),) if with_hash else row
+
+
+def iter_result_rows(entries: Iterator[Any]) -> Iterator[tuple]:
+    """Yield a row for every transaction result in unpacked TransactionHistoryResultEntries."""
+    for entry in entries:
+        for tx_index, result_pair in enumerate(entry.txResultSet.results):
+            result = result_pair.result
+            # Only successful and failed transactions have the results of their operations
+            operation_results = getattr(result.result, 'results', None) or []
+            yield (entry.ledgerSeq, tx_index, result_pair.transactionHash.hex(), result.feeCharged,
+                   result.result.code, len(operation_results))
+
+
+def get_operation_payment(body: Any) -> Tuple[str, int]:
+    """Return the destination and amount of an operation, or an empty destination and 0 if it has none."""
+    if body.type == StellarXDR_const.PAYMENT:
+        return parse_account(body.paymentOp.destination.ed25519), body.paymentOp.amount
+    if body.type == StellarXDR_const.CREATE_ACCOUNT:
+        return parse_account(body.createAccountOp.destination.ed25519), body.createAccountOp.startingBalance
+    if body.type == StellarXDR_const.PATH_PAYMENT:
+        return parse_account(body.pathPaymentOp.destination.ed25519), body.pathPaymentOp.destAmount
+    if body.type == StellarXDR_const.ACCOUNT_MERGE:
+        return parse_account(body.destination.ed25519), 0
+    return '', 0
+
+
+def write_npz(file_name: str, output_file_name: str, batch_size: int = DEFAULT_BATCH_SIZE, network_id: str = None,
+              record_filter: RecordFilter = None) -> int:
+    """
+    Export a file to a compressed numpy .npz file with an array for every column, and return the amount of rows.
+
+    The batches are concatenated when the file is written, since an .npz file cannot be appended to.
+    """
+    columns = get_columns(get_file_type(file_name), network_id is not None)
+    batches = list(iter_batches(file_name, batch_size, network_id, record_filter))
+    arrays = {name: numpy.concatenate([batch[name] for batch in batches]) if batches else numpy.array([], dtype=dtype)
+              for name, dtype in columns}
+    numpy.savez_compressed(output_file_name, **arrays)
+    return len(arrays['ledger_seq'])
+
+
+def write_parquet(file_name: str, output_file_name: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                  network_id: str = None, record_filter: RecordFilter = None) -> int:
+    """
+    Export a file to a parquet file, writing every batch as a row group, and return the amount of rows.
+
+    Requires pyarrow.
+    """
+    if pyarrow is None:
+        raise ImportError('Writing parquet files requires pyarrow, install it with: pip install xdrparser[parquet]')
+
+    columns = get_columns(get_file_type(file_name), network_id is not None)
+    schema = pyarrow.schema([(name, pyarrow.string() if dtype.startswith('S') else pyarrow.from_numpy_dtype(dtype))
+                             for name, dtype in columns])
+    rows = 0
+    with pyarrow.parquet.ParquetWriter(output_file_name, schema) as writer:
+        for batch in iter_batches(file_name, batch_size, network_id, record_filter):
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(batch[name], type=schema.field(name).type) for name, _ in columns], schema=schema))
+            rows += len(batch['ledger_seq'])
+    return rows
+
+
+def export(file_name: str, output_file_name: str, output_format: str, batch_size: int = DEFAULT_BATCH_SIZE,
+           network_id: str = None, record_filter: RecordFilter = None) -> int:
+    """Export a file to one of the COLUMNAR_FORMATS, and return the amount of rows."""
+    writers = {'npz': write_npz, 'parquet': write_parquet}
+    if output_format not in writers:
+        raise ValueError('Unknown columnar format: {}'.format(output_format))
+    return writers[output_format](file_name, output_file_name, batch_size, network_id, record_filter)
@@ -0,0 +1,149 @@
+"""Contains a reader of gzipped files that decompresses them ahead in a background thread."""
+import io
+import queue
+import threading
+import zlib
+from typing import BinaryIO
+
+# A faster zlib compatible implementation is used to decompress when one is installed
+try:
+    from isal import isal_zlib as fast_zlib
+except ImportError:  # pragma: no cover
+    try:
+        from zlib_ng import zlib_ng as fast_zlib
+    except ImportError:
+        fast_zlib = None
+
+# Decompress a gzip stream, with its header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# The size of the compressed chunks that are read, and the amount of decompressed chunks that are buffered
+PIPELINE_CHUNK_SIZE = 256 * 1024
+PIPELINE_MAX_CHUNKS = 16
+
+
+class PipelinedGzipReader(io.RawIOBase):
+    """
+    Read a gzipped file, which is decompressed ahead by a background thread.
+
+    zlib releases the GIL while it decompresses, so the file is decompressed while the records read from it
+    are decoded. At most 'max_chunks' decompressed chunks are buffered, so memory does not grow with the file size.
+    Like any raw file, a read can return less than requested, open_pipelined buffers it to read whole sizes.
+    The file is not seekable, use gzip.open to seek in it.
+    """
+
+    def __init__(self, file_name: str, chunk_size: int = PIPELINE_CHUNK_SIZE, max_chunks: int = PIPELINE_MAX_CHUNKS,
+                 zlib_module=None):
+        super().__init__()
+        self._file = open(file_name, 'rb')
+        self._chunk_size = chunk_size
+        self._zlib = zlib_module or fast_zlib or zlib
+        self._chunks = queue.Queue(max_chunks)
+        self._stop = threading.Event()
+        self._chunk = memoryview(b'')
+        self._eof = False
+        self._thread = threading.Thread(target=self._decompress, daemon=True)
+        self._thread.start()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._chunk:
+            if self._eof:
+                return 0
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._eof = True
+                return 0
+            if isinstance(chunk, Exception):
+                self._eof = True
+                raise chunk
+            self._chunk = memoryview(chunk)
+
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            # Stop the thread, freeing room in the queue in case it is waiting for it
+            self._stop.set()
+            while self._thread.is_alive():
+                try:
+                    self._chunks.get_nowait()
+                except queue.Empty:
+                    self._thread.join(0.01)
+            self._file.close()
+        super().close()
+
+    def _decompress(self):
+        """Decompress the file to the queue, ending with None, or with the exception that stopped it."""
+        try:
+            inflater = GzipInflater(self._zlib)
+            while not self._stop.is_set():
+                data = self._file.read(self._chunk_size)
+                if not data:
+                    break
+                chunk = inflater.decompress(data)
+                if chunk and not self._put(chunk):
+                    return
+
+            inflater.flush()
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item) -> bool:
+        """Put an item in the queue, unless the reader is closed before there is room for it."""
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+class GzipInflater:
+    """
+    Decompress a gzip stream incrementally, as its compressed chunks arrive.
+
+    A gzipped file can have many members, each with its own header, they are decompressed as a single stream.
+    The same zlib.error is raised whichever implementation decompresses the stream.
+    """
+
+    def __init__(self, zlib_module=None):
+        self._zlib = zlib_module or fast_zlib or zlib
+        self._decompressor = self._zlib.decompressobj(GZIP_WBITS)
+        self._in_member = False
+
+    def decompress(self, data: bytes) -> bytes:
+        """Decompress the next chunk of the stream, and return the data decompressed so far."""
+        chunks = []
+        try:
+            while data:
+                self._in_member = True
+                chunks.append(self._decompressor.decompress(data))
+                if self._decompressor.eof:
+                    data = self._decompressor.unused_data.lstrip(b'\x00')
+                    self._decompressor = self._zlib.decompressobj(GZIP_WBITS)
+                    self._in_member = False
+                else:
+                    data = b''
+        except self._zlib.error as e:
+            if isinstance(e, zlib.error):
+                raise
+            raise zlib.error(str(e)) from e
+        return b''.join(chunks)
+
+    def flush(self):
+        """Check that the stream ended at the end of a member, once all its chunks were decompressed."""
+        if self._in_member:
+            raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+
+
+def open_pipelined(file_name: str, buffer_size: int = io.DEFAULT_BUFFER_SIZE) -> BinaryIO:
+    """Open a gzipped file for reading, decompressing it ahead in a background thread."""
+    return io.BufferedReader(PipelinedGzipReader(file_name), buffer_size)
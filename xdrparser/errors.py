@@ -0,0 +1,62 @@
+"""Exceptions raised while reading Kin's xdr history files."""
+
+
+class XdrParserError(Exception):
+    """Base class for all the errors raised by xdrparser."""
+
+
+class RecordCountError(XdrParserError):
+    """A file does not contain the expected amount of records."""
+
+    def __init__(self, file_name: str, found: int, expected: int):
+        super(RecordCountError, self).__init__(
+            'Found only {} ledgers in {}, expected {}'.format(found, file_name, expected))
+        self.file_name = file_name
+        self.found = found
+        self.expected = expected
+
+    def __reduce__(self):
+        # Allow the error to be pickled back from a worker process
+        return self.__class__, (self.file_name, self.found, self.expected)
+
+
+class VerificationError(XdrParserError):
+    """A file failed an integrity check, 'record' is the index of the record that failed it, if any."""
+
+    def __init__(self, file_name: str, record: int, reason: str):
+        location = file_name if record is None else '{}, record {}'.format(file_name, record)
+        super(VerificationError, self).__init__('{}: {}'.format(location, reason))
+        self.file_name = file_name
+        self.record = record
+        self.reason = reason
+
+    def __reduce__(self):
+        return self.__class__, (self.file_name, self.record, self.reason)
+
+
+class FramingError(VerificationError):
+    """The records of a file are not framed by valid record marks."""
+
+
+class CompressionError(VerificationError):
+    """The compressed data of a gzipped file is corrupt."""
+
+
+class LedgerSequenceError(VerificationError):
+    """A record is not of the ledger it should be of, by its position and the checkpoint of its file."""
+
+
+class HashChainError(VerificationError):
+    """A ledger header does not match its hash, or does not point to the hash of the ledger before it."""
+
+
+class FetchError(XdrParserError):
+    """A file could not be fetched from an archive over http."""
+
+    def __init__(self, url: str, reason: str):
+        super(FetchError, self).__init__('Could not fetch {}: {}'.format(url, reason))
+        self.url = url
+        self.reason = reason
+
+    def __reduce__(self):
+        return self.__class__, (self.url, self.reason)
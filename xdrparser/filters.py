@@ -0,0 +1,134 @@
+"""Contains a filter that drops records and transactions while unpacking, before they are parsed."""
+
+import struct
+from typing import Any, Iterable, List, Optional, Tuple, Union
+
+from kin_base import utils
+from kin_base.stellarxdr import StellarXDR_const
+
+# The offset of the upgrades array in a LedgerHeaderHistoryEntry:
+# hash (32) + ledgerVersion (4) + previousLedgerHash (32) + txSetHash (32) + closeTime (8)
+LEDGER_UPGRADES_OFFSET = 108
+
+
+def get_ledger_seq(record: bytes, file_type: str) -> Optional[int]:
+    """
+    Return the ledger sequence of a record without unpacking it.
+
+    Return None for file types where the ledger sequence is not at a known offset.
+    """
+    if file_type in ('transactions', 'results'):
+        # TransactionHistoryEntry and TransactionHistoryResultEntry both start with the ledger sequence
+        return struct.unpack_from('>I', record)[0]
+
+    if file_type == 'ledger':
+        # Skip the variable length upgrades, then the StellarValue ext, txSetResultHash and bucketListHash
+        offset = LEDGER_UPGRADES_OFFSET
+        upgrades = struct.unpack_from('>I', record, offset)[0]
+        offset += 4
+        for _ in range(upgrades):
+            length = struct.unpack_from('>I', record, offset)[0]
+            offset += 4 + (length + 3) // 4 * 4
+        return struct.unpack_from('>I', record, offset + 4 + 32 + 32)[0]
+
+    return None
+
+
+def get_op_type(op_type: Union[int, str]) -> int:
+    """Return the value of an operation type, given as its value or name ('PAYMENT' or 'payment')."""
+    if isinstance(op_type, int) or op_type.isdigit():
+        return int(op_type)
+    return getattr(StellarXDR_const, op_type.upper())
+
+
+class RecordFilter:
+    """
+    Filter the records of history files, and the transactions in them.
+
+    The filter is applied while unpacking, so records that do not match are never parsed:
+    the ledger range and accounts are first checked on the raw bytes of a record, before it is unpacked,
+    and then the transactions that do not match are removed from the unpacked record.
+    A record without any matching transactions is dropped.
+
+    'accounts' are addresses, a transaction matches if any of them appears anywhere in it,
+    for example as the source account or as a payment destination.
+    'op_types' are operation types, by name or value, a transaction matches if it has an operation of any of them.
+    'failed_only' only keeps the results of failed transactions.
+    Filters that do not apply to a file type, such as 'failed_only' for a transactions file, are ignored.
+    """
+
+    def __init__(self, accounts: Iterable[str] = None, op_types: Iterable[Union[int, str]] = None,
+                 ledger_from: int = None, ledger_to: int = None, failed_only: bool = False):
+        self.accounts = [utils.decode_check('account', account) for account in accounts] if accounts else None
+        self.op_types = {get_op_type(op_type) for op_type in op_types} if op_types else None
+        self.ledger_from = ledger_from
+        self.ledger_to = ledger_to
+        self.failed_only = failed_only
+
+    def match_record(self, record: bytes, file_type: str) -> bool:
+        """Check if a record might match, without unpacking it."""
+        if self.ledger_from is not None or self.ledger_to is not None:
+            ledger_seq = get_ledger_seq(record, file_type)
+            if ledger_seq is not None and not self._match_ledger(ledger_seq):
+                return False
+
+        if self.accounts is not None and file_type in ('transactions', 'bucket'):
+            return any(account in record for account in self.accounts)
+
+        return True
+
+    def filter_unpacked(self, unpacked: Any, record: bytes, transaction_spans: List[Tuple[int, int]]) -> Any:
+        """
+        Remove the transactions that do not match from an unpacked record.
+
+        'transaction_spans' are the positions of the transactions in the record, see HistoryUnpacker.
+        Return None if nothing in the record matches.
+        """
+        if hasattr(unpacked, 'txSet'):
+            if not self._match_ledger(unpacked.ledgerSeq):
+                return None
+            unpacked.txSet.txs = [transaction
+                                  for transaction, (start, end) in zip(unpacked.txSet.txs, transaction_spans)
+                                  if self._match_transaction(transaction.tx, record[start:end])]
+            return unpacked if unpacked.txSet.txs else None
+
+        if hasattr(unpacked, 'txResultSet'):
+            if not self._match_ledger(unpacked.ledgerSeq):
+                return None
+            unpacked.txResultSet.results = [result for result in unpacked.txResultSet.results
+                                            if self._match_result(result.result)]
+            return unpacked if unpacked.txResultSet.results else None
+
+        if hasattr(unpacked, 'header'):
+            return unpacked if self._match_ledger(unpacked.header.ledgerSeq) else None
+
+        if hasattr(unpacked, 'v0'):
+            return unpacked if self._match_ledger(unpacked.v0.ledgerMessages.ledgerSeq) else None
+
+        return unpacked
+
+    def _match_ledger(self, ledger_seq: int) -> bool:
+        """Check if a ledger is in the ledger range."""
+        return (self.ledger_from is None or ledger_seq >= self.ledger_from) and \
+            (self.ledger_to is None or ledger_seq <= self.ledger_to)
+
+    def _match_transaction(self, transaction: Any, transaction_bytes: bytes) -> bool:
+        """Check if a transaction matches, by its raw bytes for accounts and by its operations for types."""
+        if self.accounts is not None and not any(account in transaction_bytes for account in self.accounts):
+            return False
+        if self.op_types is not None and not any(operation.body.type in self.op_types
+                                                 for operation in transaction.operations):
+            return False
+        return True
+
+    def _match_result(self, result: Any) -> bool:
+        """Check if a transaction result matches."""
+        if self.failed_only and result.result.code == StellarXDR_const.txSUCCESS:
+            return False
+        if self.op_types is not None:
+            # Only successful and failed transactions have the results of their operations
+            operation_results = getattr(result.result, 'results', [])
+            if not any(getattr(operation_result, 'tr', None) is not None and
+                       operation_result.tr.type in self.op_types for operation_result in operation_results):
+                return False
+        return True
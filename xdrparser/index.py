@@ -0,0 +1,150 @@
+"""Contains methods to index the records of an xdr file and access them without decoding the whole file."""
+
+import os
+import struct
+from typing import List, Tuple, Iterator, Optional, Union
+
+from xdrparser.filters import RecordFilter
+from xdrparser.parser import open_xdr_file, get_file_type, iter_unpack_records, parse_unpacked, get_network_hash, \
+    compile_fields, map_xdr_file, iter_raw_records
+
+# The sidecar index is saved next to the xdr file with this suffix
+INDEX_SUFFIX = '.idx'
+
+# Sidecar layout: a header of (magic, source file size, source file mtime, record count)
+# followed by an (offset, length) pair for every record
+INDEX_MAGIC = b'XIDX'
+INDEX_HEADER = struct.Struct('>4sQQQ')
+INDEX_ENTRY = struct.Struct('>QI')
+
+
+def build_index(file_name: str) -> List[Tuple[int, int]]:
+    """
+    Return the offset and length of every record in an xdr file, without decoding any of them.
+
+    The offsets point to the start of the record data (after the record mark)
+    in the decompressed stream.
+    """
+    index = []
+    position = 0
+    # Only the record marks of a mapped file are read, a gzipped file still has to be inflated
+    for record in iter_raw_records(file_name):
+        index.append((position + 4, len(record)))
+        position += 4 + len(record)
+    return index
+
+
+def get_index_file_name(file_name: str) -> str:
+    """Return the name of the sidecar index of a file."""
+    return file_name + INDEX_SUFFIX
+
+
+def save_index(file_name: str, index: List[Tuple[int, int]], index_file_name: str = None):
+    """Save an index as a sidecar file next to the xdr file."""
+    file_stat = os.stat(file_name)
+    with open(index_file_name or get_index_file_name(file_name), 'wb') as index_file:
+        index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, file_stat.st_size, file_stat.st_mtime_ns, len(index)))
+        for offset, length in index:
+            index_file.write(INDEX_ENTRY.pack(offset, length))
+
+
+def load_index(file_name: str, index_file_name: str = None) -> Optional[List[Tuple[int, int]]]:
+    """
+    Load the sidecar index of a file.
+
+    Return None if there is no sidecar, or if it is stale because the xdr file has changed since it was saved.
+    """
+    index_file_name = index_file_name or get_index_file_name(file_name)
+    if not os.path.exists(index_file_name):
+        return None
+
+    file_stat = os.stat(file_name)
+    with open(index_file_name, 'rb') as index_file:
+        data = index_file.read()
+
+    if len(data) < INDEX_HEADER.size:
+        return None
+    magic, size, mtime, count = INDEX_HEADER.unpack_from(data)
+    if magic != INDEX_MAGIC or size != file_stat.st_size or mtime != file_stat.st_mtime_ns \
+            or len(data) != INDEX_HEADER.size + count * INDEX_ENTRY.size:
+        return None
+
+    return list(INDEX_ENTRY.iter_unpack(data[INDEX_HEADER.size:]))
+
+
+def get_index(file_name: str, use_sidecar: bool = False) -> List[Tuple[int, int]]:
+    """
+    Return the index of a file.
+
+    If 'use_sidecar' is set, an existing sidecar index is used, and a new one is saved if it is missing or stale.
+    """
+    if use_sidecar:
+        index = load_index(file_name)
+        if index is not None:
+            return index
+
+    index = build_index(file_name)
+    if use_sidecar:
+        save_index(file_name, index)
+    return index
+
+
+def select_records(index: List[Tuple[int, int]], start: int, stop: int = None) -> range:
+    """
+    Return the positions of the records in the range [start, stop).
+
+    'start' and 'stop' behave like a slice of the file's records,
+    if 'stop' is not given only the record at 'start' is selected.
+    """
+    positions = range(len(index))
+    if stop is None:
+        # Raise an IndexError for a record that does not exist
+        position = positions[start]
+        return positions[position:position + 1]
+    return positions[start:stop]
+
+
+def read_records(file_name: str, positions: range, index: List[Tuple[int, int]]) -> Iterator[Union[bytes, memoryview]]:
+    """
+    Yield the raw bytes of the records at the given positions.
+
+    The records of an uncompressed file are memoryview slices of the mapped file, only they are read from the disk.
+    """
+    view = map_xdr_file(file_name)
+    if view is not None:
+        for position in positions:
+            offset, length = index[position]
+            if offset + length > len(view):
+                raise EOFError('Truncated record')
+            yield view[offset:offset + length]
+        return
+
+    with open_xdr_file(file_name) as xdr_file:
+        for position in positions:
+            offset, length = index[position]
+            xdr_file.seek(offset)
+            yield xdr_file.read(length)
+
+
+def unpack_records(file_name: str, start: int, stop: int = None, index: List[Tuple[int, int]] = None,
+                   network_hash: bytes = None, selection: dict = None, record_filter: RecordFilter = None) -> List:
+    """Unpack only the records in the range [start, stop) of a file, see iter_unpack_records for the options."""
+    if index is None:
+        index = build_index(file_name)
+
+    records = read_records(file_name, select_records(index, start, stop), index)
+    return list(iter_unpack_records(records, get_file_type(file_name), network_hash, selection, record_filter))
+
+
+def parse_records(file_name: str, start: int, stop: int = None, index: List[Tuple[int, int]] = None,
+                  raw_amount: bool = False, with_hash: bool = False, network_id: str = None,
+                  fields: List[str] = None, record_filter: RecordFilter = None,
+                  amount_format: str = None) -> List[dict]:
+    """Unpack and parse only the records in the range [start, stop) of a file."""
+    network_hash = get_network_hash(network_id) if with_hash else None
+    selection = compile_fields(fields) if fields else None
+
+    unpacked = unpack_records(file_name, start, stop, index, network_hash, selection, record_filter)
+    return [parse_unpacked(unpacked_struct, position, raw_amount=raw_amount, selection=selection,
+                           amount_format=amount_format)
+            for position, unpacked_struct in enumerate(unpacked)]
@@ -0,0 +1,45 @@
+"""Contains methods to join a transactions file with the results file of the same checkpoint."""
+from typing import Iterator
+
+from xdrparser.parser import get_file_type, get_network_hash, iter_unpack, parse_unpacked
+
+
+def iter_parse_joined(transactions_file: str, results_file: str, network_id: str,
+                      raw_amount: bool = False, amount_format: str = None) -> Iterator[dict]:
+    """
+    Parse a transactions file and its results file together, yielding one ledger at a time.
+
+    Both files are streamed ledger by ledger, so only a single ledger of each file is kept in memory.
+    Every parsed transaction gets a 'result' with its TransactionResult,
+    matched by the transaction hash that is calculated with 'network_id',
+    a transaction without a result in the results file gets a 'result' of None.
+    """
+    if get_file_type(transactions_file) != 'transactions' or get_file_type(results_file) != 'results':
+        raise ValueError('Expected a transactions file and a results file')
+    if transactions_file.split('-')[-1][:8] != results_file.split('-')[-1][:8]:
+        raise ValueError('The transactions file and the results file are not of the same checkpoint')
+
+    results = iter_unpack(results_file)
+    result_entry = next(results, None)
+    for index, transaction_entry in enumerate(iter_unpack(transactions_file, get_network_hash(network_id))):
+        # Both files are ordered by ledger, but a ledger can be missing from either of them
+        while result_entry is not None and result_entry.ledgerSeq < transaction_entry.ledgerSeq:
+            result_entry = next(results, None)
+
+        transaction_results = {}
+        if result_entry is not None and result_entry.ledgerSeq == transaction_entry.ledgerSeq:
+            parsed_results = parse_unpacked(result_entry, index, raw_amount=raw_amount, amount_format=amount_format)
+            transaction_results = {result_pair['transactionHash']: result_pair['result']
+                                   for result_pair in parsed_results['txResultSet']['results']}
+
+        parsed = parse_unpacked(transaction_entry, index, raw_amount=raw_amount, amount_format=amount_format)
+        for transaction in parsed['txSet']['txs']:
+            transaction['result'] = transaction_results.get(transaction['hash'])
+        yield parsed
+
+
+def parse_joined(transactions_file: str, results_file: str, network_id: str, raw_amount: bool = False,
+                 amount_format: str = None) -> list:
+    """Parse a transactions file and its results file together."""
+    return list(iter_parse_joined(transactions_file, results_file, network_id, raw_amount=raw_amount,
+                                  amount_format=amount_format))
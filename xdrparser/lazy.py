@@ -0,0 +1,509 @@
+"""
+Contains lazy views of the structures in history files, which only unpack the fields that are accessed.
+
+The layout of every view is a list of its fields, where the type of a field is one of:
+the name of a type the xdr unpacker has a method for, such as 'uint32' or 'Memo',
+a variable length array of such a type, such as 'Operation[]', or a fixed length array, such as 'Hash[4]',
+EXT for the extension point at the end of many structures,
+another view type, or a LazyArray of views.
+"""
+import struct
+from collections import namedtuple
+from collections.abc import Sequence
+from functools import lru_cache
+from hashlib import sha256
+from operator import methodcaller
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+
+from kin_base.stellarxdr import StellarXDR_const as const
+from kin_base.stellarxdr.StellarXDR_pack import XDRError, nullclass
+
+from xdrparser.parser import HistoryUnpacker, LIST_ITEM, PACKED_ENVELOP_TYPE, get_converter, get_file_type, \
+    hash_envelopes, iter_file_records
+
+# The type of the extension point at the end of many structures, which has no unpacker method of its own
+EXT = 'Ext'
+
+# The size of the types that are always packed to the same amount of bytes,
+# an account id is a union, but ed25519 keys are its only arm
+FIXED_SIZES = {'int32': 4, 'uint32': 4, 'int64': 8, 'uint64': 8, 'SequenceNumber': 8, 'Hash': 32, 'AccountID': 36}
+
+UINT = struct.Struct('>I')
+
+
+# The compiled fields of a view type: the index of every field by its name,
+# the offsets of the fields at a fixed offset, and the (name, size, decoder, skipper) of every field
+Layout = namedtuple('Layout', ['indexes', 'fixed_offsets', 'fields'])
+
+
+class LazyArray:
+    """The type of a field that is a variable length array of views."""
+
+    def __init__(self, item_type: type):
+        self.item_type = item_type
+
+
+class RecordSource:
+    """The record that views are unpacked from, with the unpacker that is shared by all of its views."""
+
+    __slots__ = ('data', 'network_hash', '_unpacker')
+
+    def __init__(self, data: bytes, network_hash: bytes = None):
+        self.data = data
+        self.network_hash = network_hash
+        self._unpacker = None
+
+    def get_unpacker(self, position: int) -> HistoryUnpacker:
+        """Return an unpacker of the record at a position."""
+        if self._unpacker is None:
+            self._unpacker = HistoryUnpacker(self.data)
+        self._unpacker.set_position(position)
+        return self._unpacker
+
+
+class LazyStruct:
+    """
+    A view of an xdr structure in a record, that unpacks every field on first access and keeps it.
+
+    Fields at a fixed offset from the start of the structure are found right away, without walking the record.
+    Finding a field after variable length fields walks over them, types in SKIPPERS are skipped without decoding them,
+    and the rest are decoded and kept.
+    """
+
+    # The (name, type) of every field, in the order they are packed
+    FIELDS = ()
+    # The type name of the whole structure, that the unpacker has a method for
+    TYPE_NAME = None
+
+    __slots__ = ('_source', '_keys', '_offsets', '_values')
+
+    def __init__(self, source: RecordSource, offset: int, keys: tuple = ('', LIST_ITEM)):
+        self._source = source
+        # The (parent key, key) of the structure, which affects how it is converted
+        self._keys = keys
+        self._offsets = [offset + field_offset for field_offset in get_layout(type(self)).fixed_offsets]
+        self._values = {}
+
+    def __getattr__(self, name: str):
+        index = get_layout(type(self)).indexes.get(name) if not name.startswith('_') else None
+        if index is None:
+            raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+        try:
+            return self._values[name]
+        except KeyError:
+            return self._decode(index)
+
+    def __dir__(self):
+        return list(super(LazyStruct, self).__dir__()) + [name for name, _ in self.FIELDS]
+
+    def __repr__(self):
+        return '<{} at {}>'.format(type(self).__name__, self._offsets[0])
+
+    def unpack(self) -> Any:
+        """Unpack the whole structure with the xdr unpacker, including the hashes of its transactions."""
+        source = self._source
+        unpacker = HistoryUnpacker(source.data)
+        unpacker.set_position(self._offsets[0])
+        unpacked = getattr(unpacker, 'unpack_' + self.TYPE_NAME)()
+        if source.network_hash is not None:
+            hash_envelopes(self._get_envelopes(unpacked), source.data, unpacker.transaction_spans, source.network_hash)
+        return unpacked
+
+    def to_dict(self, raw_amount: bool = False, amount_format: str = None) -> Union[dict, list]:
+        """Convert the whole structure, the same as todict converts the unpacked structure."""
+        return get_converter(raw_amount, amount_format).convert(self.unpack(), *self._keys)
+
+    def _get_envelopes(self, unpacked: Any) -> Iterable:
+        """Return the transaction envelopes in the unpacked structure, which get hashes."""
+        return ()
+
+    def _get_offset(self, index: int) -> int:
+        """Return the offset of a field, finding the end of every field before it that was not found yet."""
+        offsets = self._offsets
+        if index < len(offsets):
+            return offsets[index]
+
+        fields = get_layout(type(self)).fields
+        values = self._values
+        position = offsets[-1]
+        for field_index in range(len(offsets) - 1, index):
+            name, size, decoder, skipper = fields[field_index]
+            if size is not None:
+                position += size
+            elif decoder is None:
+                # A view, which does not know where it ends until it is walked
+                value = values[name] if name in values else self._decode(field_index)
+                position = value._end()
+            elif skipper is not None and name not in values:
+                position = skipper(self._source.data, position)
+                if position > len(self._source.data):
+                    raise EOFError('Truncated record, {} ends after the end of the record'.format(name))
+            else:
+                unpacker = self._source.get_unpacker(position)
+                values[name] = decoder(unpacker)
+                position = unpacker.get_position()
+            offsets.append(position)
+        return position
+
+    def _decode(self, index: int) -> Any:
+        """Decode a field and keep it."""
+        name, field_type = self.FIELDS[index]
+        offset = self._get_offset(index)
+        if type(field_type) is str:
+            unpacker = self._source.get_unpacker(offset)
+            value = get_field_decoder(field_type)(unpacker)
+            if len(self._offsets) == index + 1:
+                self._offsets.append(unpacker.get_position())
+        elif isinstance(field_type, LazyArray):
+            value = LazyList(self._source, offset, field_type.item_type, (name, LIST_ITEM))
+        else:
+            value = field_type(self._source, offset, (self._keys[1], name))
+
+        self._values[name] = value
+        return value
+
+    def _end(self) -> int:
+        """Return the offset where the structure ends."""
+        return self._get_offset(len(self.FIELDS))
+
+
+class LazyList(Sequence):
+    """A view of a variable length array of structures, which are found as they are accessed."""
+
+    __slots__ = ('_source', '_offset', '_item_type', '_keys', '_length', '_items')
+
+    def __init__(self, source: RecordSource, offset: int, item_type: type, keys: tuple):
+        self._source = source
+        self._offset = offset
+        self._item_type = item_type
+        self._keys = keys
+        self._length = UINT.unpack_from(source.data, offset)[0]
+        self._items = []
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self[item_index] for item_index in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('list index out of range')
+
+        items = self._items
+        while len(items) <= index:
+            # Every item starts where the one before it ends
+            offset = items[-1]._end() if items else self._offset + 4
+            items.append(self._item_type(self._source, offset, self._keys))
+        return items[index]
+
+    def __repr__(self):
+        return '<{} of {} {}>'.format(type(self).__name__, self._length, self._item_type.__name__)
+
+    def _end(self) -> int:
+        """Return the offset where the array ends."""
+        return self[-1]._end() if self._length else self._offset + 4
+
+
+class LazyTransaction(LazyStruct):
+    __slots__ = ()
+    TYPE_NAME = 'Transaction'
+    FIELDS = (('sourceAccount', 'AccountID'), ('fee', 'uint32'), ('seqNum', 'SequenceNumber'),
+              ('timeBounds', 'TimeBounds[]'), ('memo', 'Memo'), ('operations', 'Operation[]'), ('ext', EXT))
+
+
+class LazyTransactionEnvelope(LazyStruct):
+    """A view of a transaction envelope, which also has a 'hash' if its record source has a network hash."""
+
+    __slots__ = ()
+    TYPE_NAME = 'TransactionEnvelope'
+    FIELDS = (('tx', LazyTransaction), ('signatures', 'DecoratedSignature[]'))
+
+    @property
+    def hash(self) -> bytes:
+        """The hash of the transaction, calculated over the bytes it is packed in."""
+        source = self._source
+        if source.network_hash is None:
+            raise AttributeError('Transaction hashes need a network hash')
+        if 'hash' not in self._values:
+            start = self._offsets[0]
+            self._values['hash'] = sha256(
+                source.network_hash + PACKED_ENVELOP_TYPE + source.data[start:self.tx._end()]).digest()
+        return self._values['hash']
+
+    def _get_envelopes(self, unpacked: Any) -> Iterable:
+        return unpacked,
+
+
+class LazyTransactionSet(LazyStruct):
+    __slots__ = ()
+    TYPE_NAME = 'TransactionSet'
+    FIELDS = (('previousLedgerHash', 'Hash'), ('txs', LazyArray(LazyTransactionEnvelope)))
+
+    def _get_envelopes(self, unpacked: Any) -> Iterable:
+        return unpacked.txs
+
+
+class LazyTransactionHistoryEntry(LazyStruct):
+    __slots__ = ()
+    TYPE_NAME = 'TransactionHistoryEntry'
+    FIELDS = (('ledgerSeq', 'uint32'), ('txSet', LazyTransactionSet), ('ext', EXT))
+
+    def _get_envelopes(self, unpacked: Any) -> Iterable:
+        return unpacked.txSet.txs
+
+
+class LazyTransactionResultPair(LazyStruct):
+    __slots__ = ()
+    TYPE_NAME = 'TransactionResultPair'
+    FIELDS = (('transactionHash', 'Hash'), ('result', 'TransactionResult'))
+
+
+class LazyTransactionResultSet(LazyStruct):
+    __slots__ = ()
+    TYPE_NAME = 'TransactionResultSet'
+    FIELDS = (('results', LazyArray(LazyTransactionResultPair)),)
+
+
+class LazyTransactionHistoryResultEntry(LazyStruct):
+    __slots__ = ()
+    TYPE_NAME = 'TransactionHistoryResultEntry'
+    FIELDS = (('ledgerSeq', 'uint32'), ('txResultSet', LazyTransactionResultSet), ('ext', EXT))
+
+
+class LazyLedgerHeader(LazyStruct):
+    __slots__ = ()
+    TYPE_NAME = 'LedgerHeader'
+    FIELDS = (('ledgerVersion', 'uint32'), ('previousLedgerHash', 'Hash'), ('scpValue', 'StellarValue'),
+              ('txSetResultHash', 'Hash'), ('bucketListHash', 'Hash'), ('ledgerSeq', 'uint32'),
+              ('totalCoins', 'int64'), ('feePool', 'int64'), ('inflationSeq', 'uint32'), ('idPool', 'uint64'),
+              ('baseFee', 'uint32'), ('baseReserve', 'uint32'), ('maxTxSetSize', 'uint32'), ('skipList', 'Hash[4]'),
+              ('ext', EXT))
+
+
+class LazyLedgerHeaderHistoryEntry(LazyStruct):
+    __slots__ = ()
+    TYPE_NAME = 'LedgerHeaderHistoryEntry'
+    FIELDS = (('hash', 'Hash'), ('header', LazyLedgerHeader), ('ext', EXT))
+
+
+# The view of the structures in every file type, bucket and scp files have unions at the top which are not supported
+LAZY_TYPES = {
+    'ledger': LazyLedgerHeaderHistoryEntry,
+    'transactions': LazyTransactionHistoryEntry,
+    'results': LazyTransactionHistoryResultEntry,
+}
+
+
+@lru_cache(maxsize=None)
+def get_layout(lazy_type: type) -> Layout:
+    """Compile the fields of a view type to its layout."""
+    indexes = {name: index for index, (name, _) in enumerate(lazy_type.FIELDS)}
+    fixed_offsets = [0]
+    for _, field_type in lazy_type.FIELDS:
+        if field_type not in FIXED_SIZES:
+            break
+        fixed_offsets.append(fixed_offsets[-1] + FIXED_SIZES[field_type])
+
+    fields = []
+    for name, field_type in lazy_type.FIELDS:
+        if type(field_type) is not str:
+            fields.append((name, None, None, None))
+        else:
+            fields.append((name, FIXED_SIZES.get(field_type), get_field_decoder(field_type),
+                           SKIPPERS.get(field_type)))
+    return Layout(indexes, fixed_offsets, fields)
+
+
+@lru_cache(maxsize=None)
+def get_field_decoder(field_type: str) -> Callable[[HistoryUnpacker], Any]:
+    """Return the method that decodes a field type with an unpacker."""
+    if field_type == EXT:
+        return unpack_ext
+    if field_type.endswith(']'):
+        item_type, length = field_type[:-1].split('[')
+        unpack_item = methodcaller('unpack_' + item_type)
+        if length:
+            return lambda unpacker: unpacker.unpack_farray(int(length), lambda: unpack_item(unpacker))
+        return lambda unpacker: unpacker.unpack_array(lambda: unpack_item(unpacker))
+    return methodcaller('unpack_' + field_type)
+
+
+def unpack_ext(unpacker: HistoryUnpacker) -> Any:
+    """Unpack an extension point, which only has a version 0 without any data."""
+    ext = nullclass()
+    ext.v = unpacker.unpack_int()
+    if ext.v != 0:
+        raise XDRError('bad switch=%s' % ext.v)
+    return ext
+
+
+def skip_opaque(data: bytes, position: int) -> int:
+    """Return the end of a variable length opaque or string, which is padded to a multiple of 4 bytes."""
+    return position + 4 + (UINT.unpack_from(data, position)[0] + 3) // 4 * 4
+
+
+def skip_optional(data: bytes, position: int, size: int) -> int:
+    """Return the end of an optional value of a fixed size."""
+    return position + 4 + UINT.unpack_from(data, position)[0] * size
+
+
+def skip_asset(data: bytes, position: int) -> int:
+    """Return the end of an Asset."""
+    asset_type = UINT.unpack_from(data, position)[0]
+    if asset_type == const.ASSET_TYPE_NATIVE:
+        return position + 4
+    if asset_type == const.ASSET_TYPE_CREDIT_ALPHANUM4:
+        return position + 4 + 4 + 36
+    if asset_type == const.ASSET_TYPE_CREDIT_ALPHANUM12:
+        return position + 4 + 12 + 36
+    raise XDRError('bad switch=%s' % asset_type)
+
+
+def skip_path_payment(data: bytes, position: int) -> int:
+    # sendAsset, sendMax, destination, destAsset, destAmount and the path of assets
+    position = skip_asset(data, skip_asset(data, position) + 8 + 36) + 8
+    path_length = UINT.unpack_from(data, position)[0]
+    position += 4
+    for _ in range(path_length):
+        position = skip_asset(data, position)
+    return position
+
+
+def skip_set_options(data: bytes, position: int) -> int:
+    # inflationDest, then clearFlags, setFlags, masterWeight and the three thresholds
+    position = skip_optional(data, position, 36)
+    for _ in range(6):
+        position = skip_optional(data, position, 4)
+    # homeDomain
+    if UINT.unpack_from(data, position)[0]:
+        position = skip_opaque(data, position + 4)
+    else:
+        position += 4
+    # signer, a key union of 32 bytes and a weight
+    return skip_optional(data, position, 4 + 32 + 4)
+
+
+def skip_allow_trust(data: bytes, position: int) -> int:
+    # trustor, the asset code union and authorize
+    asset_type = UINT.unpack_from(data, position + 36)[0]
+    if asset_type == const.ASSET_TYPE_CREDIT_ALPHANUM4:
+        return position + 36 + 4 + 4 + 4
+    if asset_type == const.ASSET_TYPE_CREDIT_ALPHANUM12:
+        return position + 36 + 4 + 12 + 4
+    raise XDRError('bad switch=%s' % asset_type)
+
+
+def skip_manage_data(data: bytes, position: int) -> int:
+    # dataName and an optional dataValue
+    position = skip_opaque(data, position)
+    if UINT.unpack_from(data, position)[0]:
+        return skip_opaque(data, position + 4)
+    return position + 4
+
+
+# The method that returns the end of the body of every operation type
+OPERATION_SKIPPERS = {
+    const.CREATE_ACCOUNT: lambda data, position: position + 36 + 8,
+    const.PAYMENT: lambda data, position: skip_asset(data, position + 36) + 8,
+    const.PATH_PAYMENT: skip_path_payment,
+    const.MANAGE_OFFER: lambda data, position: skip_asset(data, skip_asset(data, position)) + 8 + 8 + 8,
+    const.CREATE_PASSIVE_OFFER: lambda data, position: skip_asset(data, skip_asset(data, position)) + 8 + 8,
+    const.SET_OPTIONS: skip_set_options,
+    const.CHANGE_TRUST: lambda data, position: skip_asset(data, position) + 8,
+    const.ALLOW_TRUST: skip_allow_trust,
+    const.ACCOUNT_MERGE: lambda data, position: position + 36,
+    const.INFLATION: lambda data, position: position,
+    const.MANAGE_DATA: skip_manage_data,
+    const.BUMP_SEQUENCE: lambda data, position: position + 8,
+}
+
+
+def skip_operations(data: bytes, position: int) -> int:
+    """Return the end of an array of operations."""
+    count = UINT.unpack_from(data, position)[0]
+    position += 4
+    for _ in range(count):
+        # The optional source account, then the operation type
+        position = skip_optional(data, position, 36)
+        operation_type = UINT.unpack_from(data, position)[0]
+        try:
+            skip_body = OPERATION_SKIPPERS[operation_type]
+        except KeyError:
+            raise XDRError('bad switch=%s' % operation_type)
+        position = skip_body(data, position + 4)
+    return position
+
+
+def skip_memo(data: bytes, position: int) -> int:
+    """Return the end of a Memo."""
+    memo_type = UINT.unpack_from(data, position)[0]
+    if memo_type == const.MEMO_NONE:
+        return position + 4
+    if memo_type == const.MEMO_TEXT:
+        return skip_opaque(data, position + 4)
+    if memo_type == const.MEMO_ID:
+        return position + 4 + 8
+    if memo_type in (const.MEMO_HASH, const.MEMO_RETURN):
+        return position + 4 + 32
+    raise XDRError('bad switch=%s' % memo_type)
+
+
+def skip_signatures(data: bytes, position: int) -> int:
+    """Return the end of an array of decorated signatures, each is a 4 bytes hint and a variable length signature."""
+    count = UINT.unpack_from(data, position)[0]
+    position += 4
+    for _ in range(count):
+        position = skip_opaque(data, position + 4)
+    return position
+
+
+# Types that are walked over without being decoded, when a field after them is accessed,
+# by the method that returns the end of a value of the type
+SKIPPERS = {
+    'TimeBounds[]': lambda data, position: skip_optional(data, position, 16),
+    'Memo': skip_memo,
+    'Operation[]': skip_operations,
+    'DecoratedSignature[]': skip_signatures,
+}
+
+
+def get_lazy_type(file_type: str) -> type:
+    """Return the view of the structures in a file type."""
+    try:
+        return LAZY_TYPES[file_type]
+    except KeyError:
+        raise ValueError('Lazy views are not supported for {} files'.format(file_type))
+
+
+def iter_lazy_records(records: Iterable[Union[bytes, memoryview]], file_type: str,
+                      network_hash: Optional[bytes] = None) -> Iterator[LazyStruct]:
+    """
+    Yield a lazy view of every record of a file type.
+
+    If 'network_hash' is given, the transaction envelopes of a transactions file have a 'hash'.
+    """
+    lazy_type = get_lazy_type(file_type)
+    for record in records:
+        # The views slice the record, which should be bytes and not a view of a mapped file
+        if type(record) is not bytes:
+            record = bytes(record)
+        yield lazy_type(RecordSource(record, network_hash), 0)
+
+
+def iter_lazy(file_name: str, network_hash: bytes = None) -> Iterator[LazyStruct]:
+    """
+    Yield a lazy view of every structure in a file, which only unpacks the fields that are accessed.
+
+    For example, only the ledger sequence and the source accounts are decoded when scanning them:
+
+        for entry in iter_lazy('transactions-0043733f.xdr.gz'):
+            sources = [envelope.tx.sourceAccount for envelope in entry.txSet.txs]
+
+    Call to_dict on a view to convert the whole structure, like parse does.
+    """
+    file_type = get_file_type(file_name)
+    get_lazy_type(file_type)
+    return iter_lazy_records(iter_file_records(file_name), file_type, network_hash)
@@ -0,0 +1,135 @@
+"""Contains a persistent manifest of the processed history files, to only process new or changed files of an archive."""
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from hashlib import sha256
+from typing import Iterable, Iterator, Optional, Tuple
+
+from xdrparser import archive, parser
+
+# The state of a file when it was processed: its size in bytes, its modification time in nanoseconds,
+# the sha256 of its content and the amount of records that were processed
+FileState = namedtuple('FileState', ['file_name', 'size', 'mtime', 'content_hash', 'records'])
+
+# Files are hashed in chunks, so memory does not grow with the file size
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    file_name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    records INTEGER NOT NULL,
+    processed_at REAL NOT NULL
+)
+'''
+
+
+def hash_file(file_name: str) -> str:
+    """Return the hex sha256 of the content of a file."""
+    content_hash = sha256()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def get_file_state(file_name: str, records: int = 0) -> FileState:
+    """Return the current state of a file, its name is made absolute so it does not depend on the working directory."""
+    file_name = os.path.abspath(file_name)
+    stat = os.stat(file_name)
+    return FileState(file_name, stat.st_size, stat.st_mtime_ns, hash_file(file_name), records)
+
+
+class Manifest:
+    """
+    A persistent record of the files that were processed, kept in an SQLite database.
+
+    A file is processed if its size and modification time did not change since it was recorded.
+    A file that was only touched, so that its modification time changed but its content hash did not,
+    is still processed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(SCHEMA)
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the database."""
+        self._connection.close()
+
+    def get(self, file_name: str) -> Optional[FileState]:
+        """Return the recorded state of a file, or None if it was never processed."""
+        row = self._connection.execute('SELECT file_name, size, mtime, content_hash, records FROM files '
+                                       'WHERE file_name = ?', (os.path.abspath(file_name),)).fetchone()
+        return FileState(*row) if row is not None else None
+
+    def get_pending_state(self, file_name: str) -> Optional[FileState]:
+        """Return the current state of a file if it is new or changed since it was processed, otherwise None."""
+        recorded = self.get(file_name)
+        if recorded is not None:
+            stat = os.stat(file_name)
+            if stat.st_size == recorded.size and stat.st_mtime_ns == recorded.mtime:
+                return None
+
+        state = get_file_state(file_name)
+        if recorded is not None and (state.size, state.content_hash) == (recorded.size, recorded.content_hash):
+            # Only the modification time changed, remember it so the file is not hashed again
+            self.record(state._replace(records=recorded.records))
+            return None
+        return state
+
+    def record(self, state: FileState):
+        """Record that a file was processed, with its state from before it was processed."""
+        self._connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                                 tuple(state) + (time.time(),))
+        self._connection.commit()
+
+    def iter_states(self) -> Iterator[FileState]:
+        """Yield the recorded state of every processed file."""
+        for row in self._connection.execute('SELECT file_name, size, mtime, content_hash, records FROM files '
+                                            'ORDER BY file_name'):
+            yield FileState(*row)
+
+
+def iter_pending_files(paths: Iterable[str], manifest: Manifest) -> Iterator[FileState]:
+    """
+    Yield the state of every new or changed history file in the given paths, in ledger order.
+
+    The paths are searched like archive.find_history_files.
+    Record the state of a file in the manifest once it was processed.
+    """
+    for file_name in sorted(archive.find_history_files(paths), key=archive.get_ledger_order):
+        state = manifest.get_pending_state(file_name)
+        if state is not None:
+            yield state
+
+
+def iter_incremental(paths: Iterable[str], manifest: Manifest, **parse_options) -> Iterator[Tuple[str, dict]]:
+    """
+    Parse the new or changed history files in the given paths in ledger order, yielding (file name, parsed record).
+
+    'parse_options' are passed to parser.iter_parse, transaction hashes are only calculated for transactions files.
+    A file is recorded in the manifest after its last record was consumed, so the iteration can be stopped at any
+    point, and a later iteration resumes with the first file that was not fully consumed, from its start.
+    """
+    for state in iter_pending_files(paths, manifest):
+        file_options = parse_options
+        if parser.get_file_type(state.file_name) != 'transactions':
+            file_options = dict(parse_options, with_hash=False)
+
+        records = 0
+        for parsed in parser.iter_parse(state.file_name, **file_options):
+            yield state.file_name, parsed
+            records += 1
+        manifest.record(state._replace(records=records))
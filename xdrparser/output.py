@@ -0,0 +1,70 @@
+"""Contains methods to serialize parsed xdr files."""
+import json
+from decimal import Decimal
+from typing import Any, BinaryIO, Callable, Iterable
+
+# orjson is used to encode json lines when it is installed
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# Formats that export typed columns with the columns module, which requires numpy
+COLUMNAR_FORMATS = ('npz', 'parquet')
+
+
+class DecimalEncoder(json.JSONEncoder):
+    """
+    Json encoder that encodes Decimals as strings
+    """
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return str(o)
+        return super(DecimalEncoder, self).default(o)
+
+
+def encode_default(o: Any) -> str:
+    """
+    Encode the values json does not support, Decimal amounts are the only expected ones.
+
+    This is called back for every Decimal, parse amounts with the 'string' format to avoid it.
+    """
+    if type(o) is Decimal:
+        return str(o)
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(o).__name__))
+
+
+def get_line_encoder(accelerated: bool = True) -> Callable[[Any], bytes]:
+    """
+    Return a method that encodes an object to a compact json line.
+
+    If 'accelerated' is set and orjson is installed it is used, otherwise the standard library encoder is used.
+    Both produce the same output.
+    """
+    if accelerated and orjson is not None:
+        options = orjson.OPT_APPEND_NEWLINE
+
+        def encode_line(obj: Any) -> bytes:
+            return orjson.dumps(obj, default=encode_default, option=options)
+    else:
+        # Without an indent, the standard library uses its C encoder
+        encoder = json.JSONEncoder(default=encode_default, separators=(',', ':'), ensure_ascii=False)
+
+        def encode_line(obj: Any) -> bytes:
+            return (encoder.encode(obj) + '\n').encode()
+
+    return encode_line
+
+
+def write_jsonl(records: Iterable[Any], output: BinaryIO, accelerated: bool = True) -> int:
+    """
+    Write every record as a json line as soon as it is produced, and return the amount of records written.
+
+    The output stream should be buffered, such as a file opened with 'wb' or sys.stdout.buffer.
+    """
+    encode_line = get_line_encoder(accelerated)
+    count = 0
+    for record in records:
+        output.write(encode_line(record))
+        count += 1
+    return count
@@ -1,38 +1,124 @@
 """Contains methods to decode and parse stellar's history xdr files."""
 
 import gzip
+import mmap
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
 from hashlib import sha256
+from time import perf_counter
 import base64
-from decimal import Decimal, getcontext
-from typing import List, Any
+from decimal import Context, Decimal
+from functools import lru_cache
+from typing import List, Any, BinaryIO, Callable, Iterable, Iterator, Optional, Tuple, Union
 
 from kin_base.stellarxdr import Xdr
 from kin_base.stellarxdr import StellarXDR_const
 from kin_base.stellarxdr.StellarXDR_type import Transaction
 from kin_base import utils
 
+from xdrparser.decompress import open_pipelined
+from xdrparser.errors import RecordCountError
+from xdrparser.filters import RecordFilter
+from xdrparser.pool import submit_bounded
+from xdrparser.stats import ParseStats
+
 
 # This is needed in order to calculate transaction hash.
 # It is the xdr representation of XDR.const.ENVELOP_TYPE_TX (2)
 PACKED_ENVELOP_TYPE = b'\x00\x00\x00\x02'
 
+# The lower 31 bits of a record mark hold the length of the record that follows it,
+# and the high bit marks the last fragment, every structure in a history file is a single, last, fragment
+RECORD_LENGTH_MASK = 0x7fffffff
+LAST_FRAGMENT = 0x80000000
+
+# When parsing in parallel, records are sent to the worker processes in chunks of about this many bytes
+PARALLEL_CHUNK_SIZE = 256 * 1024
+
 # Each asset amount is encoded as a signed 64-bit integer in the XDR structures.
-# An asset amount unit (that which is seen by end users) is scaled down by a factor of ten million (10,000,000)
-# to arrive at the native 64-bit integer representation.
+# An asset amount unit (that which is seen by end users) is scaled down by the scale factor of kin_base
+# to arrive at the native 64-bit integer representation, a hundred thousand (100,000) on Kin.
 # https://www.stellar.org/developers/guides/concepts/assets.html#amount-precision-and-representation
 from kin_base.operation import ONE as AMOUNT_SCALE_FACTOR
-getcontext().prec = 5
+AMOUNT_SCALE = int(AMOUNT_SCALE_FACTOR)
+
+# The amount of decimal places of an exact amount, the scale is always a power of ten
+AMOUNT_DIGITS = len(str(AMOUNT_SCALE)) - 1
+assert AMOUNT_SCALE == 10 ** AMOUNT_DIGITS, 'The amount scale {} is not a power of ten'.format(AMOUNT_SCALE)
+
+# Decimal amounts are rounded to 5 significant digits in their own context,
+# instead of changing the global decimal context of the process
+AMOUNT_CONTEXT = Context(prec=5)
+
+# How amounts are parsed: 'decimal' is a rounded Decimal, 'raw' is the int amount in stroops,
+# and 'string' is the exact amount as a fixed point string
+AMOUNT_FORMATS = ('decimal', 'raw', 'string')
+
+# The default amount of account and hint encodings that are cached,
+# in history files most of them belong to a small amount of busy accounts
+DEFAULT_CACHE_SIZE = 8192
+
+# Marks a list item in the path of a value, the index of an item does not affect how it is parsed
+LIST_ITEM = '[]'
 
+# The shared converters, by their options
+_converters = {}
 
-def init_unpacker(data: bytes) -> (Xdr.StellarXDRUnpacker, dict):
+# Marks a key that is missing from a selection
+NOT_SELECTED = object()
+
+# The path of the transaction signatures in a TransactionHistoryEntry
+SIGNATURES_PATH = ('txSet', 'txs', LIST_ITEM, 'signatures')
+
+
+class HistoryUnpacker(Xdr.StellarXDRUnpacker):
+    """
+    Stellar's xdr unpacker, that also records where every transaction it unpacks is located in the buffer.
+
+    This allows the transaction hashes to be calculated from the original bytes, without packing them again.
+    """
+
+    def __init__(self, data: bytes, skip_signatures: bool = False):
+        self.transaction_spans = []
+        self.skip_signatures = skip_signatures
+        super(HistoryUnpacker, self).__init__(data)
+
+    def reset(self, data: bytes):
+        """Start unpacking a new buffer."""
+        super(HistoryUnpacker, self).reset(data)
+        self.transaction_spans = []
+
+    def unpack_Transaction(self):
+        """Unpack a transaction and record its (start, end) position."""
+        start = self.get_position()
+        transaction = super(HistoryUnpacker, self).unpack_Transaction()
+        self.transaction_spans.append((start, self.get_position()))
+        return transaction
+
+    def unpack_DecoratedSignature(self):
+        """Unpack a decorated signature, or skip over it without decoding it if 'skip_signatures' is set."""
+        if not self.skip_signatures:
+            return super(HistoryUnpacker, self).unpack_DecoratedSignature()
+
+        # A decorated signature is a 4 bytes hint followed by a variable length signature,
+        # which is padded to a multiple of 4 bytes
+        self.set_position(self.get_position() + 4)
+        length = self.unpack_uint()
+        self.set_position(self.get_position() + (length + 3) // 4 * 4)
+        return None
+
+
+def init_unpacker(data: bytes, selection: dict = None) -> (HistoryUnpacker, dict):
     """
     Initialize the stellar xdr unpacker.
 
     Return an unpacker with the received data as buffer
     and the relevant methods that should be used for each file type.
+    If a selection from compile_fields is given, structures that are not selected are skipped where possible.
     https://github.com/stellar/stellar-core/blob/master/docs/history.md#individual-file-contents
     """
-    unpacker = Xdr.StellarXDRUnpacker(data)
+    unpacker = HistoryUnpacker(data, skip_signatures=not is_selected(selection, SIGNATURES_PATH))
     unpacker_methods = {
         'bucket': unpacker.unpack_BucketEntry,
         'ledger': unpacker.unpack_LedgerHeaderHistoryEntry,
@@ -44,122 +130,592 @@ def init_unpacker(data: bytes) -> (Xdr.StellarXDRUnpacker, dict):
     return unpacker, unpacker_methods
 
 
-def unpack_file(file_name: str) -> List:
-    """Unpack an xdr file."""
-    # xdr files are always gzipped in the archive, unzip it if the user didn't do it yet
-    if file_name.endswith('.gz'):
-        with gzip.open(file_name) as gzippedfile:
-            data = gzippedfile.read()
-    else:
-        with open(file_name, 'rb') as xdr_file:
-            data = xdr_file.read()
-
-    # Get the file type from the file name
-    # 'path/to/ledger-00abc53f.xdr' > 'ledger'
-    # or 'path\to\ledger-00abc53f.xdr' > 'ledger on a Windows os
+def iter_unpack_records(records: Iterable[Union[bytes, memoryview]], file_type: str, network_hash: bytes = None,
+                        selection: dict = None, record_filter: RecordFilter = None,
+                        stats: ParseStats = None) -> Iterator:
+    """
+    Unpack records of a file type, yielding one structure at a time.
+
+    If 'network_hash' is given, the hash of every transaction is calculated as well.
+    If 'selection' is given, structures that are not selected are skipped where possible.
+    If 'record_filter' is given, records and transactions that do not match it are dropped before they are parsed.
+    If 'stats' is given, the unpack and hash stages are measured.
+    """
+    # Init the unpacker and get the relevant method for unpacking
+    unpacker, unpacker_methods = init_unpacker(b'', selection)
+    unpack_struct = unpacker_methods.get(file_type)
+
+    # Every stage is timed only if it is measured, so parsing without stats is not slowed down
+    measured = stats is not None
+    unpack_seconds = hash_seconds = 0.0
+    unpacked_records = unpacked_bytes = hashed_transactions = hashed_bytes = 0
+    try:
+        for record in records:
+            if measured:
+                start = perf_counter()
+            # The unpacker returns slices of its buffer, which should be bytes and not views of a mapped file
+            if type(record) is not bytes:
+                record = bytes(record)
+            if measured:
+                unpacked_records += 1
+                unpacked_bytes += len(record)
+            if record_filter is not None and not record_filter.match_record(record, file_type):
+                if measured:
+                    unpack_seconds += perf_counter() - start
+                continue
+
+            unpacker.reset(record)
+            unpacked = unpack_struct()
+            if measured:
+                unpack_seconds += perf_counter() - start
+
+            if network_hash is not None:
+                if measured:
+                    start = perf_counter()
+                hash_transactions(unpacked, record, unpacker.transaction_spans, network_hash)
+                if measured:
+                    hash_seconds += perf_counter() - start
+                    hashed_transactions += len(unpacker.transaction_spans)
+                    hashed_bytes += sum(end - start for start, end in unpacker.transaction_spans)
+
+            if record_filter is not None:
+                if measured:
+                    start = perf_counter()
+                unpacked = record_filter.filter_unpacked(unpacked, record, unpacker.transaction_spans)
+                if measured:
+                    unpack_seconds += perf_counter() - start
+                if unpacked is None:
+                    continue
+            yield unpacked
+    finally:
+        if measured:
+            stats.record(file_type, 'unpack', unpack_seconds, unpacked_records, unpacked_bytes)
+            if network_hash is not None:
+                stats.record(file_type, 'hash', hash_seconds, hashed_transactions, hashed_bytes)
+
+
+def get_file_type(file_name: str) -> str:
+    r"""
+    Get the file type from the file name.
+
+    'path/to/ledger-00abc53f.xdr' > 'ledger'
+    or 'path\to\ledger-00abc53f.xdr' > 'ledger' on a Windows os
+    """
     file_type = file_name.split('-')[-2]
     file_type = file_type.split('\\')[-1]
     file_type = file_type.split('/')[-1]
+    return file_type
 
-    # Init the unpacker and get the relevant method for unpacking
-    unpacker, unpacker_methods = init_unpacker(data)
-    unpack_struct = unpacker_methods.get(file_type)
 
-    parsed_structs = []
+def open_xdr_file(file_name: str, pipelined: bool = False) -> BinaryIO:
+    """
+    Open an xdr file for reading, decompressing it on the fly if it is gzipped.
 
+    A 'pipelined' gzipped file is decompressed ahead by a background thread, while the caller reads it,
+    but it cannot be seeked.
+    """
+    # xdr files are always gzipped in the archive, unzip it if the user didn't do it yet
+    if file_name.endswith('.gz'):
+        return open_pipelined(file_name) if pipelined else gzip.open(file_name)
+    return open(file_name, 'rb')
+
+
+def map_xdr_file(file_name: str) -> Optional[memoryview]:
+    """
+    Map an uncompressed xdr file to memory, and return a view of its contents.
+
+    Return None for a gzipped file, or an empty file that cannot be mapped.
+    The mapped pages are read lazily, and are shared with other processes through the page cache.
+    The file is unmapped once the view and all the slices of it are released.
+    """
+    if file_name.endswith('.gz'):
+        return None
+    with open(file_name, 'rb') as xdr_file:
+        if os.fstat(xdr_file.fileno()).st_size == 0:
+            return None
+        # The map keeps its own handle to the file, so the file can be closed
+        return memoryview(mmap.mmap(xdr_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def get_record_length(mark: int, position: int, strict: bool = False) -> int:
+    """
+    Return the length of the structure that follows a record mark at 'position' of a file.
+
+    If 'strict' is True, raise a ValueError if the mark is not of a last fragment,
+    or the length is not a multiple of 4, as all xdr types are padded to 4 bytes.
+    """
+    length = mark & RECORD_LENGTH_MASK
+    if strict:
+        if not mark & LAST_FRAGMENT:
+            raise ValueError('Record mark at byte {} is not of a last fragment'.format(position))
+        if length % 4:
+            raise ValueError('Record length {} at byte {} is not a multiple of 4'.format(length, position))
+    return length
+
+
+def iter_mapped_records(view: memoryview, strict: bool = False) -> Iterator[memoryview]:
+    """Yield a slice of every structure in a view of an xdr file, without copying them, see iter_records."""
+    size = len(view)
+    position = 0
+    while position < size:
+        if size - position < 4:
+            raise EOFError('Truncated record mark at byte {}'.format(position))
+
+        length = get_record_length(struct.unpack_from('>I', view, position)[0], position, strict)
+        position += 4
+        if position + length > size:
+            raise EOFError('Truncated record at byte {}, expected {} bytes but got {}'
+                           .format(position, length, size - position))
+        yield view[position:position + length]
+        position += length
+
+
+def iter_records(xdr_file: BinaryIO, strict: bool = False) -> Iterator[bytes]:
+    """
+    Yield the raw bytes of every structure in an xdr stream.
+
+    Each structure in the XDR files is prefixed with a 4 byte record mark,
+    the high bit marks the last fragment and the rest is the length of the structure.
+    Only a single record is read into memory at a time.
+    If 'strict' is True, the record marks are checked as well, see get_record_length.
+    """
+    position = 0
+    while True:
+        record_mark = xdr_file.read(4)
+        if not record_mark:
+            return
+        if len(record_mark) < 4:
+            raise EOFError('Truncated record mark at byte {}'.format(position))
+
+        length = get_record_length(struct.unpack('>I', record_mark)[0], position, strict)
+        position += 4
+        record = xdr_file.read(length)
+        if len(record) < length:
+            raise EOFError('Truncated record at byte {}, expected {} bytes but got {}'
+                           .format(position, length, len(record)))
+        yield record
+        position += length
+
+
+def iter_raw_records(file_name: str, strict: bool = False) -> Iterator[Union[bytes, memoryview]]:
+    """
+    Yield the raw bytes of every structure in an xdr file, see iter_records.
+
+    An uncompressed file is mapped to memory instead of being read, and its structures are memoryview slices of it.
+    A gzipped file is decompressed in a background thread, while its structures are processed.
+    """
+    view = map_xdr_file(file_name)
+    if view is not None:
+        yield from iter_mapped_records(view, strict)
+        return
+    with open_xdr_file(file_name, pipelined=True) as xdr_file:
+        yield from iter_records(xdr_file, strict)
+
+
+def iter_file_records(file_name: str) -> Iterator[Union[bytes, memoryview]]:
+    """Yield the raw bytes of every structure in an xdr file like iter_raw_records, validating their amount."""
+    count = 0
+    for record in iter_raw_records(file_name):
+        yield record
+        count += 1
+    check_record_count(file_name, get_file_type(file_name), count)
+
+
+def check_record_count(file_name: str, file_type: str, count: int):
+    """Raise a RecordCountError if a file does not have the amount of structures it should have."""
     # Ledger files should always have 64 structures in them, apart from the very first one where its 63.
     expected_ledgers = 63 if '0000003f' in file_name else 64
-    current_ledger = 0
-    while True:
-        # Each structure in the XDR files is prefixed with the length of the structure,
-        # there is no use for it for parsing the file
-        try:
-            _ = unpacker.unpack_uint32()
-        except EOFError:
-            if file_type == 'ledger' and current_ledger != expected_ledgers:
-                print("ERROR: Found only {} ledgers in {}, expected {}".format(current_ledger,
-                                                                               file_name, expected_ledgers))
-                quit(1)
-            else:
-                break
+    if file_type == 'ledger' and count != expected_ledgers:
+        raise RecordCountError(file_name, count, expected_ledgers)
 
-        parsed_structs.append(unpack_struct())
-        current_ledger += 1
 
-    return parsed_structs
+def iter_unpack(file_name: str, network_hash: bytes = None, selection: dict = None,
+                record_filter: RecordFilter = None, stats: ParseStats = None) -> Iterator:
+    """Unpack an xdr file, yielding one structure at a time, see iter_unpack_records for the options."""
+    file_type = get_file_type(file_name)
+    records = iter_file_records(file_name)
+    if stats is not None:
+        records = stats.iter_timed(records, file_type, 'read')
+    return iter_unpack_records(records, file_type, network_hash, selection, record_filter, stats)
 
 
-def parse(file_name: str, raw_amount: bool = False, with_hash: bool = False, network_id: str = None) -> dict:
+def unpack_file(file_name: str, stats: ParseStats = None) -> List:
+    """Unpack an xdr file."""
+    return list(iter_unpack(file_name, stats=stats))
+
+
+def iter_parse(file_name: str, raw_amount: bool = False, with_hash: bool = False,
+               network_id: str = None, workers: int = 1, fields: List[str] = None,
+               record_filter: RecordFilter = None, amount_format: str = None,
+               stats: ParseStats = None) -> Iterator[dict]:
+    """
+    Unpack and parse a file, yielding one parsed structure at a time.
+
+    Memory usage is bounded by the largest structure in the file rather than by the file size.
+    If 'workers' is bigger than 1, the structures are decoded in parallel by a pool of processes,
+    and are yielded in their original order.
+    If 'fields' is given, only the matching fields are parsed, see compile_fields.
+    If 'record_filter' is given, only the matching records and transactions are parsed, see RecordFilter.
+    'amount_format' is one of AMOUNT_FORMATS, 'raw_amount' is the same as the 'raw' format.
+    If 'stats' is given, the time of every parsing stage is measured, see ParseStats.
+    """
+    network_hash = get_network_hash(network_id) if with_hash else None
+    selection = compile_fields(fields) if fields else None
+    amount_format = get_amount_format(raw_amount, amount_format)
+
+    if workers > 1:
+        yield from _iter_parse_parallel(file_name, amount_format, network_hash, workers, selection, record_filter,
+                                        stats)
+        return
+
+    unpacked_structs = iter_unpack(file_name, network_hash, selection, record_filter, stats)
+    yield from _iter_convert(unpacked_structs, get_file_type(file_name), 0, selection, amount_format, stats)
+
+
+def _iter_convert(unpacked_structs: Iterable, file_type: str, first_index: int, selection: dict,
+                  amount_format: str, stats: ParseStats = None) -> Iterator[dict]:
+    """Parse unpacked structures, measuring the convert stage if 'stats' is given."""
+    measured = stats is not None
+    seconds = 0.0
+    records = 0
+    try:
+        for index, unpacked in enumerate(unpacked_structs, first_index):
+            if measured:
+                start = perf_counter()
+            parsed = parse_unpacked(unpacked, index, selection=selection, amount_format=amount_format)
+            if measured:
+                seconds += perf_counter() - start
+                records += 1
+            yield parsed
+    finally:
+        if measured:
+            stats.record(file_type, 'convert', seconds, records)
+
+
+def parse(file_name: str, raw_amount: bool = False, with_hash: bool = False, network_id: str = None,
+          workers: int = 1, fields: List[str] = None, record_filter: RecordFilter = None,
+          amount_format: str = None, stats: ParseStats = None) -> list:
     """Unpack and parse a file."""
-    unpacked = unpack_file(file_name)
+    return list(iter_parse(file_name, raw_amount=raw_amount, with_hash=with_hash, network_id=network_id,
+                           workers=workers, fields=fields, record_filter=record_filter, amount_format=amount_format,
+                           stats=stats))
+
+
+def _iter_parse_parallel(file_name: str, amount_format: str, network_hash: bytes, workers: int,
+                         selection: dict, record_filter: RecordFilter, stats: ParseStats = None) -> Iterator[dict]:
+    """Split the structures of a file to chunks and parse them in a process pool."""
+    file_type = get_file_type(file_name)
+    records = iter_file_records(file_name)
+    if stats is not None:
+        records = stats.iter_timed(records, file_type, 'read')
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        calls = ((file_type, chunk, index, amount_format, network_hash, selection, record_filter)
+                 for chunk, index in _iter_record_chunks(records, PARALLEL_CHUNK_SIZE))
+
+        # Bound the amount of chunks in flight, so memory does not grow with the file size
+        if stats is None:
+            for future in submit_bounded(executor, parse_records_chunk, calls, workers * 2):
+                yield from future.result()
+            return
+
+        # The workers measure their chunks, and send back the measurements with the parsed structures
+        for future in submit_bounded(executor, _parse_records_chunk_measured, calls, workers * 2):
+            parsed, chunk_stats = future.result()
+            stats.merge(chunk_stats)
+            yield from parsed
+
+
+def _iter_record_chunks(records: Iterator[bytes], chunk_size: int) -> Iterator[Tuple[List[bytes], int]]:
+    """Group records to chunks of at least 'chunk_size' bytes, yield every chunk with the index of its first record."""
+    chunk = []
+    chunk_bytes = 0
+    index = 0
+    for record in records:
+        # Views of a mapped file cannot be sent to the workers
+        chunk.append(record if type(record) is bytes else bytes(record))
+        chunk_bytes += len(record)
+        if chunk_bytes >= chunk_size:
+            yield chunk, index
+            index += len(chunk)
+            chunk = []
+            chunk_bytes = 0
+
+    if chunk:
+        yield chunk, index
+
+
+def parse_records_chunk(file_type: str, records: List[bytes], first_index: int, amount_format: str,
+                        network_hash: bytes, selection: dict, record_filter: RecordFilter,
+                        stats: ParseStats = None) -> List[dict]:
+    """Unpack and parse a chunk of records, runs in a worker process."""
+    unpacked = iter_unpack_records(records, file_type, network_hash, selection, record_filter, stats)
+    return list(_iter_convert(unpacked, file_type, first_index, selection, amount_format, stats))
+
+
+def _parse_records_chunk_measured(file_type: str, records: List[bytes], first_index: int, amount_format: str,
+                                  network_hash: bytes, selection: dict,
+                                  record_filter: RecordFilter) -> Tuple[List[dict], ParseStats]:
+    """Parse a chunk of records like parse_records_chunk, and return the measurements of its stages with it."""
+    stats = ParseStats()
+    return parse_records_chunk(file_type, records, first_index, amount_format, network_hash, selection,
+                               record_filter, stats), stats
+
+
+def get_network_hash(network_id: str) -> bytes:
+    """Return the sha256 hash of a network id, used when calculating transaction hashes."""
+    return sha256(bytearray(network_id, 'utf-8')).digest()
+
+
+def parse_unpacked(unpacked: Any, index: int, raw_amount: bool = False, selection: dict = None,
+                   amount_format: str = None) -> dict:
+    """
+    Parse a single unpacked structure.
 
-    # If 'with_hash' is set to true, go over every transaction and calculate its hash
-    if with_hash:
-        network_hash = sha256(bytearray(network_id, 'utf-8')).digest()
-        for tx_history_entry in unpacked:
-            for transaction in tx_history_entry.txSet.txs:
-                transaction.hash = calculate_hash(transaction.tx, network_hash)
+    'index' is the position of the structure in its file,
+    if a selection from compile_fields is given only the selected fields are parsed.
+    """
+    if selection is not None:
+        return get_converter(raw_amount, amount_format).convert_selected(unpacked, selection, '', LIST_ITEM)
 
     # Create a json-compatible dictionary
-    unpacked = todict(unpacked, raw_amount=raw_amount)
+    return todict(unpacked, raw_amount=raw_amount, current_path='.' + str(index), amount_format=amount_format)
+
 
-    return unpacked
+def compile_fields(fields: List[str]) -> dict:
+    """
+    Compile field patterns to a selection tree.
 
+    Every pattern is a path of keys in a parsed structure, separated by dots,
+    where 'key[]' selects every item in a list, and '*' matches any key.
+    For example 'txSet.txs[].tx.operations[].body.paymentOp.amount'.
+    A selected key includes everything under it.
 
-def todict(obj: Any, raw_amount: bool, current_path: str = ''):
+    In the selection tree, every key maps to the selection of its value, or to None if the value is fully selected.
+    Raise a ValueError for a pattern with an empty key, such as '' or 'txSet..txs'.
+    """
+    selection = {}
+    for field in fields:
+        keys = []
+        for key in field.split('.'):
+            list_items = 0
+            while key.endswith(LIST_ITEM):
+                key = key[:-len(LIST_ITEM)]
+                list_items += 1
+            if not key:
+                raise ValueError("Field pattern '{}' has an empty key".format(field))
+            keys.append(key)
+            keys.extend([LIST_ITEM] * list_items)
+
+        # Walk down the tree, a key that is already fully selected includes the new path
+        node = selection
+        for key in keys[:-1]:
+            if key in node and node[key] is None:
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[keys[-1]] = None
+
+    return selection
+
+
+def is_selected(selection: Optional[dict], path: Iterable[str]) -> bool:
+    """Check if anything under a path is selected, None selects everything."""
+    node = selection
+    for key in path:
+        if node is None:
+            return True
+        if key == LIST_ITEM:
+            # A list can be selected with or without marking its items, like in Converter.convert_selected
+            node = node.get(LIST_ITEM, node)
+            continue
+        node = node.get(key, node.get('*', NOT_SELECTED))
+        if node is NOT_SELECTED:
+            return False
+
+    return True
+
+
+def hash_transactions(unpacked: Any, record: bytes, transaction_spans: List[Tuple[int, int]], network_hash: bytes):
+    """
+    Calculate the hash of every transaction in an unpacked TransactionHistoryEntry.
+
+    The hashes are calculated directly over the bytes the transactions were unpacked from,
+    which are identical to packing the transactions again, see calculate_hash.
+    """
+    hash_envelopes(unpacked.txSet.txs, record, transaction_spans, network_hash)
+
+
+def hash_envelopes(envelopes: Iterable[Any], record: bytes, transaction_spans: Iterable[Tuple[int, int]],
+                   network_hash: bytes):
+    """Calculate the hash of every transaction envelope, from the (start, end) span of its transaction in a record."""
+    prefix_hash = sha256(network_hash + PACKED_ENVELOP_TYPE)
+    record_view = memoryview(record)
+    for transaction, (start, end) in zip(envelopes, transaction_spans):
+        transaction_hash = prefix_hash.copy()
+        transaction_hash.update(record_view[start:end])
+        transaction.hash = transaction_hash.digest()
+
+
+def todict(obj: Any, raw_amount: bool, current_path: str = '', amount_format: str = None):
     """
     Recursively walk over an object and convert it to a dictionary.
 
     In addition, to make it json-compatible, parse every final value.
     """
-    if hasattr(obj, '__dict__'):
-        data = dict([(key, todict(value, raw_amount, current_path + '.' + key))
-                     for key, value in obj.__dict__.items()])
-        return data
-    elif hasattr(obj, '__iter__') and not isinstance(obj, (str, bytes, bytearray)):
-        return [todict(value, raw_amount, current_path + '.' + str(key)) for key, value in enumerate(obj)]
-    else:
-        return parse_value(obj, current_path, raw_amount)
+    split_path = current_path.split('.')
+    key = normalize_key(split_path[-1])
+    parent_key = normalize_key(split_path[-2]) if len(split_path) > 1 else ''
+    return get_converter(raw_amount, amount_format).convert(obj, parent_key, key)
+
+
+def normalize_key(key: str) -> str:
+    """Return the key of a value in a path, replacing list indexes with LIST_ITEM."""
+    return LIST_ITEM if key.isdigit() else key
+
+
+def get_converter(raw_amount: bool = False, amount_format: str = None) -> 'Converter':
+    """Return the shared converter for the given options."""
+    amount_format = get_amount_format(raw_amount, amount_format)
+    converter = _converters.get(amount_format)
+    if converter is None:
+        converter = _converters[amount_format] = Converter(amount_format=amount_format)
+    return converter
+
+
+class Converter:
+    """
+    Convert unpacked xdr structures to json-compatible dictionaries.
 
+    How a final value is parsed only depends on its key and the key of its parent,
+    so instead of building the path of every value, the parser of every (parent key, key)
+    pair is chosen once and cached.
+    """
 
-def parse_value(value: Any, path: str, raw_amount: bool = False):
+    def __init__(self, raw_amount: bool = False, amount_format: str = None):
+        self.amount_format = get_amount_format(raw_amount, amount_format)
+        self._int_parsers = {}
+        self._bytes_parsers = {}
+
+    def convert(self, obj: Any, parent_key: str = '', key: str = ''):
+        """Recursively convert an object, 'key' is the key of the object and 'parent_key' is the key of its parent."""
+        value_type = type(obj)
+        if value_type is int:
+            try:
+                int_parser = self._int_parsers[parent_key, key]
+            except KeyError:
+                int_parser = get_int_parser(parent_key, key, amount_format=self.amount_format)
+                self._int_parsers[parent_key, key] = int_parser
+            return obj if int_parser is None else int_parser(obj)
+        elif value_type is bytes:
+            try:
+                bytes_parser = self._bytes_parsers[parent_key, key]
+            except KeyError:
+                bytes_parser = self._bytes_parsers[parent_key, key] = get_bytes_parser(parent_key, key)
+            return bytes_parser(obj)
+        elif value_type is list:
+            return [self.convert(value, key, LIST_ITEM) for value in obj]
+        elif hasattr(obj, '__dict__'):
+            return {field: self.convert(value, key, field) for field, value in obj.__dict__.items()}
+        elif hasattr(obj, '_fields'):
+            # A compact record, see records.compact
+            return {field: self.convert(value, key, field) for field, value in zip(obj._fields, obj)}
+        elif hasattr(obj, '__iter__') and not isinstance(obj, (str, bytes, bytearray)):
+            return [self.convert(value, key, LIST_ITEM) for value in obj]
+        return parse_leaf(obj, parent_key, key, amount_format=self.amount_format)
+
+    def convert_selected(self, obj: Any, selection: Optional[dict], parent_key: str = '', key: str = ''):
+        """
+        Recursively convert only the parts of an object that are selected, see compile_fields.
+
+        Fields that have nothing selected under them are left out,
+        list items are always kept so their positions are not lost,
+        unless they are final values, then nothing is selected in the whole list.
+        """
+        if selection is None:
+            return self.convert(obj, parent_key, key)
+
+        if type(obj) is list:
+            # A list can be selected with or without marking its items
+            item_selection = selection.get(LIST_ITEM, selection)
+            items = [self.convert_selected(value, item_selection, key, LIST_ITEM) for value in obj]
+            if any(item is NOT_SELECTED for item in items):
+                return NOT_SELECTED
+            return items
+        elif hasattr(obj, '__dict__'):
+            data = {}
+            for field, value in obj.__dict__.items():
+                field_selection = selection.get(field, selection.get('*', NOT_SELECTED))
+                if field_selection is NOT_SELECTED:
+                    continue
+                converted = self.convert_selected(value, field_selection, key, field)
+                if converted is not NOT_SELECTED and converted != {}:
+                    data[field] = converted
+            return data
+
+        # A final value can not contain the keys that are selected under it
+        return NOT_SELECTED
+
+
+def parse_value(value: Any, path: str, raw_amount: bool = False, amount_format: str = None):
     """Parse a value to make it human-readable and json-compatible."""
     split_path = path.split('.')
-    final_key = split_path[-1]
-    second_to_last_key = split_path[-2]
-    if isinstance(value, int):
-        # Check if the value from this attribute should be parsed.
-        if final_key == 'amount' or final_key == 'startingBalance':
-            if not raw_amount:
-                return parse_amount(value)
-            return value
-        if final_key == 'code':
-            return parse_result_code(second_to_last_key, value)
+    return parse_leaf(value, normalize_key(split_path[-2]), normalize_key(split_path[-1]), raw_amount, amount_format)
 
+
+def parse_leaf(value: Any, parent_key: str, key: str, raw_amount: bool = False, amount_format: str = None):
+    """Parse a final value by its key and the key of its parent."""
+    if isinstance(value, int):
+        int_parser = get_int_parser(parent_key, key, raw_amount, amount_format)
+        return value if int_parser is None else int_parser(value)
     elif isinstance(value, (bytes, bytearray)):
-        if final_key == 'ed25519':
-            return parse_account(value)
-        elif final_key == 'assetCode':
-            return parse_asset_code(value)
-        # skipList is a list of hashes in a Ledger file.
-        elif 'hash' in str(final_key).lower() or second_to_last_key == 'skipList':
-            return parse_hash(value)
-        elif final_key == 'signature':
-            return parse_signature(value)
-        elif final_key == 'hint':
-            return parse_hint(value)
-        elif final_key == 'text':
-            return parse_text(value)
-        # If there is no specific way to parse this attribute, create a list from the bytes object.
-        return list(value)
+        return get_bytes_parser(parent_key, key)(value)
 
     # If the value is fine as it is, return it without any changes.
     return value
 
 
+def get_int_parser(parent_key: str, key: str, raw_amount: bool = False,
+                   amount_format: str = None) -> Optional[Callable]:
+    """Return the method that parses an int value, or None if the value should not be changed."""
+    # Check if the value from this attribute should be parsed.
+    if key == 'amount' or key == 'startingBalance':
+        return AMOUNT_PARSERS[get_amount_format(raw_amount, amount_format)]
+    if key == 'code':
+        return get_result_code_enum(parent_key).get
+    return None
+
+
+def get_bytes_parser(parent_key: str, key: str) -> Callable:
+    """Return the method that parses a bytes value."""
+    if key == 'ed25519':
+        return parse_account
+    elif key == 'assetCode':
+        return parse_asset_code
+    # skipList is a list of hashes in a Ledger file.
+    elif 'hash' in key.lower() or parent_key == 'skipList':
+        return parse_hash
+    elif key == 'signature':
+        return parse_signature
+    elif key == 'hint':
+        return parse_hint
+    elif key == 'text':
+        return parse_text
+    # If there is no specific way to parse this attribute, create a list from the bytes object.
+    return list
+
+
 def parse_account(value: bytes) -> str:
     """Return the address from the address bytes."""
-    return utils.encode_check('account', value).decode()
+    # The cache needs hashable keys
+    if type(value) is not bytes:
+        value = bytes(value)
+    return _account_cache(value).decode()
+
+
+def encode_account(value: bytes) -> bytes:
+    """Encode the address bytes with a checksum, this is the expensive part of parse_account that is cached."""
+    return utils.encode_check('account', value)
 
 
 def parse_text(value: bytes) -> str:
@@ -203,34 +759,89 @@ def parse_hint(value: bytes) -> str:
     The hint contains the last 4 bytes of the public key, so we can construct a partial address from it.
     More info: https://github.com/stellar/laboratory/blob/master/src/utilities/extrapolateFromXdr.js#L101
     """
+    # The cache needs hashable keys
+    if type(value) is not bytes:
+        value = bytes(value)
+    return 'G' + '_' * 46 + _hint_cache(value) + '_' * 4
+
+
+def encode_hint(value: bytes) -> str:
+    """Return the part of the address that is known from a hint, this is the part of parse_hint that is cached."""
     partial_address = utils.encode_check('account', bytes(28) + value)
-    partial_address = 'G' + '_' * 46 + partial_address[46:51].decode() + '_' * 4
-    return partial_address
+    return partial_address[46:51].decode()
+
+
+def configure_cache(maxsize: Optional[int] = DEFAULT_CACHE_SIZE):
+    """
+    Set the size of the account and hint caches, clearing them.
+
+    The caches are shared by everything parsed in the process, a 'maxsize' of 0 disables them and None
+    makes them unbounded.
+    Only the encoded bytes are cached, every parsed value is still a new string.
+    """
+    global _account_cache, _hint_cache
+    _account_cache = lru_cache(maxsize=maxsize)(encode_account)
+    _hint_cache = lru_cache(maxsize=maxsize)(encode_hint)
+
+
+def get_cache_stats() -> dict:
+    """Return the hits, misses, maximum size and current size of the account and hint caches."""
+    return {name: cache.cache_info()._asdict()
+            for name, cache in (('account', _account_cache), ('hint', _hint_cache))}
+
+
+def get_amount_format(raw_amount: bool = False, amount_format: str = None) -> str:
+    """Return the amount format of the parsing options, the default is 'decimal'."""
+    if raw_amount:
+        return 'raw'
+    if amount_format is None:
+        return 'decimal'
+    if amount_format not in AMOUNT_FORMATS:
+        raise ValueError('Unknown amount format: {}'.format(amount_format))
+    return amount_format
 
 
 def parse_amount(value: int) -> Decimal:
-    """Return a scaled down amount."""
-    return Decimal(value) / Decimal(AMOUNT_SCALE_FACTOR)
+    """Return a scaled down amount, rounded to 5 significant digits."""
+    return _divide_amount(Decimal(value), AMOUNT_SCALE_FACTOR)
+
+
+def format_amount(value: int) -> str:
+    """Return the exact scaled down amount as a fixed point string, such as '-12.34500'."""
+    if value < 0:
+        return '-' + format_amount(-value)
+    units, fraction = divmod(value, AMOUNT_SCALE)
+    return '%d.%0*d' % (units, AMOUNT_DIGITS, fraction)
+
+
+# The bound method is faster than looking it up for every amount
+_divide_amount = AMOUNT_CONTEXT.divide
+
+
+# The method that parses an amount in every amount format, None keeps the raw int
+AMOUNT_PARSERS = {'decimal': parse_amount, 'raw': None, 'string': format_amount}
 
 
 def parse_result_code(second_to_last_key, value):
     """Parse a result code"""
+    return get_result_code_enum(normalize_key(second_to_last_key)).get(value)
+
+
+def get_result_code_enum(parent_key: str) -> dict:
+    """Return the enum of a result code by the key of its parent."""
     # If its a transaction result
-    if second_to_last_key == 'result':
-        return StellarXDR_const.TransactionResultCode.get(value)
+    if parent_key == 'result':
+        return StellarXDR_const.TransactionResultCode
 
     # If its an operation result code
-    try:
-        # Check if the string is numeric
-        int(second_to_last_key)
-        return StellarXDR_const.OperationResultCode.get(value)
-    except ValueError:
-        # Its an specific operation type result code
-        # second to last key will be the type (for example 'paymentResult')
-        # so we need to get 'PaymentResultCode' from stellar_xdr_const
-        enum_name = second_to_last_key[0].capitalize() + second_to_last_key[1:] + 'Code'
-        status_code_dict = getattr(StellarXDR_const, enum_name)
-        return status_code_dict.get(value)
+    if parent_key == LIST_ITEM:
+        return StellarXDR_const.OperationResultCode
+
+    # Its an specific operation type result code
+    # the parent key will be the type (for example 'paymentResult')
+    # so we need to get 'PaymentResultCode' from stellar_xdr_const
+    enum_name = parent_key[0].capitalize() + parent_key[1:] + 'Code'
+    return getattr(StellarXDR_const, enum_name)
 
 
 def calculate_hash(transaction: Transaction, network_hash: bytes) -> bytes:
@@ -250,3 +861,6 @@ def calculate_hash(transaction: Transaction, network_hash: bytes) -> bytes:
     final_hash = sha256(network_hash + PACKED_ENVELOP_TYPE + packed_tx).digest()
 
     return final_hash
+
+
+configure_cache()
@@ -0,0 +1,27 @@
+"""Helpers to run work in a pool of processes."""
+
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Callable, Iterable, Iterator
+
+
+def submit_bounded(executor: Executor, func: Callable, calls: Iterable[tuple], max_in_flight: int) -> Iterator[Future]:
+    """
+    Submit a call of 'func' for every argument tuple in 'calls', and yield the futures in submission order.
+
+    At most 'max_in_flight' calls are pending at any time,
+    so the arguments and results do not pile up in memory.
+    """
+    pending = deque()
+    for args in calls:
+        pending.append(executor.submit(func, *args))
+        if len(pending) >= max_in_flight:
+            future = pending.popleft()
+            # Wait for the call before submitting the next one
+            future.exception()
+            yield future
+
+    while pending:
+        future = pending.popleft()
+        future.exception()
+        yield future
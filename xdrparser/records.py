@@ -0,0 +1,80 @@
+"""
+Contains compact records of unpacked structures, an alternative to the nested dictionaries of todict.
+
+Every xdr structure becomes a namedtuple of its type, bytes stay bytes and amounts stay ints,
+so a whole checkpoint can be held in memory at a fraction of the size of its parsed dictionaries.
+Records are only parsed to json-compatible values when they are converted with to_dict.
+"""
+from collections import namedtuple
+from functools import lru_cache
+from typing import Any, Iterator, List, Tuple
+
+from kin_base.stellarxdr.StellarXDR_pack import nullclass
+
+from xdrparser.filters import RecordFilter
+from xdrparser.parser import LIST_ITEM, get_converter, get_network_hash, iter_unpack
+from xdrparser.stats import ParseStats
+
+# Values that are kept as they are, checked before converting a value to save a call for most of them
+FINAL_TYPES = {int, bytes, bool}
+
+
+@lru_cache(maxsize=None)
+def get_record_type(type_name: str, fields: Tuple[str, ...]) -> type:
+    """
+    Return the record type of an xdr type with a set of fields.
+
+    A union has a record type for every arm, since every arm has different fields.
+    """
+    base = namedtuple(type_name, fields)
+    return type(type_name, (base,), {'__slots__': (), '__reduce__': _reduce_record})
+
+
+def make_record(type_name: str, fields: Tuple[str, ...], values: tuple) -> tuple:
+    """Create a record of a type, used to unpickle records since their types are created on the fly."""
+    return get_record_type(type_name, fields)._make(values)
+
+
+def _reduce_record(record):
+    return make_record, (type(record).__name__, record._fields, tuple(record))
+
+
+def compact(obj: Any, key: str = LIST_ITEM) -> Any:
+    """
+    Convert an unpacked structure to records, 'key' is the key of the structure in its parent.
+
+    Structures become records, lists become tuples, and final values are kept as they are.
+    """
+    value_type = type(obj)
+    if value_type is int or value_type is bytes:
+        return obj
+    elif value_type is list:
+        return tuple([value if type(value) in FINAL_TYPES else compact(value) for value in obj])
+    elif hasattr(obj, '__dict__'):
+        # Inline unions and structures do not have a type of their own, they are named by their key
+        type_name = key[:1].upper() + key[1:] if value_type is nullclass else value_type.__name__
+        fields = obj.__dict__
+        record_type = get_record_type(type_name, tuple(fields))
+        return tuple.__new__(record_type, [value if type(value) in FINAL_TYPES else compact(value, field)
+                                           for field, value in fields.items()])
+    return obj
+
+
+def to_dict(record: Any, raw_amount: bool = False, amount_format: str = None) -> dict:
+    """Convert a record to a json-compatible dictionary, the same as todict converts the unpacked structure."""
+    return get_converter(raw_amount, amount_format).convert(record, '', LIST_ITEM)
+
+
+def iter_compact(file_name: str, with_hash: bool = False, network_id: str = None,
+                 record_filter: RecordFilter = None, stats: ParseStats = None) -> Iterator[tuple]:
+    """Unpack a file, yielding a record of every structure in it, see iter_parse for the arguments."""
+    network_hash = get_network_hash(network_id) if with_hash else None
+    for unpacked in iter_unpack(file_name, network_hash, record_filter=record_filter, stats=stats):
+        yield compact(unpacked)
+
+
+def parse_compact(file_name: str, with_hash: bool = False, network_id: str = None,
+                  record_filter: RecordFilter = None, stats: ParseStats = None) -> List[tuple]:
+    """Unpack a file to a list of records."""
+    return list(iter_compact(file_name, with_hash=with_hash, network_id=network_id, record_filter=record_filter,
+                             stats=stats))
@@ -0,0 +1,107 @@
+"""Contains a collector of the time, bytes and records of every parsing stage, per file type."""
+from collections import namedtuple, OrderedDict
+from time import perf_counter
+from typing import Callable, Iterable, Iterator
+
+# The stages of parsing a file, in order
+# read: decompressing the file and splitting it to records
+# unpack: unpacking the records, including filtering them
+# hash: calculating the hashes of the transactions
+# convert: converting the unpacked structures to dictionaries
+# serialize: encoding the dictionaries, only measured by the command line tool
+STAGES = ('read', 'unpack', 'hash', 'convert', 'serialize')
+
+# Every measurement of a stage is reported to the hooks as an event
+StageEvent = namedtuple('StageEvent', ['file_type', 'stage', 'seconds', 'records', 'bytes'])
+
+
+class ParseStats:
+    """
+    Collect the time, bytes and records of every parsing stage, per file type.
+
+    Pass an instance as the 'stats' of parser.parse and the other parsing methods to collect them,
+    parsing without it is not instrumented at all.
+    Every measurement is also passed as a StageEvent to each of the 'hooks',
+    for example to update the counters of a metrics collector.
+    A stage is measured once for every file, or for every chunk of a file when parsing with workers.
+    """
+
+    def __init__(self, hooks: Iterable[Callable[[StageEvent], None]] = ()):
+        self.hooks = list(hooks)
+        self.totals = OrderedDict()
+
+    def record(self, file_type: str, stage: str, seconds: float, records: int = 0, size: int = 0):
+        """Add a measurement of a stage."""
+        totals = self.totals.get((file_type, stage))
+        if totals is None:
+            totals = self.totals[file_type, stage] = [0.0, 0, 0]
+        totals[0] += seconds
+        totals[1] += records
+        totals[2] += size
+
+        for hook in self.hooks:
+            hook(StageEvent(file_type, stage, seconds, records, size))
+
+    def merge(self, other: 'ParseStats'):
+        """Add the measurements of another instance, such as one that was collected in a worker process."""
+        for (file_type, stage), (seconds, records, size) in other.totals.items():
+            self.record(file_type, stage, seconds, records, size)
+
+    def iter_timed(self, items: Iterable[bytes], file_type: str, stage: str) -> Iterator[bytes]:
+        """Yield the items of an iterable, measuring the time it takes to produce them as a stage."""
+        seconds = 0.0
+        records = 0
+        size = 0
+        iterator = iter(items)
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    seconds += perf_counter() - start
+                    return
+                seconds += perf_counter() - start
+                records += 1
+                size += len(item)
+                yield item
+        finally:
+            self.record(file_type, stage, seconds, records, size)
+
+    def __getstate__(self):
+        # The hooks stay in the process that created them, workers only send back their measurements
+        return {'hooks': [], 'totals': self.totals}
+
+    def as_dict(self) -> dict:
+        """Return the totals of every stage by file type, with their throughput."""
+        stats = OrderedDict()
+        for (file_type, stage), (seconds, records, size) in sorted(self.totals.items(), key=_stage_order):
+            stats.setdefault(file_type, OrderedDict())[stage] = {
+                'seconds': seconds,
+                'records': records,
+                'bytes': size,
+                'records_per_second': records / seconds if seconds else None,
+                'mb_per_second': size / seconds / 10 ** 6 if seconds and size else None,
+            }
+        return stats
+
+    def format_summary(self) -> str:
+        """Return a human readable table of the totals of every stage."""
+        lines = ['{:<14}{:<11}{:>10}{:>12}{:>14}{:>10}'.format(
+            'file type', 'stage', 'seconds', 'records', 'records/s', 'MB/s')]
+        for file_type, stages in self.as_dict().items():
+            for stage, totals in stages.items():
+                lines.append('{:<14}{:<11}{:>10.3f}{:>12}{:>14}{:>10}'.format(
+                    file_type, stage, totals['seconds'], totals['records'],
+                    _format_rate(totals['records_per_second'], '{:.0f}'),
+                    _format_rate(totals['mb_per_second'], '{:.1f}')))
+        return '\n'.join(lines)
+
+
+def _format_rate(rate, rate_format):
+    return '-' if rate is None else rate_format.format(rate)
+
+
+def _stage_order(item):
+    (file_type, stage), _ = item
+    return file_type, STAGES.index(stage) if stage in STAGES else len(STAGES), stage
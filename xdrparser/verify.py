@@ -0,0 +1,192 @@
+"""
+Contains a fast integrity check of history files, that walks their records without unpacking them.
+
+The records of a file are only checked by their framing, their ledger sequences at known offsets,
+and for ledger files, the hash chain of the ledger headers.
+Structures are never unpacked or parsed, so a file is checked at close to the speed it is read.
+"""
+import struct
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+from xdrparser import archive, filters, parser
+from xdrparser.errors import CompressionError, FramingError, HashChainError, LedgerSequenceError, RecordCountError
+from xdrparser.pool import submit_bounded
+
+# A LedgerHeaderHistoryEntry is the hash of its header, the header and an empty ext,
+# and the header starts with the ledgerVersion and the previousLedgerHash
+LEDGER_HASH_SIZE = 32
+PREVIOUS_LEDGER_HASH_OFFSET = LEDGER_HASH_SIZE + 4
+EMPTY_EXT = b'\x00\x00\x00\x00'
+
+# A PublicKey is its key type and a 32 byte key
+PUBLIC_KEY_SIZE = 36
+
+# The summary of a verified file.
+# 'first_ledger' and 'last_ledger' are the ledger sequences of its first and last records, when they are known,
+# and for ledger files 'previous_hash' is the previousLedgerHash of the first ledger and 'last_hash' the hash of the
+# last ledger, so the hash chain can be followed from one file to the next.
+FileSummary = namedtuple('FileSummary', ['file_name', 'file_type', 'records', 'bytes', 'first_ledger',
+                                         'last_ledger', 'previous_hash', 'last_hash'])
+
+# The result of verifying a single file, 'summary' is None if the file failed with 'error'
+VerifyResult = namedtuple('VerifyResult', ['file_name', 'summary', 'error'])
+
+
+def get_ledger_range(file_name: str) -> Optional[Tuple[int, int]]:
+    """Return the first and last ledger sequences of the checkpoint of a history file, or None for a bucket file."""
+    checkpoint = archive.get_checkpoint(file_name)
+    if checkpoint is None:
+        return None
+    # There is no ledger 0, so the first checkpoint only has 63 ledgers
+    return max(1, checkpoint - 63), checkpoint
+
+
+def iter_framed_records(file_name: str) -> Iterator[Union[bytes, memoryview]]:
+    """
+    Yield the raw bytes of every structure in an xdr file, checking their record marks.
+
+    Every record mark should mark the last fragment, and the length of every structure should be a multiple of 4,
+    as all xdr types are padded to 4 bytes.
+    Raise a FramingError for invalid record marks, or a CompressionError for a corrupt gzipped file.
+    """
+    index = 0
+    try:
+        for record in parser.iter_raw_records(file_name, strict=True):
+            yield record
+            index += 1
+    except (ValueError, EOFError) as e:
+        # EOFError is also raised by a gzipped file that ends in the middle of its compressed stream
+        raise FramingError(file_name, index, str(e)) from e
+    except zlib.error as e:
+        # A corrupt gzip header, deflate stream or checksum, the inflater raises zlib.error for any of them
+        raise CompressionError(file_name, index, 'corrupt compressed data: {}'.format(e)) from e
+
+
+def get_scp_ledger_seq(record: bytes) -> int:
+    """Return the ledger sequence of an SCPHistoryEntry, which follows its variable length quorum sets."""
+    offset = 4
+    quorum_sets = struct.unpack_from('>I', record, offset)[0]
+    offset += 4
+    for _ in range(quorum_sets):
+        offset = skip_quorum_set(record, offset)
+    return struct.unpack_from('>I', record, offset)[0]
+
+
+def skip_quorum_set(record: bytes, offset: int) -> int:
+    """Return the offset after an SCPQuorumSet: its threshold, validators and nested quorum sets."""
+    validators = struct.unpack_from('>I', record, offset + 4)[0]
+    offset += 8 + validators * PUBLIC_KEY_SIZE
+    inner_sets = struct.unpack_from('>I', record, offset)[0]
+    offset += 4
+    for _ in range(inner_sets):
+        offset = skip_quorum_set(record, offset)
+    return offset
+
+
+def get_ledger_seq(record: bytes, file_type: str) -> Optional[int]:
+    """Return the ledger sequence of a record of any history file type, or None for a bucket entry."""
+    if file_type == 'scp':
+        return get_scp_ledger_seq(record)
+    return filters.get_ledger_seq(record, file_type)
+
+
+def verify_file(file_name: str) -> FileSummary:
+    """
+    Check the integrity of a single history file, and return its summary.
+
+    Every file is checked to be a sequence of framed records, see iter_framed_records.
+    The records of a history file should be of increasing ledgers in the checkpoint of the file,
+    and a ledger file should have a record of every ledger in its checkpoint, where every header matches its hash,
+    and points to the hash of the header before it.
+    Raise a VerificationError, or a RecordCountError for a ledger file without every ledger, if the file fails a check.
+    """
+    file_type = parser.get_file_type(file_name)
+    ledger_range = get_ledger_range(file_name)
+    records = 0
+    size = 0
+    first_ledger = last_ledger = None
+    first_previous_hash = last_hash = None
+    for index, record in enumerate(iter_framed_records(file_name)):
+        records += 1
+        size += len(record) + 4
+        if ledger_range is None:
+            continue
+
+        try:
+            ledger_seq = get_ledger_seq(record, file_type)
+        except struct.error:
+            raise FramingError(file_name, index, 'record is too short for a {} entry'.format(file_type)) from None
+
+        if not ledger_range[0] <= ledger_seq <= ledger_range[1]:
+            raise LedgerSequenceError(file_name, index, 'ledger {} is not in checkpoint {}-{}'
+                                      .format(ledger_seq, *ledger_range))
+        if last_ledger is not None and ledger_seq <= last_ledger:
+            raise LedgerSequenceError(file_name, index, 'ledger {} follows ledger {}'.format(ledger_seq, last_ledger))
+        if file_type == 'ledger' and ledger_seq != (ledger_range[0] if last_ledger is None else last_ledger + 1):
+            raise LedgerSequenceError(file_name, index, 'ledger {} is missing'
+                                      .format(ledger_range[0] if last_ledger is None else last_ledger + 1))
+
+        if file_type == 'ledger':
+            if record[-4:] != EMPTY_EXT:
+                raise FramingError(file_name, index, 'ledger {} has an unknown ext'.format(ledger_seq))
+            ledger_hash = bytes(record[:LEDGER_HASH_SIZE])
+            if sha256(record[LEDGER_HASH_SIZE:-4]).digest() != ledger_hash:
+                raise HashChainError(file_name, index, 'header of ledger {} does not match its hash'.format(ledger_seq))
+            previous_hash = bytes(record[PREVIOUS_LEDGER_HASH_OFFSET:PREVIOUS_LEDGER_HASH_OFFSET + LEDGER_HASH_SIZE])
+            if last_hash is None:
+                first_previous_hash = previous_hash
+            elif previous_hash != last_hash:
+                raise HashChainError(file_name, index, 'ledger {} does not point to the hash of ledger {}'
+                                     .format(ledger_seq, last_ledger))
+            last_hash = ledger_hash
+
+        if first_ledger is None:
+            first_ledger = ledger_seq
+        last_ledger = ledger_seq
+
+    if file_type == 'ledger' and ledger_range is not None and records != ledger_range[1] - ledger_range[0] + 1:
+        raise RecordCountError(file_name, records, ledger_range[1] - ledger_range[0] + 1)
+    return FileSummary(file_name, file_type, records, size, first_ledger, last_ledger, first_previous_hash, last_hash)
+
+
+def verify_files(file_names: Iterable[str], workers: int = 1) -> Iterator[VerifyResult]:
+    """
+    Check the integrity of many files with a pool of processes, yielding a VerifyResult for every file in ledger order.
+
+    Every file is checked by a single worker with verify_file, and the hash chain is then followed across
+    ledger files of consecutive checkpoints: the first ledger of a file should point to the last ledger of the
+    file before it, otherwise the later file fails with a HashChainError.
+    A file that fails a check does not stop the other files.
+    """
+    file_names = sorted(file_names, key=archive.get_ledger_order)
+    previous = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for future in submit_bounded(executor, _verify_file, ((file_name,) for file_name in file_names), workers * 2):
+            result = future.result()
+            summary = result.summary
+            if summary is None or summary.file_type != 'ledger' or summary.first_ledger is None:
+                yield result
+                continue
+
+            if previous is not None and previous.last_ledger + 1 == summary.first_ledger and \
+                    summary.previous_hash != previous.last_hash:
+                result = VerifyResult(result.file_name, None, HashChainError(
+                    summary.file_name, 0, 'ledger {} does not point to the hash of ledger {} in {}'
+                    .format(summary.first_ledger, previous.last_ledger, previous.file_name)))
+            # A file that breaks the chain is not followed, so only the break is reported
+            previous = summary if result.error is None else None
+            yield result
+
+
+def _verify_file(file_name: str) -> VerifyResult:
+    """Verify a single file, runs in a worker process."""
+    try:
+        if not archive.is_history_file(file_name):
+            raise ValueError('Invalid history archive file name')
+        return VerifyResult(file_name, verify_file(file_name), None)
+    except Exception as e:
+        return VerifyResult(file_name, None, e)